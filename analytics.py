@@ -0,0 +1,180 @@
+"""Cross-claim analytics over stored validation results.
+
+Results written by the workflow (``ingest.py`` outbox, ``reporte_final.json``)
+are flattened into one columnar line-item frame, and every aggregate is a
+vectorized pandas/NumPy operation over it, so thousands of claims summarize in
+milliseconds.
+"""
+
+import json
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+DECISIONS = ["APROBADO", "RECHAZADO", "JUSTIFICADO_POR_NOTA"]
+# Decisions whose amount is paid (before the deductible)
+PAID_DECISIONS = ["APROBADO", "JUSTIFICADO_POR_NOTA"]
+
+# Item type -> pattern over the lowercased item name; first match wins
+ITEM_TYPES = {
+    "Pintura": r"pintura|barniz",
+    "Mano de obra": r"mano de obra|hojalater|instalaci|desmontaje|montaje",
+    "Estructural": r"absorbedor|alma|refuerzo|chasis|larguero|estructur",
+    "Mantenimiento": r"aceite|filtro|afinaci|mantenimiento",
+}
+OTHER_ITEM_TYPE = "Otros"
+
+DECISION_STYLES = {
+    "APROBADO": "background-color: #10b981; color: white; font-weight: 600; border-radius: 6px; padding: 0.5rem;",
+    "RECHAZADO": "background-color: #ef4444; color: white; font-weight: 600; border-radius: 6px; padding: 0.5rem;",
+    "JUSTIFICADO": "background-color: #f59e0b; color: white; font-weight: 600; border-radius: 6px; padding: 0.5rem;",
+}
+
+
+def load_results(directory: str | Path) -> pd.DataFrame:
+    """Load every stored result in ``directory`` into a line-item frame."""
+    results = []
+    for path in sorted(Path(directory).glob("*.json")):
+        if path.name.endswith(".error.json"):
+            continue
+        result = json.loads(path.read_bytes())
+        result.setdefault("claim_id", path.stem)
+        results.append(result)
+    return build_items_frame(results)
+
+
+def build_items_frame(results: Iterable[dict[str, Any]]) -> pd.DataFrame:
+    """Flatten workflow results into one row per validated line item.
+
+    Columns are accumulated as plain lists in a single pass and converted
+    once, which is far cheaper than building a frame per claim and
+    concatenating.
+    """
+    columns: dict[str, list] = {
+        "claim_id": [],
+        "item": [],
+        "costo": [],
+        "decision": [],
+        "explicacion": [],
+        "deducible": [],
+        "total_aprobado": [],
+    }
+    for result in results:
+        reporte = result.get("validated_reporte") or {}
+        items = reporte.get("items") or []
+        rules = result.get("extracted_rules") or {}
+        n = len(items)
+        columns["claim_id"] += [result.get("claim_id")] * n
+        # Results validated since totals are computed locally carry the deductible applied
+        deducible = reporte.get("deducible", rules.get("deducible"))
+        columns["deducible"] += [deducible or 0.0] * n
+        columns["total_aprobado"] += [reporte.get("total_aprobado")] * n
+        for item in items:
+            columns["item"].append(item.get("item", ""))
+            columns["costo"].append(item.get("costo", 0.0))
+            columns["decision"].append(item.get("decision", ""))
+            columns["explicacion"].append(item.get("explicacion", ""))
+
+    frame = pd.DataFrame(
+        {
+            "claim_id": pd.Categorical(columns["claim_id"]),
+            "item": columns["item"],
+            "costo": np.asarray(columns["costo"], dtype="float64"),
+            "decision": pd.Categorical(
+                [d.upper() for d in columns["decision"]],
+                categories=DECISIONS,
+            ),
+            "explicacion": columns["explicacion"],
+            "deducible": np.asarray(columns["deducible"], dtype="float64"),
+            "total_aprobado": np.asarray(columns["total_aprobado"], dtype="float64"),
+        }
+    )
+    frame["item_type"] = classify_items(frame["item"])
+    frame["paid"] = frame["decision"].isin(PAID_DECISIONS).to_numpy()
+    # A rejection citing the policy cap ("Excede el tope de ...")
+    frame["cap_breach"] = (frame["decision"] == "RECHAZADO").to_numpy() & frame[
+        "explicacion"
+    ].str.contains("tope", case=False, regex=False).to_numpy()
+    return frame
+
+
+def classify_items(names: pd.Series) -> pd.Categorical:
+    """Map item names to an ``ITEM_TYPES`` category."""
+    # Item names repeat across claims: match each distinct name only once
+    codes, uniques = pd.factorize(names)
+    lowered = pd.Series(uniques).str.lower()
+    conditions = [
+        lowered.str.contains(pattern).to_numpy() for pattern in ITEM_TYPES.values()
+    ]
+    labels = np.select(conditions, list(ITEM_TYPES), default=OTHER_ITEM_TYPE)
+    return pd.Categorical(labels[codes], categories=[*ITEM_TYPES, OTHER_ITEM_TYPE])
+
+
+def claim_summary(items: pd.DataFrame) -> pd.DataFrame:
+    """Per-claim totals, with the deductible applied to the paid amount.
+
+    ``diferencia`` compares the recomputed total against the stored
+    ``total_aprobado``; non-zero values point at inconsistent results.
+    """
+    paid_amount = items["costo"].where(items["paid"], 0.0)
+    rejected_amount = items["costo"].where(items["decision"] == "RECHAZADO", 0.0)
+    grouped = items.assign(
+        monto_pagable=paid_amount, monto_rechazado=rejected_amount
+    ).groupby("claim_id", observed=True)
+    summary = grouped.agg(
+        items=("costo", "size"),
+        monto_total=("costo", "sum"),
+        monto_pagable=("monto_pagable", "sum"),
+        monto_rechazado=("monto_rechazado", "sum"),
+        topes_excedidos=("cap_breach", "sum"),
+        deducible=("deducible", "first"),
+        total_reportado=("total_aprobado", "first"),
+    )
+    summary["total_con_deducible"] = (
+        summary["monto_pagable"] * (1 - summary["deducible"])
+    ).round(2)
+    summary["diferencia"] = (
+        summary["total_reportado"] - summary["total_con_deducible"]
+    ).round(2)
+    return summary
+
+
+def item_type_summary(items: pd.DataFrame) -> pd.DataFrame:
+    """Approval rates, cap breaches and amounts per item type."""
+    grouped = items.assign(
+        monto_pagable=items["costo"].where(items["paid"], 0.0)
+    ).groupby("item_type", observed=True)
+    summary = grouped.agg(
+        items=("costo", "size"),
+        tasa_aprobacion=("paid", "mean"),
+        topes_excedidos=("cap_breach", "sum"),
+        monto_total=("costo", "sum"),
+        monto_pagable=("monto_pagable", "sum"),
+    )
+    return summary.sort_values("monto_total", ascending=False)
+
+
+def overview(items: pd.DataFrame, claims: pd.DataFrame) -> dict[str, float]:
+    """Headline figures across all claims."""
+    return {
+        "reclamos": len(claims),
+        "items": len(items),
+        "monto_total": float(claims["monto_total"].sum()),
+        "total_con_deducible": float(claims["total_con_deducible"].sum()),
+        "tasa_aprobacion": float(items["paid"].mean()) if len(items) else 0.0,
+        "topes_excedidos": int(items["cap_breach"].sum()),
+        "reclamos_inconsistentes": int((claims["diferencia"].abs() > 0.01).sum()),
+    }
+
+
+def decision_styles(decisions: pd.Series) -> np.ndarray:
+    """CSS per cell of a decision column, for ``Styler.apply``."""
+    upper = decisions.astype(str).str.upper()
+    conditions = [
+        upper.str.contains(keyword, regex=False).to_numpy()
+        for keyword in DECISION_STYLES
+    ]
+    return np.select(conditions, list(DECISION_STYLES.values()), default="")
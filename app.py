@@ -3,17 +3,22 @@ Frontend de Streamlit para Demo de Cumplimiento de Contratos
 """
 
 import asyncio
+import atexit
 import base64
 import json
 import logging
 from pathlib import Path
 from queue import Queue
+from typing import TYPE_CHECKING
 
-import pandas as pd
 import streamlit as st
 
 from models import File
-from workflow import Demo
+from utils.executor import shutdown_process_pool
+from utils.settings import get_settings
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 st.set_page_config(
     page_title="Cumplimiento de Contratos",
@@ -231,24 +236,46 @@ def display_pdf_viewer(file_path: str, display_name: str):
     st.markdown(get_pdf_download_link(file_path, display_name), unsafe_allow_html=True)
 
 
-def style_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+def style_dataframe(df: "pd.DataFrame") -> "pd.DataFrame":
     """Aplica estilos al DataFrame según el estado."""
+    from analytics import decision_styles
+
+    return df.style.apply(decision_styles, subset=["Estado"])
+
+
+@st.cache_resource(show_spinner=False)
+def register_pool_shutdown() -> None:
+    """Cierra el pool de procesos al salir del servidor (una vez por proceso).
+
+    Las sesiones comparten el pool, así que no se cierra al terminar cada run.
+    """
+    atexit.register(shutdown_process_pool)
+
+
+register_pool_shutdown()
 
-    def color_decision(val):
-        if "APROBADO" in val.upper():
-            return "background-color: #10b981; color: white; font-weight: 600; border-radius: 6px; padding: 0.5rem;"
-        elif "RECHAZADO" in val.upper():
-            return "background-color: #ef4444; color: white; font-weight: 600; border-radius: 6px; padding: 0.5rem;"
-        elif "JUSTIFICADO" in val.upper():
-            return "background-color: #f59e0b; color: white; font-weight: 600; border-radius: 6px; padding: 0.5rem;"
-        return ""
 
-    styled = df.style.map(color_decision, subset=["Estado"])
-    return styled
+@st.cache_data(show_spinner=False)
+def load_analytics(directory: str, signature: tuple) -> dict:
+    """Carga y agrega los resultados guardados (se recalcula si cambian)."""
+    import analytics
+
+    items = analytics.load_results(directory)
+    claims = analytics.claim_summary(items)
+    return {
+        "overview": analytics.overview(items, claims),
+        "claims": claims,
+        "item_types": analytics.item_type_summary(items),
+    }
 
 
-async def run_workflow(log_queue: Queue | None = None) -> dict:
-    """Ejecuta el workflow de validación de pólizas."""
+async def run_workflow(
+    log_queue: Queue | None = None, profile: bool = False
+) -> tuple[dict, dict | None]:
+    """Ejecuta el workflow de validación de pólizas.
+
+    Con ``profile`` devuelve también el resumen por paso y dónde se guardó el perfil.
+    """
     # Setup logging if queue provided
     handlers = []
     if log_queue:
@@ -268,6 +295,10 @@ async def run_workflow(log_queue: Queue | None = None) -> dict:
             logger.setLevel(logging.INFO)
             handlers.append((logger, handler))
 
+    # The workflow and its SDKs load on the first run, not on every page render
+    from utils.profiling import profiling
+    from workflow import Demo
+
     try:
         workflow = Demo()
 
@@ -283,8 +314,12 @@ async def run_workflow(log_queue: Queue | None = None) -> dict:
             is_poliza=False,
         )
 
-        result = await workflow.run(files=[poliza_file, reporte_file])
-        return result
+        if not profile:
+            return await workflow.run(files=[poliza_file, reporte_file]), None
+        async with profiling() as session:
+            result = await workflow.run(files=[poliza_file, reporte_file])
+        run = session.runs[0]
+        return result, {"directory": str(run.directory), "steps": run.summary()}
     finally:
         if log_queue:
             for logger, handler in handlers:
@@ -328,6 +363,13 @@ with st.sidebar:
     else:
         st.info(f"Documento de reporte: {reporte_path}")
 
+    st.markdown("---")
+    profile_enabled = st.checkbox(
+        "Perfilar ejecución",
+        help="Mide tiempo, CPU y esperas de cada paso y guarda flamegraphs "
+        f"en {get_settings().PROFILE_DIR}/",
+    )
+
     st.markdown("---")
     st.markdown(
         """
@@ -397,14 +439,17 @@ if st.button("EJECUTAR VALIDACIÓN", type="primary", width="stretch"):
             import threading
             import time
 
-            result_container = {"result": None, "error": None}
+            result_container = {"result": None, "profile": None, "error": None}
 
             def run_async_workflow():
                 try:
                     loop = asyncio.new_event_loop()
                     asyncio.set_event_loop(loop)
-                    result_container["result"] = loop.run_until_complete(
-                        run_workflow(log_queue=log_queue)
+                    (
+                        result_container["result"],
+                        result_container["profile"],
+                    ) = loop.run_until_complete(
+                        run_workflow(log_queue=log_queue, profile=profile_enabled)
                     )
                 except Exception as e:
                     result_container["error"] = e
@@ -503,6 +548,7 @@ if st.button("EJECUTAR VALIDACIÓN", type="primary", width="stretch"):
                 raise result_container["error"]
 
             st.session_state["result"] = result_container["result"]
+            st.session_state["profile"] = result_container["profile"]
             status.update(
                 label="✅ Validación completada", state="complete", expanded=False
             )
@@ -602,6 +648,20 @@ if "result" in st.session_state:
                 unsafe_allow_html=True,
             )
 
+        if "subtotal_aprobado" in validated_report:
+            st.caption(
+                f"Subtotal conforme ${validated_report['subtotal_aprobado']:,.2f} "
+                f"− deducible {validated_report['deducible'] * 100:.1f}% "
+                f"(${validated_report['monto_deducible']:,.2f})"
+            )
+
+        inconsistencies = validated_report.get("inconsistencias") or []
+        if inconsistencies:
+            st.warning(
+                "Inconsistencias detectadas:\n"
+                + "\n".join(f"- {issue}" for issue in inconsistencies)
+            )
+
         st.markdown("<br>", unsafe_allow_html=True)
 
         # ====================================================================
@@ -614,6 +674,8 @@ if "result" in st.session_state:
             st.markdown("### Items Validados")
 
             # Crear DataFrame
+            import pandas as pd
+
             df = pd.DataFrame(items)
             df = df.rename(
                 columns={
@@ -621,6 +683,7 @@ if "result" in st.session_state:
                     "costo": "Monto",
                     "decision": "Estado",
                     "explicacion": "Detalle",
+                    "regla_aplicada": "Regla",
                 }
             )
 
@@ -687,12 +750,40 @@ if "result" in st.session_state:
                 st.markdown("**Reglas Clave:**")
                 for i, rule in enumerate(key_rules, 1):
                     st.markdown(f"{i}. {rule}")
+
+                typed_rules = extracted_rules.get("reglas") or []
+                if typed_rules:
+                    st.markdown("**Reglas Estructuradas:**")
+                    st.dataframe(
+                        pd.DataFrame(typed_rules).rename(
+                            columns={
+                                "concepto": "Concepto",
+                                "tope": "Tope",
+                                "moneda": "Moneda",
+                                "unidad": "Unidad",
+                                "excluido": "Excluido",
+                                "requiere_evidencia": "Evidencia",
+                                "seccion": "Sección",
+                                "pagina": "Página",
+                            }
+                        ),
+                        width="stretch",
+                        hide_index=True,
+                    )
             else:
                 st.warning("No se encontraron reglas extraídas.")
 
     else:
         st.warning("No se encontraron items validados en el resultado.")
 
+    profile = st.session_state.get("profile")
+    if profile:
+        with st.expander("Perfil de ejecución", expanded=True):
+            st.dataframe(profile["steps"], width="stretch", hide_index=True)
+            st.caption(
+                f"Flamegraphs por paso (formato collapsed) en `{profile['directory']}`"
+            )
+
 else:
     # Mensaje inicial antes de ejecutar
     st.info("Haz clic en el botón para iniciar el proceso de validación.")
@@ -723,3 +814,35 @@ else:
             - Generación de decisiones
             """
         )
+
+# ============================================================================
+# ANALÍTICA DE RECLAMOS
+# ============================================================================
+
+outbox = Path(get_settings().INGEST_OUTBOX_DIR)
+stored = sorted(outbox.glob("*.json")) if outbox.exists() else []
+if stored:
+    st.markdown("---")
+    st.markdown("## Analítica de Reclamos")
+
+    signature = (len(stored), max(p.stat().st_mtime for p in stored))
+    data = load_analytics(str(outbox), signature)
+    summary = data["overview"]
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Reclamos", f"{summary['reclamos']:,}")
+    col2.metric("Total con Deducible", f"${summary['total_con_deducible']:,.2f}")
+    col3.metric("Tasa de Aprobación", f"{summary['tasa_aprobacion'] * 100:.1f}%")
+    col4.metric("Topes Excedidos", f"{summary['topes_excedidos']:,}")
+
+    if summary["reclamos_inconsistentes"]:
+        st.warning(
+            f"{summary['reclamos_inconsistentes']} reclamos con total_aprobado "
+            "distinto al recalculado"
+        )
+
+    tab_types, tab_claims = st.tabs(["Por Tipo de Item", "Por Reclamo"])
+    with tab_types:
+        st.dataframe(data["item_types"], width="stretch")
+    with tab_claims:
+        st.dataframe(data["claims"], width="stretch", height=400)
@@ -0,0 +1,96 @@
+"""Analytics throughput over synthetic validation results.
+
+Builds the line-item frame and every aggregate shown in the UI for
+``--items`` line items (default 100k), spread over claims of 3-8 items, and
+reports the time of each stage. With ``--from-disk`` the results are first
+written as one JSON file per claim and loaded back with ``load_results``.
+
+    python -m benchmarks.analytics --items 100000
+"""
+
+import argparse
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import analytics
+
+ITEMS = [
+    "Facia Delantera (OEM)",
+    "Pintura de Facia (Bicapa)",
+    "Absorbedor de Impacto",
+    "Mano de Obra Hojalatería",
+    "Faro Izquierdo",
+    "Cambio de Aceite",
+    "Alma de Defensa",
+]
+
+
+def synthetic_results(n_items: int, seed: int = 7) -> list[dict]:
+    rng = random.Random(seed)
+    results = []
+    produced = 0
+    while produced < n_items:
+        n = min(rng.randint(3, 8), n_items - produced)
+        items = []
+        for _ in range(n):
+            decision = rng.choices(
+                ["APROBADO", "RECHAZADO", "JUSTIFICADO_POR_NOTA"], [0.7, 0.2, 0.1]
+            )[0]
+            items.append(
+                {
+                    "item": rng.choice(ITEMS),
+                    "costo": round(rng.uniform(200, 9000), 2),
+                    "decision": decision,
+                    "explicacion": "Excede el tope de $4,000"
+                    if decision == "RECHAZADO" and rng.random() < 0.6
+                    else "ok",
+                }
+            )
+        results.append(
+            {
+                "claim_id": f"claim-{len(results)}",
+                "validated_reporte": {"items": items, "total_aprobado": 0.0},
+                "extracted_rules": {"reglas_clave": [], "deducible": 0.05},
+            }
+        )
+        produced += n
+    return results
+
+
+def timed(label: str, fn, *args):
+    started = time.perf_counter()
+    value = fn(*args)
+    print(f"{label:<22} {(time.perf_counter() - started) * 1000:>9.1f} ms")
+    return value
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=100_000)
+    parser.add_argument("--from-disk", action="store_true")
+    args = parser.parse_args()
+
+    results = synthetic_results(args.items)
+    print(f"{len(results):,} claims, {args.items:,} line items")
+
+    started = time.perf_counter()
+    if args.from_disk:
+        with tempfile.TemporaryDirectory() as directory:
+            for result in results:
+                path = Path(directory) / f"{result['claim_id']}.json"
+                path.write_text(json.dumps(result))
+            items = timed("load_results", analytics.load_results, directory)
+    else:
+        items = timed("build_items_frame", analytics.build_items_frame, results)
+    claims = timed("claim_summary", analytics.claim_summary, items)
+    timed("item_type_summary", analytics.item_type_summary, items)
+    timed("overview", analytics.overview, items, claims)
+    timed("decision_styles", analytics.decision_styles, items["decision"])
+    print(f"{'total':<22} {(time.perf_counter() - started) * 1000:>9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
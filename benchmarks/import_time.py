@@ -0,0 +1,90 @@
+"""Import-time budget for the entry points.
+
+Each entry module is imported in a fresh interpreter with ``-X importtime``;
+the best of several runs is compared against its budget. Provider SDKs must
+not be loaded by the import itself, only on first use. Exits with status 1
+when any budget is exceeded or a deferred SDK is imported eagerly, so it can
+run in CI. Run from the repository root:
+
+    python -m benchmarks.import_time
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+# Cumulative import time budget per entry module, in seconds
+BUDGETS = {
+    "models": 0.3,
+    "workflow": 1.0,
+    "server": 1.2,
+    "app": 1.5,
+}
+
+# Modules that must only load on first use
+DEFERRED = (
+    "anthropic",
+    "openai",
+    "llama_cloud_services",
+    "llama_index.core",
+    "llama_index.llms.anthropic",
+    "llama_index.llms.openai",
+    "pandas",
+)
+
+
+def import_time(module: str) -> float:
+    """Cumulative import time of ``module`` in a fresh interpreter, in seconds."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # Lines look like "import time: self [us] | cumulative | imported package"
+    for line in reversed(proc.stderr.splitlines()):
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if name.strip() == module:
+            return int(cumulative) / 1e6
+    raise RuntimeError(f"No import time reported for {module}")
+
+
+def eager_imports(module: str) -> list[str]:
+    """Deferred modules that importing ``module`` loads anyway."""
+    code = (
+        f"import json, sys, {module}; "
+        f"print(json.dumps([m for m in {DEFERRED!r} if m in sys.modules]))"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    return json.loads(proc.stdout.splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3, help="Best of N runs")
+    parser.add_argument("modules", nargs="*", default=list(BUDGETS))
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'module':<12} {'seconds':>8} {'budget':>8}  deferred SDKs loaded")
+    for module in args.modules:
+        seconds = min(import_time(module) for _ in range(args.runs))
+        eager = eager_imports(module)
+        budget = BUDGETS.get(module)
+        over = budget is not None and seconds > budget
+        failed |= over or bool(eager)
+        print(
+            f"{module:<12} {seconds:>8.3f} {budget or float('nan'):>8.2f}  "
+            f"{', '.join(eager) or '-'}{'  OVER BUDGET' if over else ''}"
+        )
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
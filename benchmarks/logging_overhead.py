@@ -0,0 +1,136 @@
+"""Time a workflow run spends blocked in logging calls.
+
+Emits the completion log lines of ``--runs`` workflow runs with a reporte of
+``--items`` line items, and measures the time spent inside the logging calls
+on the calling (event-loop) thread. Compared setups:
+
+- ``sync``: the previous console handler, formatting and writing in the call
+- ``queued``: ``DeferredQueueHandler``, formatting and writing on a listener
+
+each with the previous full-payload statements and the current summary ones.
+Output goes to a temporary file so terminal speed does not skew the result.
+
+    python -m benchmarks.logging_overhead --runs 200 --items 60
+"""
+
+import argparse
+import logging
+import queue
+import tempfile
+import time
+from logging.handlers import QueueListener
+
+from models import ExtractedRules, ItemCheck, ReporteValidation, TypedRule
+from utils.logging import CappedFormatter, DeferredQueueHandler
+
+FORMAT = "%(asctime)s | %(levelname)-8s | %(name)s | %(message)s"
+
+
+def synthetic_run(n_items: int) -> tuple[ExtractedRules, ReporteValidation, dict]:
+    rules = ExtractedRules(
+        reglas_clave=[
+            f"Tope de concepto {i} $4,000.00 MXN por pieza" for i in range(40)
+        ],
+        deducible=0.05,
+        reglas=[
+            TypedRule(concepto=f"Concepto {i}", tope=4000.0, moneda="MXN")
+            for i in range(40)
+        ],
+    )
+    validated = ReporteValidation(
+        items=[
+            ItemCheck(
+                item=f"Pieza {i} (OEM)",
+                costo=1000.0 + i,
+                decision="APROBADO",
+                explicacion="Cumple el tope de la póliza para el concepto",
+            )
+            for i in range(n_items)
+        ],
+        subtotal_aprobado=0.0,
+        deducible=0.05,
+        monto_deducible=0.0,
+        total_aprobado=0.0,
+    )
+    final = {
+        "validated_reporte": validated.model_dump(),
+        "extracted_rules": rules.model_dump(),
+        "policy_id": "H-2299-11@2026-v2@3fa1c2d4",
+        "metrics": {},
+    }
+    return rules, validated, final
+
+
+def full_statements(logger, rules, validated, final) -> None:
+    logger.info("extract_poliza_completed | extracted_rules=%s", rules)
+    logger.info("validate_reporte_completed | validated_reporte=%s", validated)
+    logger.info("end_step | reporte_final=%s", final)
+
+
+def summary_statements(logger, rules, validated, final) -> None:
+    logger.info(
+        "extract_poliza_completed | policy_id=%s | reglas=%s | deducible=%s",
+        final["policy_id"],
+        len(rules.reglas_clave),
+        rules.deducible,
+    )
+    logger.debug("extracted_rules | %s", rules)
+    logger.info(
+        "validate_reporte_completed | items=%s | total_aprobado=%s | inconsistencias=%s",
+        len(validated.items),
+        validated.total_aprobado,
+        len(validated.inconsistencias),
+    )
+    logger.debug("validated_reporte | %s", validated)
+    logger.info("end_step | policy_id=%s", final["policy_id"])
+    logger.debug("reporte_final | %s", final)
+
+
+def measure(handler: logging.Handler, statements, payload, runs: int) -> float:
+    """Mean seconds per run spent inside the logging calls."""
+    logger = logging.getLogger(f"bench.{id(handler)}")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.addHandler(handler)
+    started = time.perf_counter()
+    for _ in range(runs):
+        statements(logger, *payload)
+    return (time.perf_counter() - started) / runs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--items", type=int, default=60)
+    args = parser.parse_args()
+
+    payload = synthetic_run(args.items)
+    print(f"runs={args.runs} items={args.items}")
+    print(f"{'handler':<8} {'statements':<10} {'blocked/run':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for setup in ("sync", "queued"):
+            for name, statements in (
+                ("full", full_statements),
+                ("summary", summary_statements),
+            ):
+                with open(f"{tmp}/{setup}-{name}.log", "w", encoding="utf-8") as f:
+                    output = logging.StreamHandler(f)
+                    listener = None
+                    if setup == "sync":
+                        # The previous formatter wrote messages in full
+                        output.setFormatter(logging.Formatter(FORMAT))
+                        handler = output
+                    else:
+                        output.setFormatter(CappedFormatter(FORMAT, max_chars=2000))
+                        log_queue: queue.Queue = queue.Queue()
+                        handler = DeferredQueueHandler(log_queue)
+                        listener = QueueListener(log_queue, output)
+                        listener.start()
+                    seconds = measure(handler, statements, payload, args.runs)
+                    if listener is not None:
+                        listener.stop()
+                print(f"{setup:<8} {name:<10} {seconds * 1e6:>10.1f}us")
+
+
+if __name__ == "__main__":
+    main()
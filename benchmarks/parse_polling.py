@@ -0,0 +1,225 @@
+"""Detection latency and status requests of LlamaParse job polling.
+
+Runs parse jobs against ``StandInLlamaCloud``, a local server that speaks the
+three LlamaCloud endpoints the client uses (upload, job status, job result).
+Its jobs take ``--base`` seconds plus ``--per-page`` seconds per page of the
+uploaded PDF, and when the upload names a ``webhook_url`` it posts the job's
+completion there. The server records when each job finished, when a status
+check first saw it finished and how many status checks it served, so the
+figures below are observed, not modelled. Compared clients:
+
+- ``fixed``: the previous LlamaParse loop with ``check_interval=3``
+- ``adaptive (cold/warm)``: ``AdaptiveLlamaParse`` without, then with, job history
+- ``webhook``: ``AdaptiveLlamaParse`` woken by the local ``WebhookReceiver``
+
+    python -m benchmarks.parse_polling --jobs 1,1,2,3,5,8
+"""
+
+import argparse
+import asyncio
+import json
+import re
+import statistics
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+
+import httpx
+from llama_cloud_services import LlamaParse
+
+from steps.document_parse import polling
+from steps.document_parse.client import AdaptiveLlamaParse
+from steps.document_parse.polling import (
+    _PDF_PAGE_PATTERN,
+    AdaptivePoller,
+    WebhookReceiver,
+)
+
+_WEBHOOK_FIELD = re.compile(rb'name="webhook_url"\r\n\r\n([^\r]*)\r\n')
+
+
+@dataclass
+class StandInJob:
+    job_id: str
+    pages: int
+    finishes_at: float
+    webhook_url: str | None = None
+    detected_at: float | None = None
+    status_requests: int = 0
+
+    @property
+    def done(self) -> bool:
+        return time.monotonic() >= self.finishes_at
+
+
+class StandInLlamaCloud:
+    """Local stand-in for the LlamaCloud parse API, with timed jobs and webhooks."""
+
+    def __init__(self, base_s: float = 1.0, per_page_s: float = 0.4):
+        self.base_s = base_s
+        self.per_page_s = per_page_s
+        self.jobs: dict[str, StandInJob] = {}
+        self._server: asyncio.Server | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def base_url(self) -> str:
+        assert self._server is not None
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def start(self) -> str:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def _submit(self, body: bytes) -> StandInJob:
+        pages = len(_PDF_PAGE_PATTERN.findall(body)) or 1
+        webhook = _WEBHOOK_FIELD.search(body)
+        duration = self.base_s + self.per_page_s * pages
+        job = StandInJob(
+            job_id=uuid.uuid4().hex,
+            pages=pages,
+            finishes_at=time.monotonic() + duration,
+            webhook_url=webhook.group(1).decode() if webhook else None,
+        )
+        self.jobs[job.job_id] = job
+        if job.webhook_url:
+            task = asyncio.get_running_loop().create_task(self._push(job, duration))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _push(self, job: StandInJob, delay: float) -> None:
+        await asyncio.sleep(delay)
+        async with httpx.AsyncClient() as client:
+            await client.post(
+                job.webhook_url, json={"event": "parse.success", "job_id": job.job_id}
+            )
+
+    def _route(self, method: str, path: str, body: bytes) -> tuple[int, dict]:
+        parts = path.split("?")[0].strip("/").split("/")
+        if method == "POST" and parts[-2:] == ["parsing", "upload"]:
+            job = self._submit(body)
+            return 200, {"id": job.job_id, "status": "PENDING"}
+        if method != "GET" or parts[:3] != ["api", "parsing", "job"]:
+            return 404, {}
+        job = self.jobs.get(parts[3]) if len(parts) > 3 else None
+        if job is None:
+            return 404, {}
+        if len(parts) == 4:
+            job.status_requests += 1
+            if job.done and job.detected_at is None:
+                job.detected_at = time.monotonic()
+            return 200, {
+                "id": job.job_id,
+                "status": "SUCCESS" if job.done else "PENDING",
+            }
+        pages = [
+            {"page": n, "text": f"page {n}", "md": f"# Page {n}", "items": []}
+            for n in range(1, job.pages + 1)
+        ]
+        return 200, {"pages": pages, "job_metadata": {"job_pages": job.pages}}
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while request_line := await reader.readline():
+                method, path, *_ = request_line.decode("latin-1").split()
+                headers: dict[str, str] = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                status, payload = self._route(method, path, body)
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} -\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n\r\n".encode()
+                    + data
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def run_jobs(
+    server: StandInLlamaCloud, parser: LlamaParse, paths: list[Path]
+) -> list[StandInJob]:
+    async def one(path: Path) -> StandInJob:
+        job_id = await parser._create_job(str(path))
+        await parser._get_job_result(job_id, "json")
+        return server.jobs[job_id]
+
+    return await asyncio.gather(*(one(p) for p in paths))
+
+
+def report(name: str, jobs: list[StandInJob]) -> None:
+    latency = [j.detected_at - j.finishes_at for j in jobs if j.detected_at]
+    requests = [j.status_requests for j in jobs]
+    print(
+        f"{name:<16} {statistics.mean(latency):>9.2f}s {max(latency):>9.2f}s"
+        f" {statistics.mean(requests):>9.1f} {max(requests):>6}"
+    )
+
+
+async def main_async(page_counts: list[int], base_s: float, per_page_s: float):
+    server = StandInLlamaCloud(base_s, per_page_s)
+    base_url = await server.start()
+    receiver = WebhookReceiver()
+    await receiver.start()
+    # Benchmark-local poller and receiver instead of the settings-configured ones
+    polling._poller = AdaptivePoller(min_interval=0.25, max_interval=5.0)
+    polling._webhook_receiver = receiver
+    common = {"api_key": "stand-in", "base_url": base_url, "max_timeout": 120}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i, pages in enumerate(page_counts):
+            path = Path(tmp) / f"doc-{i}.pdf"
+            path.write_bytes(b"%PDF-1.4\n" + b"<< /Type /Page >>\n" * pages)
+            paths.append(path)
+
+        print(f"jobs pages={page_counts} duration={base_s}s+{per_page_s}s/page")
+        print(
+            f"{'client':<16} {'added/job':>10} {'max added':>10} {'status/job':>10} {'max':>6}"
+        )
+        fixed = LlamaParse(check_interval=3, **common)
+        adaptive = AdaptiveLlamaParse(**common)
+        webhook = AdaptiveLlamaParse(
+            webhook_url=f"http://127.0.0.1:{receiver.port}/", **common
+        )
+        report("fixed", await run_jobs(server, fixed, paths))
+        report("adaptive (cold)", await run_jobs(server, adaptive, paths))
+        report("adaptive (warm)", await run_jobs(server, adaptive, paths))
+        report("webhook", await run_jobs(server, webhook, paths))
+
+    for parser in (fixed, adaptive, webhook):
+        await parser.aclient.aclose()
+    await receiver.stop()
+    await server.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", default="1,1,2,3,5,8", help="Page count of each job")
+    parser.add_argument("--base", type=float, default=1.0, help="Seconds per job")
+    parser.add_argument("--per-page", type=float, default=0.4, help="Seconds per page")
+    args = parser.parse_args()
+    page_counts = [int(n) for n in args.jobs.split(",")]
+    asyncio.run(main_async(page_counts, args.base, args.per_page))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Throughput of batched vs. one-call-per-claim reporte validation.
+
+No model is called: validation is replaced by ``asyncio.sleep`` following a
+latency model (``--overhead`` seconds per request plus ``--per-reporte``
+seconds per reporte, under ``--concurrency`` parallel requests). The figures
+therefore show the effect of batching under those assumed latencies, not
+measured provider latencies; set the flags from observed ``llm.attempt`` spans
+to model a given deployment. Run from the repository root:
+
+    python -m benchmarks.validation_batching --claims 200 --batch-size 8
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+
+from models import ExtractedRules, FacturaValidation
+from steps.validate_reporte import batching
+from utils.rate_limit import scheduling
+
+RULES = ExtractedRules(reglas_clave=["Tope de pintura $4500"], deducible=0.05)
+FACTURA = (
+    "| Item | Cantidad | Precio |\n|---|---|---|\n" + "| Pintura | 1 | 3000 |\n" * 4
+)
+
+
+def _valid() -> FacturaValidation:
+    return FacturaValidation(items=[])
+
+
+def install_latency_model(overhead: float, per_reporte: float, concurrency: int):
+    """Replace the validation calls with sleeps following the latency model."""
+    in_flight = asyncio.Semaphore(concurrency)
+
+    async def validate_factura(factura_text, rules):
+        async with in_flight:
+            await asyncio.sleep(overhead + per_reporte)
+        return _valid()
+
+    async def validate_facturas(facturas, rules):
+        async with in_flight:
+            await asyncio.sleep(overhead + per_reporte * len(facturas))
+        return {claim_id: _valid() for claim_id in facturas}
+
+    batching.validate_factura = validate_factura
+    batching.validate_facturas = validate_facturas
+
+
+async def run(claims: int, batch_size: int, window_ms: float) -> float:
+    batcher = batching.ValidationBatcher(max_items=batch_size, window_ms=window_ms)
+
+    async def one(i: int):
+        with scheduling(claim_id=f"claim-{i}"):
+            if batch_size == 1:
+                return await batching.validate_factura(FACTURA, RULES)
+            return await batcher.submit(FACTURA, RULES)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(claims)))
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--claims", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--window-ms", type=float, default=50.0)
+    parser.add_argument("--overhead", type=float, default=0.8, help="Seconds/request")
+    parser.add_argument("--per-reporte", type=float, default=0.15, help="Seconds")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    logging.getLogger(batching.__name__).setLevel(logging.WARNING)
+    install_latency_model(args.overhead, args.per_reporte, args.concurrency)
+    print(
+        f"simulated latency: {args.overhead}s/request + {args.per_reporte}s/reporte,"
+        f" concurrency={args.concurrency} (sleeps, no model calls)"
+    )
+    print(f"{'mode':<12} {'calls':>6} {'seconds':>8} {'claims/s':>9}")
+    for size in (1, args.batch_size):
+        elapsed = asyncio.run(run(args.claims, size, args.window_ms))
+        calls = -(-args.claims // size)
+        mode = "per-claim" if size == 1 else f"batch={size}"
+        print(f"{mode:<12} {calls:>6} {elapsed:>8.2f} {args.claims / elapsed:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
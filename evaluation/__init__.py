@@ -0,0 +1 @@
+"""Offline evaluation of workflow configurations against a labeled corpus."""
@@ -0,0 +1,188 @@
+"""Compare workflow configurations on decision accuracy, latency and cost.
+
+Every configuration in ``--configs`` (a name mapped to settings overrides)
+runs the labeled corpus in its own interpreter. The report shows precision,
+recall and F1 per decision class, p50/p95 claim latency, tokens and cost per
+claim. Configurations on the Pareto front (no other one is at least as good
+on macro F1, p95 latency and cost) are marked with ``*``.
+
+Modes:
+    record  Run against the providers and store every parse and LLM result,
+            plus each claim's latency and usage, under ``--recordings``
+    replay  Serve everything from the recordings, offline and without
+            credentials; reports the recorded latency and usage (default
+            when ``--recordings`` exists)
+    live    Run against the providers without recording
+    stub    Parse the PDF text layer and answer with a keyword heuristic
+            (``evaluation/stub.py``), offline and without recordings; checks
+            the workflow and the scoring, not any model (default otherwise)
+
+Run from the repository root:
+
+    python -m evaluation --mode record baseline haiku-validation
+    python -m evaluation
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any
+
+from .corpus import load_corpus
+from .scoring import pareto_front, summarize
+
+HERE = Path(__file__).parent
+CACHE_MODES = {
+    "record": "read_write",
+    "replay": "only",
+    "live": "off",
+    "stub": "off",
+}
+
+
+def run_configuration(
+    name: str,
+    overrides: dict[str, Any],
+    corpus: Path,
+    mode: str,
+    recordings: Path,
+    concurrency: int,
+) -> dict[str, dict[str, Any]]:
+    """Run the corpus under one configuration in a fresh interpreter."""
+    directory = recordings / name
+    if mode == "record":
+        # Start clean, so recorded latencies are not cut short by cache hits
+        shutil.rmtree(directory, ignore_errors=True)
+    env = {
+        **os.environ,
+        # Cases run concurrently: reuse between them would depend on their order
+        "DECISION_MEMO_SIZE": "0",
+        # Keep every configuration's extractions to itself
+        "POLICY_REGISTRY_DIR": "",
+        **{
+            key: value if isinstance(value, str) else json.dumps(value)
+            for key, value in overrides.items()
+        },
+        "CACHE_MODE": CACHE_MODES[mode],
+        "CACHE_DIR": str(directory / "cache"),
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        output = Path(tmp) / "runs.json"
+        subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "evaluation.worker",
+                "--corpus",
+                str(corpus),
+                "--mode",
+                mode,
+                "--runs-dir",
+                str(directory / "runs"),
+                "--concurrency",
+                str(concurrency),
+                "--output",
+                str(output),
+            ],
+            env=env,
+            check=True,
+        )
+        return json.loads(output.read_bytes())
+
+
+def _fmt(value: float | None, spec: str) -> str:
+    return "-" if value is None else format(value, spec)
+
+
+def print_report(summaries: dict[str, dict[str, Any]], front: set[str]) -> None:
+    print(
+        f"\n{'configuration':<22} {'macro_f1':>8} {'acc':>6} {'p50_s':>7} "
+        f"{'p95_s':>7} {'tokens':>8} {'usd':>8} {'errors':>6}"
+    )
+    for name, s in summaries.items():
+        print(
+            f"{name + (' *' if name in front else ''):<22} "
+            f"{s['macro_f1']:>8.3f} {s['accuracy']:>6.3f} "
+            f"{_fmt(s['latency_p50_s'], '.2f'):>7} "
+            f"{_fmt(s['latency_p95_s'], '.2f'):>7} "
+            f"{_fmt(s['tokens_per_claim'], ',.0f'):>8} "
+            f"{_fmt(s['cost_per_claim_usd'], '.4f'):>8} "
+            f"{len(s['errors']):>6}"
+        )
+
+    for name, s in summaries.items():
+        print(f"\n{name}")
+        for decision, c in s["classes"].items():
+            print(
+                f"  {decision:<22} precision={c['precision']:.2f} "
+                f"recall={c['recall']:.2f} f1={c['f1']:.2f} support={c['support']}"
+            )
+        if s["subtotal_mae"] is not None:
+            print(f"  subtotal_aprobado MAE: {s['subtotal_mae']:,.2f}")
+        for case_id, error in s["errors"].items():
+            print(f"  error {case_id}: {error}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", type=Path, default=HERE / "corpus.json")
+    parser.add_argument("--configs", type=Path, default=HERE / "configs.json")
+    parser.add_argument("--recordings", type=Path, default=HERE / "recordings")
+    parser.add_argument(
+        "--mode",
+        choices=list(CACHE_MODES),
+        help="replay if recordings exist, else stub",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=1, help="Claims run at the same time"
+    )
+    parser.add_argument("--output", type=Path, help="Also write the report as JSON")
+    parser.add_argument("names", nargs="*", help="Configurations to run (all)")
+    args = parser.parse_args()
+
+    configs = json.loads(args.configs.read_bytes())
+    names = args.names or list(configs)
+    unknown = [name for name in names if name not in configs]
+    if unknown:
+        parser.error(f"Unknown configurations: {', '.join(unknown)}")
+
+    if args.mode is None:
+        args.mode = "replay" if args.recordings.exists() else "stub"
+        if args.mode == "stub":
+            print(
+                f"No recordings in {args.recordings}: scoring the stub backend, "
+                "not a model (--mode record to record one)",
+                file=sys.stderr,
+            )
+
+    cases = load_corpus(args.corpus)
+    summaries = {}
+    for name in names:
+        print(f"== {name} ({args.mode}, {len(cases)} claims)", file=sys.stderr)
+        runs = run_configuration(
+            name,
+            configs[name],
+            args.corpus.resolve(),
+            args.mode,
+            args.recordings.resolve(),
+            args.concurrency,
+        )
+        summaries[name] = summarize(cases, runs)
+
+    front = pareto_front(summaries)
+    print_report(summaries, front)
+    if args.output:
+        args.output.write_text(
+            json.dumps(
+                {"summaries": summaries, "pareto_front": sorted(front)}, indent=2
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
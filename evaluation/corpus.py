@@ -0,0 +1,42 @@
+"""Labeled corpus of claims with the intended decision of each line item."""
+
+from pathlib import Path
+
+from pydantic import BaseModel, Field
+
+
+class LabeledItem(BaseModel):
+    """Expected outcome of one line item of the reporte."""
+
+    item: str = Field(
+        ..., description="Case-insensitive fragment of the item name, e.g. 'pintura'"
+    )
+    decision: str = Field(
+        ..., description="'APROBADO', 'RECHAZADO' o 'JUSTIFICADO_POR_NOTA'"
+    )
+
+
+class LabeledCase(BaseModel):
+    """A claim (poliza + reporte) and the decisions it should produce."""
+
+    case_id: str
+    poliza: Path
+    reporte: Path
+    items: list[LabeledItem]
+    subtotal_aprobado: float | None = Field(
+        default=None, description="Expected payable amount before the deductible"
+    )
+
+
+class Corpus(BaseModel):
+    cases: list[LabeledCase]
+
+
+def load_corpus(path: str | Path) -> list[LabeledCase]:
+    """Load a corpus file; document paths are relative to the file."""
+    path = Path(path)
+    corpus = Corpus.model_validate_json(path.read_bytes())
+    for case in corpus.cases:
+        case.poliza = (path.parent / case.poliza).resolve()
+        case.reporte = (path.parent / case.reporte).resolve()
+    return corpus.cases
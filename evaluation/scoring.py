@@ -0,0 +1,191 @@
+"""Accuracy, latency and cost of a configuration over the labeled corpus."""
+
+from collections import Counter
+from typing import Any
+
+from steps.validate_reporte.totals import DECISIONS
+
+from .corpus import LabeledCase
+
+# Stands for "no such item": the true class of items the model invented (e.g.
+# inventory checklist entries) and the prediction for labeled items it missed
+NO_ITEM = "SIN_ITEM"
+
+# USD per million tokens: input, output, cache read, cache write (list prices)
+MODEL_PRICES: dict[str, tuple[float, float, float, float]] = {
+    "claude-sonnet-4-5": (3.0, 15.0, 0.30, 3.75),
+    "claude-haiku-4-5": (1.0, 5.0, 0.10, 1.25),
+    "claude-opus-4-1": (15.0, 75.0, 1.50, 18.75),
+    "gpt-4.1": (2.0, 8.0, 0.50, 0.0),
+    "gpt-4.1-mini": (0.40, 1.60, 0.10, 0.0),
+    "gpt-4.1-nano": (0.10, 0.40, 0.025, 0.0),
+}
+
+
+def match_items(
+    case: LabeledCase, predicted: list[dict[str, Any]]
+) -> list[tuple[str, str]]:
+    """Pair each labeled item with the model's decision for it.
+
+    A label matches the first remaining predicted item whose name contains
+    it. Returns ``(expected, predicted)`` decision pairs, with ``NO_ITEM`` for
+    labels the model missed and for predicted items no label accounts for.
+    """
+    remaining = list(predicted)
+    pairs = []
+    for label in case.items:
+        fragment = label.item.lower()
+        match = next(
+            (p for p in remaining if fragment in p.get("item", "").lower()), None
+        )
+        if match is None:
+            pairs.append((label.decision, NO_ITEM))
+            continue
+        remaining.remove(match)
+        pairs.append((label.decision, match.get("decision", "").strip().upper()))
+    pairs += [(NO_ITEM, p.get("decision", "").strip().upper()) for p in remaining]
+    return pairs
+
+
+def classification_report(pairs: list[tuple[str, str]]) -> dict[str, Any]:
+    """Precision, recall and F1 per decision class, plus their macro average."""
+    counts = Counter(pairs)
+    classes = {}
+    for decision in sorted(DECISIONS):
+        tp = counts[(decision, decision)]
+        fp = sum(n for (e, p), n in counts.items() if p == decision and e != decision)
+        fn = sum(n for (e, p), n in counts.items() if e == decision and p != decision)
+        precision = tp / (tp + fp) if tp + fp else 0.0
+        recall = tp / (tp + fn) if tp + fn else 0.0
+        f1 = (
+            2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        )
+        classes[decision] = {
+            "precision": precision,
+            "recall": recall,
+            "f1": f1,
+            "support": tp + fn,
+        }
+    supported = [c for c in classes.values() if c["support"]]
+    return {
+        "classes": classes,
+        "macro_f1": sum(c["f1"] for c in supported) / len(supported)
+        if supported
+        else 0.0,
+        "accuracy": sum(n for (e, p), n in counts.items() if e == p)
+        / max(len(pairs), 1),
+    }
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    """Nearest-rank percentile, ``q`` in [0, 1]."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+def usage_cost(usage: dict[str, int], model: str) -> float | None:
+    """USD cost of ``usage`` on ``model``, or None when its price is unknown."""
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return None
+    input_price, output_price, cache_read_price, cache_write_price = prices
+    return (
+        usage.get("input_tokens", 0) * input_price
+        + usage.get("output_tokens", 0) * output_price
+        + usage.get("cache_read_tokens", 0) * cache_read_price
+        + usage.get("cache_write_tokens", 0) * cache_write_price
+    ) / 1e6
+
+
+def summarize(
+    cases: list[LabeledCase], runs: dict[str, dict[str, Any]]
+) -> dict[str, Any]:
+    """Aggregate the per-case runs of one configuration.
+
+    Args:
+        cases: The labeled corpus
+        runs: Worker output keyed by case ID (see ``evaluation.worker``)
+    """
+    pairs = []
+    latencies = []
+    tokens = []
+    costs = []
+    subtotal_errors = []
+    errors = {}
+    for case in cases:
+        run = runs.get(case.case_id)
+        if run is None or run.get("error"):
+            errors[case.case_id] = run["error"] if run else "not run"
+            # A failed claim misses every labeled item
+            pairs += [(label.decision, NO_ITEM) for label in case.items]
+            continue
+
+        reporte = run["result"].get("validated_reporte") or {}
+        pairs += match_items(case, reporte.get("items") or [])
+        latencies.append(run["latency_s"])
+
+        step_costs = [
+            usage_cost(usage, run["models"].get(step, ""))
+            for step, usage in run["usage"].items()
+        ]
+        tokens.append(
+            sum(
+                usage.get("input_tokens", 0)
+                + usage.get("output_tokens", 0)
+                + usage.get("cache_read_tokens", 0)
+                + usage.get("cache_write_tokens", 0)
+                for usage in run["usage"].values()
+            )
+        )
+        if None not in step_costs:
+            costs.append(sum(step_costs))
+        if case.subtotal_aprobado is not None and "subtotal_aprobado" in reporte:
+            subtotal_errors.append(
+                abs(reporte["subtotal_aprobado"] - case.subtotal_aprobado)
+            )
+
+    return {
+        **classification_report(pairs),
+        "cases": len(cases),
+        "errors": errors,
+        "latency_p50_s": percentile(latencies, 0.50),
+        "latency_p95_s": percentile(latencies, 0.95),
+        "tokens_per_claim": sum(tokens) / len(tokens) if tokens else None,
+        "cost_per_claim_usd": sum(costs) / len(costs) if costs else None,
+        "subtotal_mae": sum(subtotal_errors) / len(subtotal_errors)
+        if subtotal_errors
+        else None,
+    }
+
+
+def pareto_front(summaries: dict[str, dict[str, Any]]) -> set[str]:
+    """Configurations no other one beats on macro F1, p95 latency and cost.
+
+    Configurations where every claim failed have nothing to compare and are
+    never on the front.
+    """
+
+    def objectives(summary: dict[str, Any]) -> tuple[float, float, float]:
+        # All minimized; unknown latency or cost counts as worst
+        latency, cost = summary["latency_p95_s"], summary["cost_per_claim_usd"]
+        return (
+            -summary["macro_f1"],
+            float("inf") if latency is None else latency,
+            float("inf") if cost is None else cost,
+        )
+
+    points = {
+        name: objectives(s)
+        for name, s in summaries.items()
+        if s["cases"] > len(s["errors"])
+    }
+    return {
+        name
+        for name, point in points.items()
+        if not any(
+            other != point and all(o <= p for o, p in zip(other, point, strict=True))
+            for other in points.values()
+        )
+    }
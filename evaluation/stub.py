@@ -0,0 +1,209 @@
+"""Offline stand-ins for LlamaParse and the LLM, for ``--mode stub``.
+
+Parsing reads the PDF text layer with pypdf and lays every line holding a
+``$`` amount out as a markdown table row, the way LlamaParse renders the
+priced tables. Structured calls are answered by a keyword heuristic over the
+same text: poliza lines stating a cap, an exclusion or a required note become
+rules, and each factura row is decided against them through the local rule
+index. Nothing leaves the machine and no credentials are needed, so a fresh
+checkout can run the evaluation end to end; the scores it reports measure
+this heuristic and the workflow around it, never a model.
+"""
+
+import asyncio
+import hashlib
+import re
+from pathlib import Path
+from typing import Any
+
+from models import (
+    BatchValidation,
+    ClaimValidation,
+    ExtractedRules,
+    FacturaValidation,
+    File,
+    ItemCheck,
+    ParseResult,
+    RuleFragment,
+    SectionRules,
+    TypedRule,
+)
+from steps.extract_rules.typed import parse_rule_text
+from steps.validate_reporte.matching import RuleIndex
+from steps.validate_reporte.preparation import factura_lines
+
+_AMOUNT = re.compile(r"\$\s*\d[\d.,]*(?:\s*[A-Z]{3}\b)?")
+_DEDUCTIBLE = re.compile(r"deducible\D{0,20}?(\d+(?:[.,]\d+)?)\s*%", re.IGNORECASE)
+# "Daños ocultos requieren NOTA TÉCNICA", split by the table layout
+_REQUIRES = re.compile(
+    r"\brequiere\w*\s+(nota|evidencia|dictamen|peritaje)\b", re.IGNORECASE
+)
+_CONCEPT_END = re.compile(r"\b(?:seg[uú]n|requiere\w*)\b|\$|\d|:", re.IGNORECASE)
+_SECTION = re.compile(r"^### SECCI[OÓ]N: (.+)$")
+_CLAIM = re.compile(r"^### RECLAMO claim_id=(\S+)$", re.MULTILINE)
+
+
+def _table_row(line: str) -> str:
+    """``Pintura $4,000.00 MXN Tope`` as ``| Pintura | $4,000.00 MXN | Tope |``."""
+    cells = []
+    position = 0
+    for match in _AMOUNT.finditer(line):
+        cells += [line[position : match.start()], match.group()]
+        position = match.end()
+    cells.append(line[position:])
+    return "| " + " | ".join(c.strip() for c in cells if c.strip()) + " |"
+
+
+def _read_pages(path: str, target_pages: str | None) -> list[str]:
+    from pypdf import PdfReader
+
+    pages = [page.extract_text() or "" for page in PdfReader(path).pages]
+    if target_pages:
+        pages = [pages[int(n)] for n in target_pages.split(",")]
+    return pages
+
+
+def _payload(file: File, target_pages: str | None) -> dict[str, Any]:
+    texts = _read_pages(file.path, target_pages)
+    mds = [
+        "\n".join(
+            _table_row(line) if _AMOUNT.search(line) else line
+            for line in text.splitlines()
+        )
+        for text in texts
+    ]
+    digest = hashlib.sha256(Path(file.path).read_bytes()).hexdigest()[:12]
+    return {
+        "job_id": f"stub-{digest}",
+        "markdown": "\n\n".join(mds),
+        "text": "\n\n".join(texts),
+        "pages": [
+            {"page": n, "text": text, "md": md, "items": []}
+            for n, (text, md) in enumerate(zip(texts, mds, strict=True), 1)
+        ],
+        "job_pages": len(texts),
+        "raw_json": None,
+    }
+
+
+async def parse_with_text_layer(files: list[File], **kwargs) -> ParseResult:
+    """Replacement for ``_parse_with_llamaparse`` reading the PDF text layer."""
+    payloads = await asyncio.gather(
+        *(asyncio.to_thread(_payload, f, kwargs.get("target_pages")) for f in files)
+    )
+    return ParseResult.from_payloads(list(payloads), [f.name for f in files])
+
+
+def _rule(line: str) -> TypedRule | None:
+    text = line.replace("|", " ").strip(" -")
+    rule = parse_rule_text(text)
+    if rule is not None or not (evidence := _REQUIRES.search(text)):
+        return rule
+    end = _CONCEPT_END.search(text)
+    concept = (text[: end.start()] if end else text).strip(" .,;-")
+    if not concept:
+        return None
+    return TypedRule(concepto=concept, requiere_evidencia=evidence.group(1).lower())
+
+
+def _rules(text: str) -> list[tuple[str, str, TypedRule]]:
+    """(section, rule text, typed rule) of every line that states a rule."""
+    found = []
+    section = ""
+    for line in text.splitlines():
+        if header := _SECTION.match(line.strip()):
+            section = header.group(1)
+        elif (rule := _rule(line)) is not None:
+            found.append((section, " ".join(line.replace("|", " ").split()), rule))
+    return found
+
+
+def _deductible(text: str) -> float | None:
+    match = _DEDUCTIBLE.search(text)
+    return float(match.group(1).replace(",", ".")) / 100 if match else None
+
+
+def _decide(factura_text: str, index: RuleIndex) -> list[ItemCheck]:
+    items = []
+    for line in factura_lines(factura_text):
+        costo = float(line.costo)
+        match = index.lookup(line.item)
+        rule = match.rule if match else None
+        if rule is None:
+            decision, why = "APROBADO", "Sin regla de la póliza que lo limite"
+        elif rule.excluido:
+            decision, why = "RECHAZADO", f"{rule.concepto} está excluido"
+        elif rule.tope is not None and costo > rule.tope:
+            decision, why = "RECHAZADO", f"Excede el tope de ${rule.tope:,.2f}"
+        elif rule.requiere_evidencia:
+            decision, why = (
+                ("JUSTIFICADO_POR_NOTA", f"La nota describe el daño ({rule.concepto})")
+                if line.has_note
+                else ("RECHAZADO", f"Requiere {rule.requiere_evidencia}")
+            )
+        else:
+            decision, why = "APROBADO", f"Dentro del tope de {rule.concepto}"
+        items.append(
+            ItemCheck(
+                item=line.item,
+                costo=costo,
+                decision=decision,
+                explicacion=why,
+                regla_aplicada=rule.concepto if rule else None,
+            )
+        )
+    return items
+
+
+def _answer(output_cls: type, prompt_args: dict[str, Any]) -> Any:
+    if output_cls is ExtractedRules:
+        text = prompt_args["text"]
+        rules = _rules(text)
+        return ExtractedRules(
+            reglas_clave=[line for _, line, _ in rules],
+            deducible=_deductible(text) or 0.0,
+            reglas=[rule for _, _, rule in rules],
+        )
+    if output_cls is SectionRules:
+        text = prompt_args["text"]
+        rules = _rules(text)
+        return SectionRules(
+            reglas=[RuleFragment(regla=line, seccion=s) for s, line, _ in rules],
+            reglas_tipadas=[rule for _, _, rule in rules],
+            deducible=_deductible(text),
+        )
+
+    index = RuleIndex(
+        [
+            rule
+            for line in prompt_args["reglas_context"].splitlines()
+            if line.startswith("- ") and (rule := _rule(line)) is not None
+        ]
+    )
+    if output_cls is FacturaValidation:
+        return FacturaValidation(items=_decide(prompt_args["factura_text"], index))
+    if output_cls is BatchValidation:
+        parts = _CLAIM.split(prompt_args["facturas_text"])
+        return BatchValidation(
+            reportes=[
+                ClaimValidation(claim_id=claim_id, items=_decide(text, index))
+                for claim_id, text in zip(parts[1::2], parts[2::2], strict=True)
+            ]
+        )
+    raise TypeError(f"The stub backend cannot answer {output_cls.__name__}")
+
+
+async def stub_attempt(
+    output_cls: type, prompt: Any, model: str, tokens: int, prompt_args: dict
+) -> Any:
+    """Replacement for ``utils.llm._attempt``: no call, no usage recorded."""
+    return _answer(output_cls, prompt_args)
+
+
+def install() -> None:
+    """Route parsing and structured calls of this process to the stand-ins."""
+    import steps.document_parse.parse
+    import utils.llm
+
+    steps.document_parse.parse._parse_with_llamaparse = parse_with_text_layer
+    utils.llm._attempt = stub_attempt
@@ -0,0 +1,101 @@
+"""Run the corpus through ``Demo`` under the settings of the current process.
+
+Started by ``python -m evaluation`` in a fresh interpreter per configuration,
+with the configuration's settings in the environment, so cached settings,
+clients and schedulers never leak from one configuration into another.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import Any
+
+from models import File
+from utils.files import write_atomic
+from utils.rate_limit import Priority, scheduling
+from utils.settings import get_settings
+
+from .corpus import LabeledCase, load_corpus
+
+
+async def run_case(workflow, case: LabeledCase) -> dict[str, Any]:
+    """Run one claim; latency covers the whole workflow, parse included."""
+    config = get_settings()
+    files = [
+        File(path=str(case.poliza), name=case.poliza.name, is_poliza=True),
+        File(path=str(case.reporte), name=case.reporte.name, is_poliza=False),
+    ]
+    started = time.monotonic()
+    try:
+        with scheduling(claim_id=case.case_id, priority=Priority.BATCH):
+            result = await workflow.run(files=files)
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+    return {
+        "error": None,
+        "result": result,
+        "latency_s": time.monotonic() - started,
+        "usage": result.get("metrics", {}),
+        "models": {
+            "extract_poliza": config.EXTRACTION_MODEL,
+            "validate_reporte": config.VALIDATION_MODEL,
+        },
+    }
+
+
+async def run_corpus(
+    cases: list[LabeledCase], mode: str, runs_dir: Path, concurrency: int
+) -> dict[str, dict[str, Any]]:
+    from workflow import Demo
+
+    workflow = Demo(timeout=get_settings().WORKFLOW_SERVER_RUN_TIMEOUT)
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(case: LabeledCase) -> dict[str, Any]:
+        async with slots:
+            run = await run_case(workflow, case)
+        recording = runs_dir / f"{case.case_id}.json"
+        if mode == "record" and not run["error"]:
+            data = json.dumps(run, indent=2, default=str).encode()
+            await asyncio.to_thread(write_atomic, recording, data)
+        elif mode == "replay" and not run["error"]:
+            if not recording.exists():
+                return {"error": f"No recorded run in {recording}"}
+            # Replayed calls are instant and free: report what the recorded run cost
+            recorded = json.loads(recording.read_bytes())
+            run.update(
+                latency_s=recorded["latency_s"],
+                usage=recorded["usage"],
+                models=recorded["models"],
+            )
+        return run
+
+    results = await asyncio.gather(*(one(case) for case in cases))
+    return {case.case_id: run for case, run in zip(cases, results, strict=True)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", required=True)
+    parser.add_argument(
+        "--mode", choices=["replay", "record", "live", "stub"], default="replay"
+    )
+    parser.add_argument("--runs-dir", required=True, type=Path)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--output", required=True, type=Path)
+    args = parser.parse_args()
+
+    if args.mode == "stub":
+        from . import stub
+
+        stub.install()
+    runs = asyncio.run(
+        run_corpus(load_corpus(args.corpus), args.mode, args.runs_dir, args.concurrency)
+    )
+    args.output.write_text(json.dumps(runs, default=str))
+
+
+if __name__ == "__main__":
+    main()
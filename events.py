@@ -1,4 +1,5 @@
-from llama_index.core.workflow import Event
+from pydantic import ConfigDict
+from workflows.events import Event
 
 from models import (
     ExtractedRules,
@@ -6,6 +7,17 @@ from models import (
     ParseResult,
     ReporteValidation,
 )
+from steps.validate_reporte.preparation import PreparedReporte
+
+
+class _ParseResultEvent(Event):
+    """Base for events carrying a ParseResult.
+
+    Their schema is built on first use, so importing the workflow does not load
+    the LlamaParse SDK.
+    """
+
+    model_config = ConfigDict(defer_build=True)
 
 
 class StartParseEvent(Event):
@@ -14,19 +26,20 @@ class StartParseEvent(Event):
     file: File
 
 
-class ParseCompletedEvent(Event):
+class ParseCompletedEvent(_ParseResultEvent):
     """Emitted when parsing completes."""
 
     parse_result: ParseResult
 
 
-class StartPolizaExtractionEvent(Event):
+class StartPolizaExtractionEvent(_ParseResultEvent):
     """Event to trigger poliza extraction."""
 
     parse_result: ParseResult
+    file: File | None = None
 
 
-class StartReporteExtractionEvent(Event):
+class StartReporteExtractionEvent(_ParseResultEvent):
     """Event to trigger reporte extraction."""
 
     parse_result: ParseResult
@@ -38,12 +51,32 @@ class ExtractedPolizaEventCompleted(Event):
     extracted_rules: ExtractedRules
 
 
-class ReporteParsedEventCompleted(Event):
+class ReporteParsedEventCompleted(_ParseResultEvent):
     """Emitted when reporte parsing completes."""
 
     parse_result: ParseResult
 
 
+class ReportePreparedEvent(Event):
+    """Emitted when the reporte's factura is read and ready to validate."""
+
+    reporte: PreparedReporte
+
+
+class SpeculativeRulesEvent(Event):
+    """Rules of the poliza's previous version, to validate with until extraction ends."""
+
+    extracted_rules: ExtractedRules
+    policy_id: str
+
+
+class SpeculativeValidationEvent(Event):
+    """Reporte validated with the previous version's rules; empty if that failed."""
+
+    validated_reporte: ReporteValidation | None = None
+    extracted_rules: ExtractedRules | None = None
+
+
 class ReporteValidatedEvent(Event):
     """Emitted when reporte validation completes."""
 
@@ -0,0 +1,345 @@
+"""Spool-directory ingestion daemon.
+
+Claims are dropped into ``INGEST_INBOX_DIR`` as a JSON manifest naming the
+poliza and reporte files of the claim, e.g. ``claim-123.json``::
+
+    {"claim_id": "claim-123", "poliza": "poliza-77.pdf", "reporte": "reporte-123.pdf"}
+
+File names are relative to the inbox and must stay inside it; the claim ID
+is used as a file name, so it is limited to letters, digits, ``.``, ``_`` and
+``-``. A manifest is picked up once it and both documents have stopped
+changing. Claims whose documents were already processed (same content hash)
+are not run again: their result is a copy of the original claim's, marked
+with ``duplicate_of``. Ready claims go through a bounded
+queue into ``Demo``. When the queue is full the scanner stops picking up new
+claims until workers catch up. Results are written atomically to
+``INGEST_OUTBOX_DIR/<claim_id>.json``, and failures to
+``<claim_id>.error.json``; a claim whose result cannot be written counts as
+failed. Handled manifests move to ``processed/`` or ``failed/`` inside the
+inbox; documents stay, since a poliza is usually shared by many claims.
+
+    uv run python ingest.py
+"""
+
+import asyncio
+import hashlib
+import json
+import shutil
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from pydantic import BaseModel, Field, ValidationError, field_validator
+
+from models import File
+from utils.executor import shutdown_process_pool
+from utils.files import write_atomic
+from utils.logging import get_logger
+from utils.rate_limit import Priority, scheduling
+from utils.settings import get_settings
+
+logger = get_logger(__name__)
+
+
+class ClaimManifest(BaseModel):
+    """Inbox manifest pairing a reporte with the poliza it is checked against."""
+
+    claim_id: str = Field(pattern=r"^[A-Za-z0-9][A-Za-z0-9._-]{0,127}$")
+    poliza: str
+    reporte: str
+
+    @field_validator("poliza", "reporte")
+    @classmethod
+    def _inside_inbox(cls, name: str) -> str:
+        path = Path(name)
+        if not name or path.is_absolute() or ".." in path.parts:
+            raise ValueError("must be a path relative to the inbox, without '..'")
+        return name
+
+
+@dataclass
+class Claim:
+    manifest: ClaimManifest
+    manifest_path: Path
+    files: list[File]
+    content_hash: str
+
+
+class Ingestor:
+    """Watches the inbox and feeds ready claims to a pool of workflow workers."""
+
+    def __init__(
+        self,
+        inbox: Path,
+        outbox: Path,
+        queue_size: int,
+        workers: int,
+        poll_interval: float,
+        run_timeout: float,
+    ):
+        self.inbox = inbox
+        self.outbox = outbox
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.run_timeout = run_timeout
+        self.queue: asyncio.Queue[Claim] = asyncio.Queue(maxsize=queue_size)
+        # path -> (size, mtime) seen on the previous scan; unchanged means complete
+        self._snapshot: dict[Path, tuple[int, float]] = {}
+        self._in_flight: set[Path] = set()
+        self._hashes_in_flight: set[str] = set()
+        self._hashes_dir = outbox / ".hashes"
+
+    def _stable(self, path: Path, snapshot: dict[Path, tuple[int, float]]) -> bool:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return False
+        snapshot[path] = (stat.st_size, stat.st_mtime)
+        return self._snapshot.get(path) == snapshot[path]
+
+    def _content_hash(self, paths: list[Path]) -> str:
+        digest = hashlib.sha256()
+        for path in paths:
+            with open(path, "rb") as f:
+                digest.update(hashlib.file_digest(f, "sha256").digest())
+        return digest.hexdigest()
+
+    def _archive(self, manifest_path: Path, folder: str) -> None:
+        target = self.inbox / folder
+        target.mkdir(exist_ok=True)
+        shutil.move(manifest_path, target / manifest_path.name)
+
+    def _reject(self, manifest_path: Path, reason: str) -> None:
+        """Move a manifest that can never be processed to ``failed/``."""
+        logger.warning(
+            "ingest_manifest_invalid | manifest=%s | error=%s",
+            manifest_path.name,
+            reason,
+        )
+        try:
+            self._archive(manifest_path, "failed")
+        except OSError as e:
+            logger.error(
+                "ingest_archive_failed | manifest=%s | error=%s",
+                manifest_path.name,
+                str(e),
+            )
+
+    def _scan(self) -> list[Claim]:
+        """Ready claims in the inbox; called from a worker thread."""
+        snapshot: dict[Path, tuple[int, float]] = {}
+        ready = []
+        for manifest_path in sorted(self.inbox.glob("*.json")):
+            if manifest_path in self._in_flight or not self._stable(
+                manifest_path, snapshot
+            ):
+                continue
+            try:
+                manifest = ClaimManifest.model_validate_json(manifest_path.read_bytes())
+            except ValidationError as e:
+                # The file is complete, so it will not become valid by waiting
+                self._reject(manifest_path, str(e))
+                continue
+
+            documents = [self.inbox / manifest.poliza, self.inbox / manifest.reporte]
+            # Symlinks could still point outside the inbox
+            inbox = self.inbox.resolve()
+            if not all(path.resolve().is_relative_to(inbox) for path in documents):
+                self._reject(manifest_path, "documents must be inside the inbox")
+                continue
+            # Stat every document so all of them enter the snapshot
+            stable = [self._stable(path, snapshot) for path in documents]
+            if not all(stable):
+                continue
+
+            try:
+                content_hash = self._content_hash(documents)
+            except OSError:
+                # Removed or replaced since the stat; look again on the next scan
+                snapshot.pop(manifest_path, None)
+                continue
+            ready.append(
+                Claim(
+                    manifest=manifest,
+                    manifest_path=manifest_path,
+                    files=[
+                        File(
+                            path=str(documents[0]), name=manifest.poliza, is_poliza=True
+                        ),
+                        File(
+                            path=str(documents[1]),
+                            name=manifest.reporte,
+                            is_poliza=False,
+                        ),
+                    ],
+                    content_hash=content_hash,
+                )
+            )
+        self._snapshot = snapshot
+        return ready
+
+    def _seen(self, claim: Claim) -> str | None:
+        """claim_id that already processed the same documents, if any."""
+        marker = self._hashes_dir / claim.content_hash
+        return marker.read_text() if marker.exists() else None
+
+    def _complete_duplicate(self, claim: Claim, duplicate_of: str) -> None:
+        """Write a duplicate claim's result from the original's and archive it."""
+        claim_id = claim.manifest.claim_id
+        try:
+            original = json.loads((self.outbox / f"{duplicate_of}.json").read_bytes())
+        except (OSError, ValueError):
+            original = {"content_hash": claim.content_hash}
+        output = {**original, "claim_id": claim_id, "duplicate_of": duplicate_of}
+        write_atomic(
+            self.outbox / f"{claim_id}.json",
+            json.dumps(output, indent=2, default=str).encode(),
+        )
+        self._archive(claim.manifest_path, "processed")
+
+    async def watch(self) -> None:
+        """Scan the inbox and enqueue ready claims, blocking while the queue is full."""
+        while True:
+            try:
+                claims = await asyncio.to_thread(self._scan)
+            except OSError as e:
+                logger.error("ingest_scan_failed | error=%s", str(e))
+                claims = []
+            for claim in claims:
+                if claim.content_hash in self._hashes_in_flight:
+                    # Same documents are being processed; decide on the next scan
+                    continue
+                duplicate_of = self._seen(claim)
+                if duplicate_of is not None:
+                    logger.info(
+                        "ingest_duplicate_skipped | claim_id=%s | duplicate_of=%s",
+                        claim.manifest.claim_id,
+                        duplicate_of,
+                    )
+                    try:
+                        await asyncio.to_thread(
+                            self._complete_duplicate, claim, duplicate_of
+                        )
+                    except OSError as e:
+                        await self._fail(claim, e)
+                    continue
+                self._in_flight.add(claim.manifest_path)
+                self._hashes_in_flight.add(claim.content_hash)
+                if self.queue.full():
+                    logger.info(
+                        "ingest_backpressure | queue_size=%s", self.queue.maxsize
+                    )
+                await self.queue.put(claim)
+            await asyncio.sleep(self.poll_interval)
+
+    async def work(self) -> None:
+        """Run queued claims through the workflow, one at a time."""
+        from workflow import Demo
+
+        workflow = Demo(timeout=self.run_timeout)
+        while True:
+            claim = await self.queue.get()
+            try:
+                await self._process(workflow, claim)
+            finally:
+                self._in_flight.discard(claim.manifest_path)
+                self._hashes_in_flight.discard(claim.content_hash)
+                self.queue.task_done()
+
+    async def _process(self, workflow, claim: Claim) -> None:
+        claim_id = claim.manifest.claim_id
+        started = time.monotonic()
+        logger.info("ingest_claim_started | claim_id=%s", claim_id)
+        try:
+            with scheduling(claim_id=claim_id, priority=Priority.BATCH):
+                result = await workflow.run(files=claim.files)
+        except Exception as e:
+            await self._fail(claim, e)
+            return
+
+        output = {"claim_id": claim_id, "content_hash": claim.content_hash, **result}
+        try:
+            await asyncio.to_thread(self._complete, claim, output)
+        except OSError as e:
+            await self._fail(claim, e)
+            return
+        logger.info(
+            "ingest_claim_completed | claim_id=%s | duration_s=%.2f | queued=%s",
+            claim_id,
+            time.monotonic() - started,
+            self.queue.qsize(),
+        )
+
+    def _complete(self, claim: Claim, output: dict) -> None:
+        write_atomic(
+            self.outbox / f"{claim.manifest.claim_id}.json",
+            json.dumps(output, indent=2, default=str).encode(),
+        )
+        write_atomic(
+            self._hashes_dir / claim.content_hash, claim.manifest.claim_id.encode()
+        )
+        self._archive(claim.manifest_path, "processed")
+
+    async def _fail(self, claim: Claim, error: Exception) -> None:
+        """Record a failed claim; never raises, so the daemon keeps running."""
+        claim_id = claim.manifest.claim_id
+        logger.error(
+            "ingest_claim_failed | claim_id=%s | error=%s", claim_id, str(error)
+        )
+        record = {
+            "claim_id": claim_id,
+            "error": str(error),
+            "type": type(error).__name__,
+        }
+        try:
+            await asyncio.to_thread(
+                write_atomic,
+                self.outbox / f"{claim_id}.error.json",
+                json.dumps(record, indent=2).encode(),
+            )
+        except OSError as e:
+            logger.error(
+                "ingest_error_write_failed | claim_id=%s | error=%s", claim_id, str(e)
+            )
+        try:
+            await asyncio.to_thread(self._archive, claim.manifest_path, "failed")
+        except OSError as e:
+            # The manifest stays in the inbox and is retried on a later scan
+            logger.error(
+                "ingest_archive_failed | claim_id=%s | error=%s", claim_id, str(e)
+            )
+
+    async def run(self) -> None:
+        self.inbox.mkdir(parents=True, exist_ok=True)
+        self._hashes_dir.mkdir(parents=True, exist_ok=True)
+        logger.info(
+            "ingest_started | inbox=%s | outbox=%s | workers=%s | queue_size=%s",
+            self.inbox,
+            self.outbox,
+            self.workers,
+            self.queue.maxsize,
+        )
+        async with asyncio.TaskGroup() as tasks:
+            tasks.create_task(self.watch())
+            for _ in range(self.workers):
+                tasks.create_task(self.work())
+
+
+async def main():
+    config = get_settings()
+    ingestor = Ingestor(
+        inbox=Path(config.INGEST_INBOX_DIR),
+        outbox=Path(config.INGEST_OUTBOX_DIR),
+        queue_size=config.INGEST_QUEUE_SIZE,
+        workers=config.INGEST_WORKERS,
+        poll_interval=config.INGEST_POLL_INTERVAL,
+        run_timeout=config.WORKFLOW_SERVER_RUN_TIMEOUT,
+    )
+    try:
+        await ingestor.run()
+    finally:
+        shutdown_process_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
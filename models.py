@@ -1,7 +1,33 @@
-from typing import Any
+from importlib import import_module
+from typing import TYPE_CHECKING, Annotated, Any
 
-from llama_cloud_services.parse.types import JobResult, Page, PageItem
 from pydantic import BaseModel, ConfigDict, Field
+from pydantic.json_schema import SkipJsonSchema
+
+
+class _LazyModel:
+    """Field type resolved on first validation instead of at import time.
+
+    Importing the LlamaParse types loads the whole llama_cloud_services SDK, which
+    is not needed to render or reload results.
+    """
+
+    def __init__(self, module: str, name: str):
+        self.module = module
+        self.name = name
+
+    def __get_pydantic_core_schema__(self, source, handler):
+        return handler.generate_schema(getattr(import_module(self.module), self.name))
+
+
+if TYPE_CHECKING:
+    from llama_cloud_services.parse.types import JobResult, Page, PageItem
+else:
+    Page = Annotated[Any, _LazyModel("llama_cloud_services.parse.types", "Page")]
+    PageItem = Annotated[
+        Any, _LazyModel("llama_cloud_services.parse.types", "PageItem")
+    ]
+    JobResult = Any
 
 
 class File(BaseModel):
@@ -36,7 +62,7 @@ class ParseResult(BaseModel):
     page_count: int = 0
     raw_json: dict[str, Any] | None = None
 
-    model_config = ConfigDict(arbitrary_types_allowed=True)
+    model_config = ConfigDict(arbitrary_types_allowed=True, defer_build=True)
 
     @property
     def all_tables(self) -> list[tuple[int, PageItem]]:
@@ -174,7 +200,7 @@ class ParseResult(BaseModel):
             return None
 
         filtered_pages = [
-            Page(
+            type(p)(
                 page=p.page,
                 items=items,
                 text="\n\n".join(i.value for i in items if i.value) or None,
@@ -185,27 +211,62 @@ class ParseResult(BaseModel):
         return self.build_result_from_pages(filtered_pages)
 
     @staticmethod
-    async def from_llama_result(llama_result: JobResult) -> "ParseResult":
-        """Convert LlamaParse result to our ParseResult model."""
+    async def fetch_llama_payload(llama_result: JobResult) -> dict[str, Any]:
+        """Download the raw outputs of a LlamaParse job as plain, picklable data.
+
+        Only network I/O happens here; building the model from the payload is left
+        to ``from_payload`` so it can run outside the event loop.
+        """
         # Markdown endpoint not always available, so we catch the exception and set markdown to None
         try:
             markdown = await llama_result.aget_markdown()
         except Exception:
             markdown = None
-        pages = list(llama_result.pages or [])
+        raw_json = await llama_result.aget_json()
+        pages: list[Any] | None = raw_json.get("pages") if raw_json else None
+        if pages is None:
+            pages = list(llama_result.pages or [])
+        return {
+            "job_id": llama_result.job_id,
+            "markdown": markdown,
+            "text": await llama_result.aget_text(),
+            "pages": pages,
+            "job_pages": getattr(llama_result.job_metadata, "job_pages", 0),
+            "raw_json": raw_json,
+        }
+
+    @staticmethod
+    def from_payload(payload: dict[str, Any]) -> "ParseResult":
+        """Build a ParseResult from a payload produced by ``fetch_llama_payload``."""
+        pages = payload["pages"]
         # Some deployments occasionally report 0 in job metadata even when pages are present.
-        page_count = int(
-            getattr(llama_result.job_metadata, "job_pages", 0) or len(pages)
-        )
-        result = ParseResult(
-            job_id=llama_result.job_id,
-            markdown=markdown,
-            text=await llama_result.aget_text(),
+        page_count = int(payload.get("job_pages") or len(pages))
+        return ParseResult(
+            job_id=payload["job_id"],
+            markdown=payload["markdown"],
+            text=payload["text"],
             pages=pages,
             page_count=page_count,
-            raw_json=await llama_result.aget_json(),
+            raw_json=payload["raw_json"],
         )
-        return result
+
+    @staticmethod
+    def from_payloads(
+        payloads: list[dict[str, Any]], source_names: list[str] | None = None
+    ) -> "ParseResult":
+        """Build and merge the ParseResults of several jobs.
+
+        Entry point for the process pool: it is pure CPU work over picklable
+        inputs.
+        """
+        results = [ParseResult.from_payload(payload) for payload in payloads]
+        return ParseResult.merge_results(results, source_names)
+
+    @staticmethod
+    async def from_llama_result(llama_result: JobResult) -> "ParseResult":
+        """Convert LlamaParse result to our ParseResult model."""
+        payload = await ParseResult.fetch_llama_payload(llama_result)
+        return ParseResult.from_payload(payload)
 
     @staticmethod
     def merge_results(
@@ -252,7 +313,7 @@ class ParseResult(BaseModel):
 
             # Renumber pages with offset to ensure continuous numbering
             for page in result.pages:
-                new_page = Page(
+                new_page = type(page)(
                     page=page.page + page_offset,
                     items=page.items,
                     text=page.text,
@@ -279,6 +340,33 @@ class ParseResult(BaseModel):
         )
 
 
+class TypedRule(BaseModel):
+    """Regla de la póliza en forma estructurada, evaluable sin releer el texto."""
+
+    concepto: str = Field(
+        ...,
+        description="Concepto al que aplica. Ej: 'Pintura', 'Partes Estructurales'.",
+    )
+    tope: float | None = Field(
+        None, description="Monto máximo como número (4000), o null si no hay tope"
+    )
+    moneda: str | None = Field(None, description="Moneda del tope. Ej: 'MXN'.")
+    unidad: str | None = Field(
+        None, description="A qué se aplica el tope. Ej: 'por pieza', 'por hora'."
+    )
+    excluido: bool = Field(False, description="True si el concepto no está cubierto")
+    requiere_evidencia: str | None = Field(
+        None, description="Evidencia exigida para pagarlo. Ej: 'nota técnica'."
+    )
+    seccion: str | None = Field(
+        None, description="Encabezado de la sección donde aparece la regla"
+    )
+    # Resolved locally from the parsed pages; the model does not see page numbers
+    pagina: SkipJsonSchema[int | None] = Field(
+        None, description="Página donde aparece la regla"
+    )
+
+
 class ExtractedRules(BaseModel):
     """Extrae solo las restricciones clave en texto simple."""
 
@@ -287,6 +375,71 @@ class ExtractedRules(BaseModel):
         description="Lista de reglas importantes. Ej: 'Tope de pintura $4500', 'Daños ocultos permitidos solo con nota técnica'.",
     )
     deducible: float = Field(..., description="El porcentaje de deducible (0.05).")
+    reglas: list[TypedRule] = Field(
+        default_factory=list,
+        description="Las mismas reglas en forma estructurada, una por concepto.",
+    )
+    # Filled locally by the map-reduce extraction; not part of the model's output
+    fuentes: SkipJsonSchema[dict[str, list[str]]] = Field(
+        default_factory=dict,
+        description="Secciones de la póliza de las que proviene cada regla",
+    )
+    # Filled locally by the map-reduce extraction: conflicting rules, missing deductible
+    avisos: SkipJsonSchema[list[str]] = Field(
+        default_factory=list,
+        description="Advertencias de la extracción que requieren revisión",
+    )
+
+
+class RuleFragment(BaseModel):
+    """Una regla y la sección de la póliza donde aparece."""
+
+    regla: str = Field(
+        ..., description="Regla en texto corto. Ej: 'Tope de pintura $4500'."
+    )
+    seccion: str = Field(
+        ..., description="Nombre de la SECCIÓN de donde sale, tal como aparece"
+    )
+
+
+class SectionRules(BaseModel):
+    """Reglas extraídas de un fragmento de la póliza."""
+
+    reglas: list[RuleFragment] = Field(
+        ..., description="Reglas del fragmento; vacía si no contiene ninguna"
+    )
+    reglas_tipadas: list[TypedRule] = Field(
+        default_factory=list,
+        description="Las mismas reglas en forma estructurada, una por concepto",
+    )
+    deducible: float | None = Field(
+        None,
+        description="Porcentaje de deducible general (0.05) si el fragmento lo define; si no, null.",
+    )
+
+
+class PolicyMetadata(BaseModel):
+    """Datos de la carátula que identifican la versión de una póliza."""
+
+    registro_cnsf: str | None = None
+    producto: str | None = None
+    version: str | None = None
+
+
+class PolicyRecord(BaseModel):
+    """Una versión registrada de una póliza, con sus reglas ya extraídas."""
+
+    policy_id: str
+    parse_hash: str = Field(..., description="Hash del contenido parseado")
+    file_digests: list[str] = Field(
+        default_factory=list, description="SHA-256 de los archivos con este contenido"
+    )
+    metadata: PolicyMetadata = Field(default_factory=PolicyMetadata)
+    rules: ExtractedRules
+    headings: dict[str, int] = Field(
+        default_factory=dict, description="Primera página de cada encabezado"
+    )
+    registered_at: float
 
 
 class ItemCheck(BaseModel):
@@ -300,10 +453,50 @@ class ItemCheck(BaseModel):
     explicacion: str = Field(
         ..., description="Breve razón. Ej: 'Cumple cláusula de daños ocultos'."
     )
+    # Concept of the poliza rule the item matched locally; not asked of the model
+    regla_aplicada: SkipJsonSchema[str | None] = Field(
+        None, description="Concepto de la regla de la póliza que aplica al ítem"
+    )
+    # Model that decided the item (the fallback while the primary fails); set locally
+    modelo: SkipJsonSchema[str | None] = Field(
+        None, description="Modelo que decidió el ítem"
+    )
 
 
-class ReporteValidation(BaseModel):
-    """El resultado final para el Frontend."""
+class FacturaValidation(BaseModel):
+    """Decisión por línea de la factura; los totales se calculan localmente."""
 
     items: list[ItemCheck]
+    # Filled locally when merging decisions: rows left without one
+    avisos: SkipJsonSchema[list[str]] = Field(
+        default_factory=list,
+        exclude=True,
+        description="Advertencias de la validación que requieren revisión",
+    )
+
+
+class ReporteValidation(FacturaValidation):
+    """El resultado final para el Frontend."""
+
+    subtotal_aprobado: float = Field(
+        ..., description="Suma de los items pagables, antes del deducible"
+    )
+    deducible: float = Field(..., description="Porcentaje de deducible aplicado")
+    monto_deducible: float
     total_aprobado: float
+    inconsistencias: list[str] = Field(
+        default_factory=list,
+        description="Diferencias detectadas entre la respuesta del modelo y la factura",
+    )
+
+
+class ClaimValidation(FacturaValidation):
+    """Validación de un reporte dentro de un lote."""
+
+    claim_id: str = Field(..., description="El claim_id indicado en el encabezado")
+
+
+class BatchValidation(BaseModel):
+    """Resultado de validar varios reportes en una sola llamada."""
+
+    reportes: list[ClaimValidation]
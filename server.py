@@ -0,0 +1,425 @@
+"""HTTP server running the Demo workflow as a long-lived service.
+
+Each claim is submitted as a job (multipart upload of the poliza and the
+reporte) and runs in the background on the server's event loop. Clients poll
+the job status, fetch the result, or follow progress as server-sent events.
+The workflow, LLM clients, rate-limit scheduler and process pool are created
+once at startup and shared by every job.
+
+Endpoints:
+    POST /jobs                  Submit ``poliza`` and ``reporte`` PDFs, or a
+                                registered ``policy_id`` and the ``reporte``
+                                (413 past the upload cap, 429 when the queue is full)
+    GET  /jobs/{job_id}         Job status
+    GET  /jobs/{job_id}/result  Final result (409 while still running)
+    GET  /jobs/{job_id}/events  Progress as server-sent events
+    GET  /health                Liveness probe, decision memo and registry hit rates, captures
+"""
+
+import asyncio
+import json
+import shutil
+import tempfile
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from enum import StrEnum
+from pathlib import Path
+from typing import Any
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.datastructures import FormData, UploadFile
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+from workflows.events import StepState, StepStateChanged, StopEvent
+
+from models import File
+from steps.document_parse.polling import get_webhook_receiver
+from steps.extract_rules.registry import get_policy_registry
+from steps.validate_reporte.memo import get_decision_memo
+from utils.capture import get_capture_store
+from utils.executor import get_process_pool, shutdown_process_pool
+from utils.llm import get_llm
+from utils.logging import get_logger
+from utils.rate_limit import get_scheduler, scheduling
+from utils.settings import get_settings
+from workflow import Demo
+
+logger = get_logger(__name__)
+
+
+class JobStatus(StrEnum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+@dataclass
+class Job:
+    """A workflow run submitted through the API."""
+
+    job_id: str
+    files: list[File]
+    upload_dir: Path
+    policy_id: str | None = None
+    policy_lineage: str | None = None
+    status: JobStatus = JobStatus.QUEUED
+    created_at: float = field(default_factory=time.time)
+    finished_at: float | None = None
+    result: dict[str, Any] | None = None
+    error: str | None = None
+    events: list[dict[str, Any]] = field(default_factory=list)
+    changed: asyncio.Event = field(default_factory=asyncio.Event)
+
+    @property
+    def done(self) -> bool:
+        return self.status in (JobStatus.COMPLETED, JobStatus.FAILED)
+
+    def publish(self, event: dict[str, Any]) -> None:
+        """Record a progress event and wake up SSE subscribers."""
+        self.events.append({"ts": time.time(), **event})
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+            "progress": self.events[-1] if self.events else None,
+        }
+
+
+def _event_name(name: str | None) -> str | None:
+    # Step state events name events either as "Foo" or "<class 'module.Foo'>"
+    if name is None:
+        return None
+    name = name.removeprefix("<class '").removesuffix("'>").rsplit(".", 1)[-1]
+    return None if name == "NoneType" else name
+
+
+class JobManager:
+    """Runs jobs in the background and keeps the most recent ones in memory."""
+
+    def __init__(
+        self, workflow: Demo, max_concurrent: int, max_jobs: int, max_queued: int
+    ):
+        self.workflow = workflow
+        self.max_jobs = max_jobs
+        # Jobs accepted and not finished: running plus waiting for a slot
+        self.max_unfinished = max_concurrent + max_queued
+        self.unfinished = 0
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._tasks: set[asyncio.Task] = set()
+
+    def get(self, job_id: str) -> Job | None:
+        return self._jobs.get(job_id)
+
+    @property
+    def full(self) -> bool:
+        """Whether the queue of jobs waiting for a run slot is at its limit."""
+        return self.unfinished >= self.max_unfinished
+
+    def submit(self, job: Job) -> None:
+        self.unfinished += 1
+        self._jobs[job.job_id] = job
+        self._evict()
+        task = asyncio.create_task(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _evict(self) -> None:
+        # Forget the oldest finished jobs once over the limit
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[: max(len(self._jobs) - self.max_jobs, 0)]:
+            del self._jobs[job_id]
+
+    async def _run(self, job: Job) -> None:
+        async with self._slots:
+            job.status = JobStatus.RUNNING
+            job.publish({"type": "status", "status": job.status})
+            logger.info("server_job_started | job_id=%s", job.job_id)
+            try:
+                with scheduling(claim_id=job.job_id):
+                    handler = self.workflow.run(
+                        files=job.files,
+                        policy_id=job.policy_id,
+                        policy_lineage=job.policy_lineage,
+                    )
+                    async for ev in handler.stream_events(expose_internal=True):
+                        if isinstance(ev, StepStateChanged) and ev.step_state in (
+                            StepState.RUNNING,
+                            StepState.NOT_RUNNING,
+                        ):
+                            job.publish(
+                                {
+                                    "type": "step",
+                                    "step": ev.name,
+                                    "state": ev.step_state.value,
+                                    "input": _event_name(ev.input_event_name),
+                                    "output": _event_name(ev.output_event_name),
+                                }
+                            )
+                        elif isinstance(ev, StopEvent):
+                            break
+                    job.result = await handler
+                job.status = JobStatus.COMPLETED
+            except Exception as e:
+                job.error = str(e)
+                job.status = JobStatus.FAILED
+                logger.error(
+                    "server_job_failed | job_id=%s | error=%s", job.job_id, str(e)
+                )
+            finally:
+                job.finished_at = time.time()
+                self.unfinished -= 1
+                shutil.rmtree(job.upload_dir, ignore_errors=True)
+
+        logger.info(
+            "server_job_finished | job_id=%s | status=%s | duration_s=%.2f",
+            job.job_id,
+            job.status,
+            job.finished_at - job.created_at,
+        )
+        job.publish({"type": "status", "status": job.status, "error": job.error})
+
+    async def shutdown(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+def _job_or_404(request: Request) -> Job | JSONResponse:
+    manager: JobManager = request.app.state.jobs
+    job = manager.get(request.path_params["job_id"])
+    if job is None:
+        return JSONResponse({"detail": "Job not found"}, status_code=404)
+    return job
+
+
+def _save_upload(upload: UploadFile, path: Path) -> None:
+    upload.file.seek(0)
+    with path.open("wb") as out:
+        shutil.copyfileobj(upload.file, out)
+
+
+async def submit_job(request: Request) -> JSONResponse:
+    config = get_settings()
+    manager: JobManager = request.app.state.jobs
+    if manager.full:
+        return JSONResponse(
+            {"detail": "Too many queued jobs, retry later"},
+            status_code=429,
+            headers={"Retry-After": "30"},
+        )
+    # Reject oversized requests before parsing them; the per-file check below
+    # also covers chunked uploads, which carry no Content-Length
+    max_bytes = int(config.WORKFLOW_SERVER_MAX_UPLOAD_MB * 1024 * 1024)
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > 2 * max_bytes + 64 * 1024:
+        return JSONResponse({"detail": "Request too large"}, status_code=413)
+
+    # Closing the form releases the spooled uploads once they are copied
+    async with request.form(max_files=2) as form:
+        return await _submit_form(request, form, max_bytes)
+
+
+async def _submit_form(
+    request: Request, form: FormData, max_bytes: int
+) -> JSONResponse:
+    config = get_settings()
+    manager: JobManager = request.app.state.jobs
+    # A registered poliza can be referenced instead of uploaded
+    policy_id = form.get("policy_id")
+    if policy_id is not None and not isinstance(policy_id, str):
+        return JSONResponse({"detail": "policy_id must be a string"}, status_code=422)
+    if policy_id and get_policy_registry().get(policy_id) is None:
+        return JSONResponse(
+            {"detail": f"Unknown policy_id: {policy_id}"}, status_code=404
+        )
+    # A new version of a registered poliza can be validated with the previous one's rules
+    policy_lineage = form.get("policy_lineage")
+    if policy_lineage is not None and not isinstance(policy_lineage, str):
+        return JSONResponse(
+            {"detail": "policy_lineage must be a string"}, status_code=422
+        )
+    names = ("reporte",) if policy_id else ("poliza", "reporte")
+    uploads = {name: form.get(name) for name in names}
+    missing = [n for n, f in uploads.items() if not isinstance(f, UploadFile)]
+    if missing:
+        return JSONResponse(
+            {"detail": f"Missing file fields: {', '.join(missing)}"}, status_code=422
+        )
+
+    too_large = [n for n, f in uploads.items() if (f.size or 0) > max_bytes]
+    if too_large:
+        return JSONResponse(
+            {
+                "detail": f"Files over {config.WORKFLOW_SERVER_MAX_UPLOAD_MB:g} MB: "
+                f"{', '.join(too_large)}"
+            },
+            status_code=413,
+        )
+
+    job_id = uuid.uuid4().hex
+    upload_dir = Path(
+        tempfile.mkdtemp(prefix=f"{job_id}-", dir=request.app.state.upload_root)
+    )
+    files = []
+    for name, upload in uploads.items():
+        filename = Path(upload.filename or f"{name}.pdf").name
+        path = upload_dir / f"{name}{Path(filename).suffix or '.pdf'}"
+        await asyncio.to_thread(_save_upload, upload, path)
+        files.append(File(path=str(path), name=filename, is_poliza=name == "poliza"))
+
+    job = Job(
+        job_id=job_id,
+        files=files,
+        upload_dir=upload_dir,
+        policy_id=policy_id,
+        policy_lineage=policy_lineage or None,
+    )
+    manager.submit(job)
+    logger.info("server_job_submitted | job_id=%s", job_id)
+    return JSONResponse(
+        {
+            **job.summary(),
+            "status_url": str(request.url_for("job_status", job_id=job_id)),
+            "result_url": str(request.url_for("job_result", job_id=job_id)),
+            "events_url": str(request.url_for("job_events", job_id=job_id)),
+        },
+        status_code=202,
+    )
+
+
+async def job_status(request: Request) -> JSONResponse:
+    job = _job_or_404(request)
+    if isinstance(job, JSONResponse):
+        return job
+    return JSONResponse(job.summary())
+
+
+async def job_result(request: Request) -> JSONResponse:
+    job = _job_or_404(request)
+    if isinstance(job, JSONResponse):
+        return job
+    if job.status == JobStatus.FAILED:
+        return JSONResponse(job.summary(), status_code=500)
+    if job.status != JobStatus.COMPLETED:
+        return JSONResponse(job.summary(), status_code=409)
+    return JSONResponse(json.loads(json.dumps(job.result, default=str)))
+
+
+async def job_events(request: Request) -> StreamingResponse | JSONResponse:
+    job = _job_or_404(request)
+    if isinstance(job, JSONResponse):
+        return job
+
+    async def stream() -> AsyncIterator[str]:
+        sent = 0
+        while True:
+            # Grab the wake-up event before draining, so nothing slips in between
+            changed = job.changed
+            for event in job.events[sent:]:
+                yield f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+            sent = len(job.events)
+            if job.done:
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=15)
+            except TimeoutError:
+                # Keep idle proxies from closing the connection
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def health(request: Request) -> JSONResponse:
+    return JSONResponse(
+        {
+            "status": "ok",
+            "decision_memo": get_decision_memo().stats(),
+            "policy_registry": get_policy_registry().stats(),
+            "debug_capture": get_capture_store().stats(),
+        }
+    )
+
+
+def warm_up() -> None:
+    """Create the shared clients and pools once, before the first job."""
+    config = get_settings()
+    get_scheduler()
+    get_process_pool()
+    if config.CACHE_MODE == "only":
+        # Cache-only servers never reach a provider and may have no credentials
+        return
+    models = {
+        config.EXTRACTION_MODEL,
+        config.VALIDATION_MODEL,
+        config.LLM_FALLBACK_MODEL,
+    }
+    for model in filter(None, models):
+        get_llm(model=model)
+
+
+@asynccontextmanager
+async def lifespan(app: Starlette) -> AsyncIterator[None]:
+    config = get_settings()
+    warm_up()
+    # Bind the parse webhook receiver (if configured) to the server's loop
+    await get_webhook_receiver()
+
+    upload_root = config.WORKFLOW_SERVER_UPLOAD_DIR
+    if upload_root:
+        Path(upload_root).mkdir(parents=True, exist_ok=True)
+    app.state.upload_root = upload_root
+    app.state.jobs = JobManager(
+        Demo(timeout=config.WORKFLOW_SERVER_RUN_TIMEOUT),
+        max_concurrent=config.WORKFLOW_SERVER_MAX_CONCURRENT_RUNS,
+        max_jobs=config.WORKFLOW_SERVER_MAX_JOBS,
+        max_queued=config.WORKFLOW_SERVER_MAX_QUEUED_JOBS,
+    )
+    logger.info(
+        "server_started | host=%s | port=%s",
+        config.WORKFLOW_SERVER_HOST,
+        config.WORKFLOW_SERVER_PORT,
+    )
+    try:
+        yield
+    finally:
+        await app.state.jobs.shutdown()
+        shutdown_process_pool()
+
+
+app = Starlette(
+    routes=[
+        Route("/health", health, methods=["GET"]),
+        Route("/jobs", submit_job, methods=["POST"]),
+        Route("/jobs/{job_id}", job_status, methods=["GET"], name="job_status"),
+        Route("/jobs/{job_id}/result", job_result, methods=["GET"], name="job_result"),
+        Route("/jobs/{job_id}/events", job_events, methods=["GET"], name="job_events"),
+    ],
+    lifespan=lifespan,
+)
+
+
+def main():
+    config = get_settings()
+    uvicorn.run(app, host=config.WORKFLOW_SERVER_HOST, port=config.WORKFLOW_SERVER_PORT)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 from models import ParseResult
 from .parse import parse_document
+from .routing import PAGE_MODES, parse_document_routed
 
-__all__ = ["ParseResult", "parse_document"]
+__all__ = ["PAGE_MODES", "ParseResult", "parse_document", "parse_document_routed"]
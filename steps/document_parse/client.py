@@ -0,0 +1,122 @@
+"""LlamaParse client waiting for jobs with the adaptive poller."""
+
+import asyncio
+from typing import Any
+
+import httpx
+from llama_cloud_services import LlamaParse
+from llama_cloud_services.parse.base import (
+    JOB_RESULT_URL,
+    JOB_STATUS_ROUTE,
+    JobFailedException,
+)
+
+from utils.logging import get_logger
+
+from .polling import current_webhook_receiver, estimate_page_count, get_poller
+
+logger = get_logger(__name__)
+
+_TRANSIENT_HTTP_ERRORS = (
+    httpx.ConnectError,
+    httpx.ReadError,
+    httpx.WriteError,
+    httpx.ConnectTimeout,
+    httpx.ReadTimeout,
+    httpx.WriteTimeout,
+    httpx.HTTPStatusError,
+    httpx.RemoteProtocolError,
+)
+
+
+class ParseTimeoutError(TimeoutError):
+    """A parse job did not finish within the client's ``max_timeout``."""
+
+
+class AdaptiveLlamaParse(LlamaParse):
+    """LlamaParse client that waits for jobs with ``AdaptivePoller``.
+
+    Overrides the private ``_create_job`` and ``_get_job_result`` of
+    llama-cloud-services 0.6.54 (the version in ``uv.lock``; the signatures are
+    unchanged through 0.6.94). The status polling loop mirrors that version's;
+    re-check both methods when upgrading the SDK.
+    """
+
+    async def _create_job(self, file_input, *args, **kwargs) -> str:
+        job_id = await super()._create_job(file_input, *args, **kwargs)
+        get_poller().register_job(job_id, estimate_page_count(file_input))
+        receiver = current_webhook_receiver() if self.webhook_url else None
+        if receiver is not None:
+            # Only notifications for jobs being waited for are accepted
+            receiver.event_for(job_id)
+        return job_id
+
+    async def _get_job_result(
+        self, job_id: str, result_type: str, verbose: bool = False
+    ) -> dict[str, Any]:
+        poller = get_poller()
+        receiver = current_webhook_receiver() if self.webhook_url else None
+        stats = poller.start(job_id)
+        interval = poller.first_interval(stats.page_count)
+        client = self.aclient
+
+        try:
+            while True:
+                stats.last_interval = interval
+                if receiver is not None and receiver.running:
+                    try:
+                        await asyncio.wait_for(
+                            receiver.event_for(job_id).wait(), timeout=interval
+                        )
+                        stats.pushed = True
+                    except TimeoutError:
+                        pass
+                else:
+                    await asyncio.sleep(interval)
+
+                try:
+                    stats.status_requests += 1
+                    result = await client.get(JOB_STATUS_ROUTE.format(job_id=job_id))
+                    result.raise_for_status()
+                    result_json = result.json()
+                    status = result_json["status"]
+                    if status == "SUCCESS":
+                        parsed_result = await client.get(
+                            JOB_RESULT_URL.format(
+                                job_id=job_id, result_type=result_type
+                            )
+                        )
+                        break
+                    if status != "PENDING":
+                        raise JobFailedException.from_result(result_json)
+                    # A push for a job that is still pending would otherwise spin
+                    stats.pushed = False
+                    if receiver is not None:
+                        receiver.event_for(job_id).clear()
+                except _TRANSIENT_HTTP_ERRORS as err:
+                    if stats.elapsed > self.max_timeout:
+                        raise ParseTimeoutError(
+                            f"Timeout while parsing the file: {job_id}"
+                        ) from err
+                    logger.warning(
+                        "llamaparse_http_error | job_id=%s | error=%s", job_id, err
+                    )
+
+                if stats.elapsed > self.max_timeout:
+                    raise ParseTimeoutError(f"Timeout while parsing the file: {job_id}")
+                interval = poller.next_interval(interval, stats)
+        finally:
+            if receiver is not None:
+                receiver.discard(job_id)
+
+        poller.record(stats.page_count, stats.estimated_duration)
+        logger.info(
+            "parse_job_completed | job_id=%s | pages=%s | wait_s=%.2f | status_requests=%s | pushed=%s | added_latency_s=%.2f",
+            job_id,
+            stats.page_count,
+            stats.elapsed,
+            stats.status_requests,
+            stats.pushed,
+            stats.added_latency,
+        )
+        return parsed_result.json()
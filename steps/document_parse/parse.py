@@ -1,9 +1,16 @@
+import asyncio
+
 import httpx
-from llama_cloud_services import LlamaParse
 
 from models import File, ParseResult
+from utils.cache import get_cache
+from utils.executor import run_cpu_bound
 from utils.logging import get_logger
+from utils.rate_limit import get_scheduler
 from utils.settings import get_settings
+from utils.tracing import span
+
+from .polling import get_webhook_receiver, webhook_url
 
 logger = get_logger(__name__)
 
@@ -25,19 +32,42 @@ async def parse_document(files: list[File], **kwargs) -> ParseResult:
 
     Returns:
         ParseResult with markdown, page-level content, and detected tables
+
+    Raises:
+        CacheMissError: In cache-only mode, when the documents were never parsed
     """
+    with span("parse_document", files=[f.name for f in files]):
+        return await _parse_document(files, **kwargs)
+
+
+async def _parse_document(files: list[File], **kwargs) -> ParseResult:
+    cache = get_cache()
+    if not cache.enabled:
+        return await _parse_with_llamaparse(files, **kwargs)
+
+    digests = await asyncio.gather(
+        *(asyncio.to_thread(cache.file_digest, f.path) for f in files)
+    )
+    key = cache.key([(f.name, digest) for f, digest in zip(files, digests)], kwargs)
+    return await cache.get_or_compute(
+        "parse", key, ParseResult, lambda: _parse_with_llamaparse(files, **kwargs)
+    )
+
+
+async def _parse_with_llamaparse(files: list[File], **kwargs) -> ParseResult:
     file_paths = [f.path for f in files]
     filenames = [f.name for f in files]
 
     logger.info(
-        "fetching_documents | file_count=%s | filenames=%s | kwargs=%s",
+        "fetching_documents | file_count=%s | filenames=%s | options=%s",
         len(file_paths),
         filenames,
-        kwargs,
+        sorted(kwargs),
     )
 
     try:
         config = get_settings()
+        config.require_credentials("LLAMA_CLOUD_API_KEY")
         # Default parameters
         http_client = httpx.AsyncClient(verify=False, timeout=60)
         params = {
@@ -46,21 +76,42 @@ async def parse_document(files: list[File], **kwargs) -> ParseResult:
             "custom_client": http_client,
             "num_workers": min(4, len(file_paths)),  # Parallelize when multiple files
         }
+        # Completion is pushed to the local receiver instead of being polled for
+        if await get_webhook_receiver() is not None:
+            params["webhook_url"] = webhook_url(
+                config.PARSE_WEBHOOK_URL, config.PARSE_WEBHOOK_SECRET
+            )
         # Update with kwargs
         params.update(kwargs)
 
-        parser = LlamaParse(**params)
+        # The LlamaParse SDK is slow to import; load it with the first parse
+        from .client import AdaptiveLlamaParse
+
+        parser = AdaptiveLlamaParse(**params)
 
         try:
-            # Parse all files and merge results
-            llama_results = await parser.aparse(
-                file_paths, extra_info={"filenames": filenames}
-            )
+            # Parse all files and merge results; each file is one job submission
+            with span("llamaparse.parse", files=filenames) as parse_span:
+                async with get_scheduler().slot("llamaparse", requests=len(file_paths)):
+                    if parse_span:
+                        parse_span.set(queued_s=parse_span.duration_s)
+                    llama_results = await parser.aparse(
+                        file_paths, extra_info={"filenames": filenames}
+                    )
             # llama_results is a list of JobResult when multiple files are passed
-            parse_results = [
-                await ParseResult.from_llama_result(result) for result in llama_results
+            payloads = [
+                await ParseResult.fetch_llama_payload(result)
+                for result in llama_results
             ]
-            parse_result = ParseResult.merge_results(parse_results, filenames)
+            pages = sum(len(payload["pages"]) for payload in payloads)
+            if pages <= config.CPU_INLINE_MAX_PAGES:
+                # Cheaper than pickling to a worker, which imports the parse SDK
+                parse_result = ParseResult.from_payloads(payloads, filenames)
+            else:
+                # Model construction and merging are CPU-bound, keep them off the loop
+                parse_result = await run_cpu_bound(
+                    ParseResult.from_payloads, payloads, filenames
+                )
         finally:
             await http_client.aclose()
 
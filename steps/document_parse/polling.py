@@ -0,0 +1,325 @@
+"""Adaptive LlamaParse job polling.
+
+LlamaParse's own loop polls every ``check_interval`` seconds. Here the first
+status check is scheduled from the historical duration of jobs with a similar
+page count, later checks back off exponentially, and a local webhook receiver
+can push completion so the poller wakes up immediately. The LlamaParse client
+that uses them lives in ``client.py``; ``benchmarks/parse_polling.py`` runs it
+against a stand-in LlamaCloud server.
+
+The receiver listens on ``PARSE_WEBHOOK_HOST`` (loopback by default; put a
+proxy in front of it to expose it). It only accepts notifications for jobs
+this process is waiting for, with bodies up to ``_MAX_BODY_BYTES``, and with
+``PARSE_WEBHOOK_SECRET`` set, only those carrying it as the ``token`` query
+parameter of the webhook URL or an ``X-Webhook-Secret`` header.
+"""
+
+import asyncio
+import hmac
+import json
+import re
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+from urllib.parse import parse_qs, urlencode, urlsplit, urlunsplit
+
+from utils.logging import get_logger
+from utils.settings import get_settings
+
+logger = get_logger(__name__)
+
+_PDF_PAGE_PATTERN = re.compile(rb"/Type\s*/Page(?!s)")
+
+# Job notifications are a few hundred bytes; anything larger is not one
+_MAX_BODY_BYTES = 64 * 1024
+_MAX_HEADERS = 64
+_READ_TIMEOUT_S = 10.0
+
+
+def estimate_page_count(file_input: Any) -> int | None:
+    """Cheaply estimate the page count of a local PDF without parsing it."""
+    try:
+        path = Path(file_input)
+        if path.suffix.lower() != ".pdf":
+            return None
+        return len(_PDF_PAGE_PATTERN.findall(path.read_bytes())) or None
+    except (TypeError, OSError):
+        return None
+
+
+@dataclass
+class JobStats:
+    """Polling statistics for a single parse job."""
+
+    job_id: str
+    page_count: int | None = None
+    started_at: float = field(default_factory=time.monotonic)
+    status_requests: int = 0
+    last_interval: float = 0.0
+    backoff_interval: float = 0.0
+    pushed: bool = False
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @property
+    def added_latency(self) -> float:
+        """Upper bound of the time between job completion and its detection.
+
+        A pushed completion is noticed as soon as it arrives; a polled one could
+        have finished at any point during the last sleep.
+        """
+        return 0.0 if self.pushed else self.last_interval
+
+    @property
+    def estimated_duration(self) -> float:
+        """Best estimate of the job's own duration, excluding detection delay."""
+        return self.elapsed - self.added_latency / 2
+
+
+class AdaptivePoller:
+    """Schedules status checks from historical job durations per page count."""
+
+    def __init__(
+        self,
+        min_interval: float = 0.5,
+        max_interval: float = 10.0,
+        backoff: float = 2.0,
+        smoothing: float = 0.3,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.smoothing = smoothing
+        # EWMA of job duration (seconds) per page-count bucket
+        self._durations: dict[int, float] = {}
+        self._page_counts: dict[str, int | None] = {}
+
+    @staticmethod
+    def _bucket(page_count: int | None) -> int:
+        # Buckets: 1, 2, 3-4, 5-8, 9-16, ...
+        return max((page_count or 1) - 1, 0).bit_length()
+
+    def expected_duration(self, page_count: int | None) -> float | None:
+        """Expected job duration for a page count, if there is history for it."""
+        return self._durations.get(self._bucket(page_count))
+
+    def record(self, page_count: int | None, duration: float) -> None:
+        """Feed the duration of a finished job back into the history."""
+        bucket = self._bucket(page_count)
+        previous = self._durations.get(bucket)
+        self._durations[bucket] = (
+            duration
+            if previous is None
+            else (1 - self.smoothing) * previous + self.smoothing * duration
+        )
+
+    def register_job(self, job_id: str, page_count: int | None) -> None:
+        self._page_counts[job_id] = page_count
+
+    def start(self, job_id: str) -> JobStats:
+        return JobStats(job_id=job_id, page_count=self._page_counts.pop(job_id, None))
+
+    def first_interval(self, page_count: int | None) -> float:
+        expected = self.expected_duration(page_count)
+        if expected is None:
+            return self.min_interval
+        # Aim slightly early; the backoff covers the remainder
+        return min(max(0.9 * expected, self.min_interval), self.max_interval)
+
+    def next_interval(self, current: float, stats: JobStats) -> float:
+        expected = self.expected_duration(stats.page_count)
+        if expected is not None and stats.elapsed < expected:
+            # Still inside the expected window: converge on it
+            return max(
+                min(expected - stats.elapsed, self.max_interval), self.min_interval
+            )
+        # Overdue (or no history): back off exponentially from a short interval
+        if stats.backoff_interval:
+            stats.backoff_interval *= self.backoff
+        elif expected is None:
+            stats.backoff_interval = current * self.backoff
+        else:
+            stats.backoff_interval = self.min_interval
+        return min(stats.backoff_interval, self.max_interval)
+
+
+class WebhookReceiver:
+    """Minimal local HTTP endpoint that receives LlamaParse job notifications.
+
+    A POST whose JSON body names a job being waited for
+    (``job_id``/``jobId``/``id``) wakes up the poller waiting for that job.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        secret: str | None = None,
+        max_body_bytes: int = _MAX_BODY_BYTES,
+    ):
+        self.host = host
+        self.port = port
+        self.secret = secret
+        self.max_body_bytes = max_body_bytes
+        self._server: asyncio.Server | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._events: dict[str, asyncio.Event] = {}
+        self.received = 0
+        self.rejected = 0
+
+    @property
+    def running(self) -> bool:
+        return self._server is not None
+
+    @property
+    def bound_to_running_loop(self) -> bool:
+        return self._loop is None or self._loop is asyncio.get_running_loop()
+
+    async def start(self) -> None:
+        if self._server is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(
+            "webhook_receiver_started | host=%s | port=%s", self.host, self.port
+        )
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def close(self) -> None:
+        """Close the listening socket without waiting (safe from any loop)."""
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+
+    def event_for(self, job_id: str) -> asyncio.Event:
+        return self._events.setdefault(job_id, asyncio.Event())
+
+    def discard(self, job_id: str) -> None:
+        self._events.pop(job_id, None)
+
+    def notify(self, job_id: str) -> bool:
+        """Wake up the waiter of a job; False if no one is waiting for it."""
+        event = self._events.get(job_id)
+        if event is None:
+            return False
+        self.received += 1
+        event.set()
+        return True
+
+    def _authorized(self, target: str, headers: dict[str, str]) -> bool:
+        if not self.secret:
+            return True
+        tokens = parse_qs(urlsplit(target).query).get("token", [])
+        given = headers.get("x-webhook-secret") or (tokens[0] if tokens else "")
+        return hmac.compare_digest(given.encode(), self.secret.encode())
+
+    async def _read_request(
+        self, reader: asyncio.StreamReader
+    ) -> tuple[str, str, dict[str, str], bytes | None]:
+        """Method, target, headers and body (None if it exceeds the cap)."""
+        method, target, *_ = (await reader.readline()).decode("latin-1").split()
+        headers: dict[str, str] = {}
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            if len(headers) >= _MAX_HEADERS:
+                raise ValueError("too many headers")
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", 0))
+        if length < 0:
+            raise ValueError("negative content length")
+        if length > self.max_body_bytes:
+            return method, target, headers, None
+        return method, target, headers, await reader.readexactly(length)
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        status = "400 Bad Request"
+        try:
+            async with asyncio.timeout(_READ_TIMEOUT_S):
+                method, target, headers, body = await self._read_request(reader)
+            if method != "POST":
+                status = "405 Method Not Allowed"
+            elif not self._authorized(target, headers):
+                status = "401 Unauthorized"
+            elif body is None:
+                status = "413 Content Too Large"
+            else:
+                payload = json.loads(body or b"{}")
+                data = payload.get("data", payload)
+                job_id = data.get("job_id") or data.get("jobId") or data.get("id")
+                if job_id and self.notify(str(job_id)):
+                    status = "200 OK"
+                elif job_id:
+                    status = "404 Not Found"
+        except TimeoutError:
+            status = "408 Request Timeout"
+        except (ValueError, AttributeError, asyncio.IncompleteReadError) as e:
+            logger.warning("webhook_rejected | error=%s", str(e))
+        finally:
+            if not status.startswith("200"):
+                self.rejected += 1
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode()
+            )
+            await writer.drain()
+            writer.close()
+
+
+_poller: AdaptivePoller | None = None
+_webhook_receiver: WebhookReceiver | None = None
+
+
+def get_poller() -> AdaptivePoller:
+    """Get the process-wide poller, so job history is shared across parses."""
+    global _poller
+    if _poller is None:
+        config = get_settings()
+        _poller = AdaptivePoller(
+            min_interval=config.PARSE_POLL_MIN_INTERVAL,
+            max_interval=config.PARSE_POLL_MAX_INTERVAL,
+        )
+    return _poller
+
+
+def webhook_url(url: str, secret: str | None) -> str:
+    """The webhook URL given to LlamaParse, carrying the secret if there is one."""
+    if not secret:
+        return url
+    parts = urlsplit(url)
+    query = "&".join(q for q in (parts.query, urlencode({"token": secret})) if q)
+    return urlunsplit(parts._replace(query=query))
+
+
+def current_webhook_receiver() -> WebhookReceiver | None:
+    """The webhook receiver started by ``get_webhook_receiver``, if any."""
+    return _webhook_receiver
+
+
+async def get_webhook_receiver() -> WebhookReceiver | None:
+    """Start (once) and return the webhook receiver, if one is configured."""
+    global _webhook_receiver
+    config = get_settings()
+    if not config.PARSE_WEBHOOK_URL:
+        return None
+    if _webhook_receiver is not None and not _webhook_receiver.bound_to_running_loop:
+        # Each Streamlit run gets a fresh event loop; the old server is unusable
+        _webhook_receiver.close()
+        _webhook_receiver = None
+    if _webhook_receiver is None:
+        _webhook_receiver = WebhookReceiver(
+            host=config.PARSE_WEBHOOK_HOST,
+            port=config.PARSE_WEBHOOK_PORT,
+            secret=config.PARSE_WEBHOOK_SECRET,
+        )
+    await _webhook_receiver.start()
+    return _webhook_receiver
@@ -0,0 +1,387 @@
+"""Per-page routing of LlamaParse modes.
+
+Agentic parsing with high-resolution OCR is only needed on scanned or
+image-heavy pages; pages with a text layer parse well with cheaper modes. Each
+page is classified locally from its PDF content stream, without rendering:
+
+- ``complex``: under ``PARSE_ROUTING_MIN_CHARS`` characters of text layer, or
+  images covering at least ``PARSE_ROUTING_MAX_IMAGE_RATIO`` of the page
+- ``table``: ruling lines, or text runs aligned in columns over several rows
+- ``text``: everything else (cover pages, legal filler)
+
+Consecutive pages of the same kind form a group, parsed as its own job with
+``target_pages``; groups are parsed concurrently and merged back in page order.
+At most ``PARSE_ROUTING_MAX_GROUPS`` jobs are submitted per document: the
+smallest groups are folded into a neighbour, taking the costlier mode.
+
+    uv run python -m steps.document_parse.routing data/Poliza.pdf
+"""
+
+import argparse
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Literal
+
+from models import File, ParseResult
+from utils.executor import run_cpu_bound
+from utils.logging import get_logger
+from utils.settings import get_settings
+from utils.tracing import span
+
+from .parse import parse_document
+
+logger = get_logger(__name__)
+
+PageKind = Literal["text", "table", "complex"]
+
+# Cheapest adequate LlamaParse options per page kind, cheapest first
+PAGE_MODES: dict[PageKind, dict[str, Any]] = {
+    "text": {"parse_mode": "parse_page_with_llm"},
+    "table": {
+        "parse_mode": "parse_page_with_agent",  # Agentic parsing for complex layouts
+        "outlined_table_extraction": True,
+    },
+    "complex": {
+        "parse_mode": "parse_page_with_agent",
+        "outlined_table_extraction": True,
+        "high_res_ocr": True,
+    },
+}
+_COST = {kind: rank for rank, kind in enumerate(PAGE_MODES)}
+
+# LlamaParse options describing the start of the document ("must start with a
+# level 1 heading"); sent only to the group holding the first page
+FIRST_PAGE_OPTIONS = frozenset({"system_prompt_append"})
+
+# Ruling lines shorter than this (in points) are glyph strokes, not table borders
+_MIN_RULE_LENGTH = 20
+_MAX_RULE_WIDTH = 2
+# Text runs starting within this many points share a column
+_COLUMN_BUCKET = 4
+_MIN_TABLE_ROWS = 3
+_MAX_FORM_DEPTH = 3
+
+_Matrix = tuple[float, float, float, float, float, float]
+_IDENTITY: _Matrix = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+
+@dataclass
+class PageStats:
+    """What the content stream of one page draws."""
+
+    chars: int = 0
+    image_area: float = 0.0
+    page_area: float = 1.0
+    rules: int = 0
+    # (row, column) buckets where text runs start
+    runs: list[tuple[int, int]] = field(default_factory=list)
+
+    @property
+    def image_ratio(self) -> float:
+        return min(self.image_area / self.page_area, 1.0)
+
+    def table_rows(self) -> int:
+        """Rows of three or more text runs whose starts line up with two other rows.
+
+        Columns may be a bucket apart (right-aligned amounts of different
+        widths); prose set word by word rarely lines up that closely.
+        """
+        rows: dict[int, set[int]] = {}
+        for row, column in self.runs:
+            rows.setdefault(row, set()).add(column)
+        candidates = [columns for columns in rows.values() if len(columns) >= 3]
+
+        def aligned(a: set[int], b: set[int]) -> bool:
+            matched = sum(1 for c in a if c in b or c - 1 in b or c + 1 in b)
+            return matched >= max(3, 0.75 * len(a))
+
+        return sum(
+            1
+            for a in candidates
+            if sum(1 for b in candidates if b is not a and aligned(a, b)) >= 2
+        )
+
+    def kind(self, min_chars: int, max_image_ratio: float) -> PageKind:
+        if self.chars < min_chars or self.image_ratio >= max_image_ratio:
+            return "complex"
+        if self.rules >= 4 or self.table_rows() >= _MIN_TABLE_ROWS:
+            return "table"
+        return "text"
+
+
+@dataclass
+class PageGroup:
+    """Consecutive pages (0-based) parsed together with one mode."""
+
+    kind: PageKind
+    pages: list[int]
+
+    @property
+    def target_pages(self) -> str:
+        return ",".join(map(str, self.pages))
+
+    def __str__(self) -> str:
+        return f"{self.kind}:{self.pages[0] + 1}-{self.pages[-1] + 1}"
+
+
+def _multiply(m: _Matrix, n: _Matrix) -> _Matrix:
+    a, b, c, d, e, f = m
+    a2, b2, c2, d2, e2, f2 = n
+    return (
+        a * a2 + b * c2,
+        a * b2 + b * d2,
+        c * a2 + d * c2,
+        c * b2 + d * d2,
+        e * a2 + f * c2 + e2,
+        e * b2 + f * d2 + f2,
+    )
+
+
+def _shown_chars(operator: bytes, operands: list[Any]) -> int:
+    if operator in (b"Tj", b"'"):
+        return len(operands[0]) if operands else 0
+    if operator == b'"':
+        return len(operands[2]) if len(operands) > 2 else 0
+    if operator == b"TJ" and operands:
+        return sum(len(part) for part in operands[0] if isinstance(part, (str, bytes)))
+    return 0
+
+
+def _scan(
+    content: Any, resources: Any, ctm: _Matrix, stats: PageStats, depth: int
+) -> None:
+    """Accumulate text, image and ruling statistics of a content stream."""
+    from pypdf.generic import ContentStream, DictionaryObject
+
+    if not isinstance(content, ContentStream):
+        content = ContentStream(content, None)
+    resources = resources.get_object() if resources is not None else None
+    xobjects = resources.get("/XObject") if resources else None
+    xobjects = xobjects.get_object() if xobjects is not None else DictionaryObject()
+    stack: list[_Matrix] = []
+    x = y = line_x = line_y = leading = 0.0
+    current: tuple[float, float] | None = None
+
+    for operands, operator in content.operations:
+        if operator == b"q":
+            stack.append(ctm)
+        elif operator == b"Q" and stack:
+            ctm = stack.pop()
+        elif operator == b"cm":
+            ctm = _multiply(tuple(map(float, operands)), ctm)
+        elif operator == b"BT":
+            x = y = line_x = line_y = 0.0
+        elif operator == b"Tm":
+            x = line_x = float(operands[4])
+            y = line_y = float(operands[5])
+        elif operator in (b"Td", b"TD"):
+            line_x += float(operands[0])
+            line_y += float(operands[1])
+            x, y = line_x, line_y
+            if operator == b"TD":
+                leading = -float(operands[1])
+        elif operator == b"TL":
+            leading = float(operands[0])
+        elif operator in (b"T*", b"'", b'"'):
+            line_y -= leading
+            x, y = line_x, line_y
+        elif operator == b"m":
+            current = (float(operands[0]), float(operands[1]))
+        elif operator == b"l" and current is not None:
+            end = (float(operands[0]), float(operands[1]))
+            dx, dy = abs(end[0] - current[0]), abs(end[1] - current[1])
+            if min(dx, dy) <= _MAX_RULE_WIDTH and max(dx, dy) >= _MIN_RULE_LENGTH:
+                stats.rules += 1
+            current = end
+        elif operator == b"re":
+            w, h = abs(float(operands[2])), abs(float(operands[3]))
+            if min(w, h) <= _MAX_RULE_WIDTH and max(w, h) >= _MIN_RULE_LENGTH:
+                stats.rules += 1
+        elif operator == b"INLINE IMAGE":
+            stats.image_area += abs(ctm[0] * ctm[3] - ctm[1] * ctm[2])
+        elif operator == b"Do" and operands:
+            xobject = xobjects.get(operands[0])
+            xobject = xobject.get_object() if xobject is not None else None
+            if xobject is None:
+                continue
+            subtype = xobject.get("/Subtype")
+            if subtype == "/Image":
+                # Images are drawn in the unit square mapped by the CTM
+                stats.image_area += abs(ctm[0] * ctm[3] - ctm[1] * ctm[2])
+            elif subtype == "/Form" and depth < _MAX_FORM_DEPTH:
+                matrix = tuple(map(float, xobject.get("/Matrix", _IDENTITY)))
+                _scan(
+                    xobject,
+                    xobject.get("/Resources", resources),
+                    _multiply(matrix, ctm),
+                    stats,
+                    depth + 1,
+                )
+
+        chars = _shown_chars(operator, operands)
+        if chars:
+            stats.chars += chars
+            stats.runs.append((round(y / _COLUMN_BUCKET), round(x / _COLUMN_BUCKET)))
+
+
+def page_stats(path: str) -> list[PageStats]:
+    """Content statistics of each page of a PDF.
+
+    Entry point for the process pool: it reads the file and walks every
+    content stream in pure Python.
+    """
+    # pypdf is slow to import; load it with the first parse
+    from pypdf import PdfReader
+
+    pages = []
+    for page in PdfReader(path).pages:
+        box = page.mediabox
+        stats = PageStats(page_area=float(box.width * box.height) or 1.0)
+        contents = page.get_contents()
+        if contents is not None:
+            _scan(contents, page.get("/Resources"), _IDENTITY, stats, 0)
+        pages.append(stats)
+    return pages
+
+
+def page_groups(kinds: list[PageKind], max_groups: int) -> list[PageGroup]:
+    """Runs of consecutive pages of the same kind, at most ``max_groups`` of them."""
+    groups: list[PageGroup] = []
+    for index, kind in enumerate(kinds):
+        if groups and groups[-1].kind == kind:
+            groups[-1].pages.append(index)
+        else:
+            groups.append(PageGroup(kind, [index]))
+
+    while len(groups) > max(max_groups, 1):
+        i = min(range(len(groups)), key=lambda g: len(groups[g].pages))
+        neighbours = [n for n in (i - 1, i + 1) if 0 <= n < len(groups)]
+        j = min(neighbours, key=lambda n: len(groups[n].pages))
+        first, second = sorted((i, j))
+        kind = max(groups[first].kind, groups[second].kind, key=_COST.__getitem__)
+        groups[first : second + 1] = [
+            PageGroup(kind, groups[first].pages + groups[second].pages)
+        ]
+        # Folding can leave two neighbours of the same kind
+        if first > 0 and groups[first - 1].kind == kind:
+            groups[first - 1 : first + 1] = [
+                PageGroup(kind, groups[first - 1].pages + groups[first].pages)
+            ]
+        if first + 1 < len(groups) and groups[first + 1].kind == kind:
+            groups[first : first + 2] = [
+                PageGroup(kind, groups[first].pages + groups[first + 1].pages)
+            ]
+    return groups
+
+
+async def classify_pages(path: str) -> list[PageKind]:
+    config = get_settings()
+    stats = await run_cpu_bound(page_stats, path)
+    return [
+        s.kind(config.PARSE_ROUTING_MIN_CHARS, config.PARSE_ROUTING_MAX_IMAGE_RATIO)
+        for s in stats
+    ]
+
+
+def merge_groups(groups: list[PageGroup], results: list[ParseResult]) -> ParseResult:
+    """Merge the group results back into one document in page order."""
+    local = []
+    for group, result in zip(groups, results):
+        if len(result.pages) != len(group.pages):
+            logger.warning(
+                "parse_group_page_mismatch | group=%s | pages=%s",
+                group,
+                len(result.pages),
+            )
+        # Jobs number their pages either from 1 or as in the full document;
+        # renumber from 1 so merging offsets them back to document order
+        pages = [
+            p.model_copy(update={"page": n}) for n, p in enumerate(result.pages, 1)
+        ]
+        local.append(
+            result.model_copy(update={"pages": pages, "page_count": len(pages)})
+        )
+    return ParseResult.merge_results(local)
+
+
+async def parse_document_routed(file: File, **kwargs) -> ParseResult:
+    """Parse one PDF, each page group with the cheapest adequate mode.
+
+    Args:
+        file: The document to parse
+        **kwargs: LlamaParse arguments shared by every group; the mode
+            arguments come from ``PAGE_MODES``. Options about how the
+            document starts (``FIRST_PAGE_OPTIONS``) only go to the group
+            holding page 1
+
+    Returns:
+        ParseResult of the whole document, as ``parse_document`` returns it
+    """
+    # Loaded with the first routed parse, like the classifier's reader
+    from pypdf.errors import PdfReadError
+
+    with span("parse_document_routed", file=file.name) as route_span:
+        try:
+            kinds = await classify_pages(file.path)
+        except (PdfReadError, OSError) as e:
+            logger.warning(
+                "parse_routing_failed | file=%s | error=%s | error_type=%s",
+                file.name,
+                e,
+                type(e).__name__,
+            )
+            return await parse_document([file], **kwargs, **PAGE_MODES["complex"])
+
+        groups = page_groups(kinds, get_settings().PARSE_ROUTING_MAX_GROUPS)
+        logger.info(
+            "parse_routed | file=%s | pages=%s | groups=%s",
+            file.name,
+            len(kinds),
+            ",".join(map(str, groups)),
+        )
+        if route_span:
+            route_span.set(groups=[str(g) for g in groups])
+        if len(groups) <= 1:
+            kind = groups[0].kind if groups else "complex"
+            return await parse_document([file], **kwargs, **PAGE_MODES[kind])
+
+        # A mid-document group must not be told it starts the document
+        rest = {k: v for k, v in kwargs.items() if k not in FIRST_PAGE_OPTIONS}
+        results = await asyncio.gather(
+            *(
+                parse_document(
+                    [file],
+                    target_pages=g.target_pages,
+                    **(kwargs if 0 in g.pages else rest),
+                    **PAGE_MODES[g.kind],
+                )
+                for g in groups
+            )
+        )
+        return merge_groups(groups, results)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Show how a PDF's pages are routed")
+    parser.add_argument("files", nargs="+", help="PDF files")
+    args = parser.parse_args()
+
+    config = get_settings()
+    for path in args.files:
+        stats = page_stats(path)
+        kinds = [
+            s.kind(config.PARSE_ROUTING_MIN_CHARS, config.PARSE_ROUTING_MAX_IMAGE_RATIO)
+            for s in stats
+        ]
+        print(path)
+        for n, (s, kind) in enumerate(zip(stats, kinds), 1):
+            print(
+                f"  page {n:>3}  {kind:<8} chars={s.chars:<6} images={s.image_ratio:.2f}"
+                f"  rules={s.rules:<4} table_rows={s.table_rows()}"
+            )
+        groups = page_groups(kinds, config.PARSE_ROUTING_MAX_GROUPS)
+        print(f"  groups: {', '.join(map(str, groups))}")
+
+
+if __name__ == "__main__":
+    main()
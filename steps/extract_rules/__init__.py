@@ -1,7 +1,10 @@
-from llama_index.core.prompts import PromptTemplate
-from utils.llm import get_llm
-
 from models import ExtractedRules, ParseResult
+from utils.llm import astructured_predict
+from utils.settings import get_settings
+
+from .map_reduce import extract_poliza_by_section
+from .policy_cache import PolicyRulesCache, get_policy_cache
+from .typed import complete_typed_rules
 
 PROMPT_EXTRACCION = """
 Eres un experto Suscriptor de Seguros (Underwriter AI).
@@ -16,17 +19,50 @@ OBJETIVOS DE EXTRACCIÓN:
    - Busca explícitamente topes de montos (ej. Pintura).
    - Busca exclusiones claras (ej. Mantenimiento).
    - IMPORTANTE: Busca la cláusula sobre "Daños Ocultos" o "Piezas Estructurales". ¿Qué condición pide para pagarlos? (ej. "Requiere evidencia/nota técnica").
+3. Reglas Estructuradas: Las mismas reglas, una entrada por concepto, con el tope como número (4000), su moneda y unidad ("por pieza"), si el concepto está excluido, la evidencia que exige y la sección donde aparece.
 
 Salida requerida: JSON basado en el esquema ExtractedRules.
 """
 
 
+def extraction_settings() -> tuple[object, ...]:
+    """Settings that change the rules extracted from the same poliza."""
+    config = get_settings()
+    return (
+        config.EXTRACTION_MODEL,
+        config.EXTRACTION_MODE,
+        config.EXTRACTION_SECTION_MAX_CHARS,
+    )
+
+
 async def extract_poliza(parse_result: ParseResult) -> ExtractedRules:
-    llm = get_llm(model="claude-sonnet-4-5")
-    prompt = PromptTemplate(PROMPT_EXTRACCION)
+    """Extract the rules of a poliza, sharing the call with concurrent claims.
 
-    return await llm.astructured_predict(
-        ExtractedRules,
-        prompt,
-        text=parse_result.markdown or parse_result.text,
+    Rules extracted before are served by the registry; the workflow looks them
+    up there (``PolicyRegistry.find_parse``) before calling this.
+    """
+    key = PolicyRulesCache.key(parse_result, *extraction_settings())
+    return await get_policy_cache().get_or_extract(
+        key, lambda: _extract_poliza(parse_result)
     )
+
+
+async def _extract_poliza(parse_result: ParseResult) -> ExtractedRules:
+    # Imported here so loading the workflow does not pull in llama_index
+    from llama_index.core.prompts import PromptTemplate
+
+    config = get_settings()
+    rules = None
+    if config.EXTRACTION_MODE == "map_reduce":
+        # None when the poliza fits in one chunk: fall through to a single call
+        rules = await extract_poliza_by_section(parse_result)
+
+    if rules is None:
+        rules = await astructured_predict(
+            ExtractedRules,
+            PromptTemplate(PROMPT_EXTRACCION),
+            model=config.EXTRACTION_MODEL,
+            text=parse_result.markdown or parse_result.text,
+        )
+
+    return complete_typed_rules(rules, parse_result)
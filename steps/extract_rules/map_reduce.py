@@ -0,0 +1,204 @@
+"""Map-reduce rule extraction for long polizas.
+
+The poliza is split into heading sections, packed into chunks of up to
+``EXTRACTION_SECTION_MAX_CHARS``, and every chunk is extracted concurrently.
+The fragments are then merged locally: near-identical rules stating the same
+amounts and percentages are deduplicated, near-identical rules stating
+different ones are both kept and flagged as a conflict, each rule keeps the
+sections it came from, and the most frequently stated deductible wins. Latency is bounded by the slowest chunk rather than by the
+length of the whole document.
+"""
+
+import asyncio
+import difflib
+import re
+import unicodedata
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+
+from models import ExtractedRules, ParseResult, SectionRules, TypedRule
+from utils.llm import astructured_predict
+from utils.logging import get_logger
+from utils.settings import get_settings
+
+from .sections import Chunk, pack_sections, split_sections
+
+logger = get_logger(__name__)
+
+# Normalized rules at least this similar, stating the same figures, are the same rule
+DUPLICATE_SIMILARITY = 0.9
+
+# "$4,500", "4500 mxn", "20%" in a normalized rule
+_FIGURE = re.compile(
+    r"\$\s*(?P<amount>\d[\d.,]*)|(?P<number>\d[\d.,]*)\s*(?P<unit>%|(?:mxn|usd|eur)\b)"
+)
+
+PROMPT_EXTRACCION_SECCION = """
+Eres un experto Suscriptor de Seguros (Underwriter AI).
+Analiza estas secciones de una Póliza de Seguro Automotriz y extrae las reglas operativas clave que contienen.
+
+SECCIONES (Markdown):
+{text}
+
+OBJETIVOS DE EXTRACCIÓN:
+1. Reglas: textos cortos resumiendo las restricciones, cada una con el nombre de la SECCIÓN de donde sale.
+   - Busca explícitamente topes de montos (ej. Pintura).
+   - Busca exclusiones claras (ej. Mantenimiento).
+   - IMPORTANTE: Busca la cláusula sobre "Daños Ocultos" o "Piezas Estructurales". ¿Qué condición pide para pagarlos? (ej. "Requiere evidencia/nota técnica").
+2. Reglas estructuradas: las mismas reglas, una entrada por concepto, con el tope como número (4000), su moneda y unidad ("por pieza"), si el concepto está excluido, la evidencia que exige y la SECCIÓN donde aparece.
+3. Deducible: el porcentaje exacto (ej. 0.05) solo si estas secciones definen el deducible general; si no, null.
+
+Si las secciones no contienen reglas relevantes, devuelve una lista vacía.
+Salida requerida: JSON basado en el esquema SectionRules.
+"""
+
+
+def _normalize(rule: str) -> str:
+    text = unicodedata.normalize("NFKD", rule.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^\w$%.,]+", " ", text).split())
+
+
+def _figures(rule: str) -> tuple[str, ...]:
+    """Amounts and percentages of a normalized rule: "$4,500.00" and "$4500" agree."""
+    figures = []
+    for match in _FIGURE.finditer(rule):
+        raw = (match.group("amount") or match.group("number")).rstrip(".,")
+        # "4,000.00" and "4.000,00": the last separator followed by 1-2 digits is decimal
+        decimal = re.search(r"[.,](\d{1,2})$", raw)
+        whole = raw[: decimal.start()] if decimal else raw
+        number = re.sub(r"[.,]", "", whole) + (
+            f".{decimal.group(1)}" if decimal else ""
+        )
+        try:
+            value = Decimal(number).normalize()
+        except InvalidOperation:
+            continue
+        figures.append(f"{value:f}%" if match.group("unit") == "%" else f"{value:f}")
+    return tuple(sorted(figures))
+
+
+def _section_of(seccion: str, chunk: Chunk) -> str:
+    """Map the section the model cited to one of the chunk's section paths."""
+    if len(chunk.paths) == 1:
+        return chunk.paths[0]
+    by_heading = {path.rsplit(" > ", 1)[-1]: path for path in chunk.paths}
+    candidates = [*chunk.paths, *by_heading]
+    match = difflib.get_close_matches(seccion, candidates, n=1, cutoff=0.0)
+    return by_heading.get(match[0], match[0]) if match else chunk.paths[0]
+
+
+def merge_fragments(
+    chunks: list[Chunk], fragments: list[SectionRules]
+) -> ExtractedRules:
+    """Merge per-chunk fragments into one ``ExtractedRules``, in document order."""
+    rules: list[str] = []
+    normalized: list[tuple[str, tuple[str, ...]]] = []
+    fuentes: dict[str, list[str]] = {}
+    typed: dict[tuple, TypedRule] = {}
+    deductibles: Counter[float] = Counter()
+    avisos: list[str] = []
+
+    for chunk, fragment in zip(chunks, fragments, strict=True):
+        if fragment.deducible is not None:
+            deductibles[fragment.deducible] += 1
+        for found in fragment.reglas:
+            text = found.regla.strip()
+            if not text:
+                continue
+            section = _section_of(found.seccion, chunk)
+            key = _normalize(text)
+            figures = _figures(key)
+            similar = [
+                i
+                for i, (seen, _) in enumerate(normalized)
+                if seen == key
+                or difflib.SequenceMatcher(None, seen, key).ratio()
+                >= DUPLICATE_SIMILARITY
+            ]
+            duplicate = next(
+                (rules[i] for i in similar if normalized[i][1] == figures), None
+            )
+            if duplicate is not None:
+                if section not in fuentes[duplicate]:
+                    fuentes[duplicate].append(section)
+                continue
+            # Same wording, different amounts: keep both and let a person decide
+            for i in similar:
+                logger.warning(
+                    "extract_rule_conflict | rule=%s | other=%s", text, rules[i]
+                )
+                avisos.append(
+                    f"Reglas en conflicto: '{rules[i]}' ({', '.join(fuentes[rules[i]])})"
+                    f" y '{text}' ({section})"
+                )
+            rules.append(text)
+            normalized.append((key, figures))
+            fuentes[text] = [section]
+        for rule in fragment.reglas_tipadas:
+            key = (
+                _normalize(rule.concepto),
+                rule.tope,
+                rule.excluido,
+                _normalize(rule.requiere_evidencia or ""),
+            )
+            typed.setdefault(
+                key,
+                rule.model_copy(
+                    update={"seccion": _section_of(rule.seccion or "", chunk)}
+                ),
+            )
+
+    if len(deductibles) > 1:
+        logger.warning("extract_deducible_conflict | deducibles=%s", dict(deductibles))
+        avisos.append(
+            "Deducibles distintos en la póliza: "
+            + ", ".join(map(str, deductibles))
+            + f"; se aplicó {deductibles.most_common(1)[0][0]}"
+        )
+    if not deductibles:
+        logger.warning("extract_deducible_missing | sections=%s", len(chunks))
+        avisos.append("La póliza no indica un deducible general; se aplicó 0")
+    # Counter keeps insertion order, so ties go to the earliest section
+    deducible = deductibles.most_common(1)[0][0] if deductibles else 0.0
+
+    return ExtractedRules(
+        reglas_clave=rules,
+        deducible=deducible,
+        reglas=list(typed.values()),
+        fuentes=fuentes,
+        avisos=avisos,
+    )
+
+
+async def extract_poliza_by_section(parse_result: ParseResult) -> ExtractedRules | None:
+    """Extract rules chunk by chunk, or None if the poliza fits in one chunk."""
+    from llama_index.core.prompts import PromptTemplate
+
+    config = get_settings()
+    max_chars = config.EXTRACTION_SECTION_MAX_CHARS
+    chunks = pack_sections(split_sections(parse_result, max_chars), max_chars)
+    if len(chunks) < 2:
+        return None
+
+    prompt = PromptTemplate(PROMPT_EXTRACCION_SECCION)
+    fragments = await asyncio.gather(
+        *(
+            astructured_predict(
+                SectionRules,
+                prompt,
+                model=config.EXTRACTION_MODEL,
+                text=chunk.render(),
+            )
+            for chunk in chunks
+        )
+    )
+    rules = merge_fragments(chunks, list(fragments))
+    logger.info(
+        "extract_map_reduce_completed | chunks=%s | sections=%s | fragments=%s | rules=%s",
+        len(chunks),
+        sum(len(chunk.sections) for chunk in chunks),
+        sum(len(fragment.reglas) for fragment in fragments),
+        len(rules.reglas_clave),
+    )
+    return rules
@@ -0,0 +1,57 @@
+"""Shared extraction of the rules of a poliza.
+
+Concurrent claims for a poliza whose rules are not known yet share a single
+extraction. Once extracted, the rules are kept by the poliza registry
+(``registry.PolicyRegistry``), which the workflow looks up first; this module
+holds no rules of its own, only the extractions in flight and the key both
+layers use.
+"""
+
+import asyncio
+import hashlib
+from collections.abc import Awaitable, Callable
+from functools import lru_cache
+
+from models import ExtractedRules, ParseResult
+from utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class PolicyRulesCache:
+    """Extractions in flight keyed by poliza content and extraction settings."""
+
+    def __init__(self):
+        self._in_flight: dict[str, asyncio.Task] = {}
+        self.shared = 0
+
+    @staticmethod
+    def key(parse_result: ParseResult, *settings: object) -> str:
+        digest = hashlib.sha256((parse_result.markdown or parse_result.text).encode())
+        for part in settings:
+            digest.update(f"\0{part}".encode())
+        return digest.hexdigest()
+
+    async def get_or_extract(
+        self, key: str, extract: Callable[[], Awaitable[ExtractedRules]]
+    ) -> ExtractedRules:
+        task = self._in_flight.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(extract())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        else:
+            self.shared += 1
+            logger.info("policy_extraction_shared | key=%s", key[:12])
+        # Shielded: a cancelled claim must not cancel the extraction others await
+        return await asyncio.shield(task)
+
+    def _done(self, key: str, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+
+
+@lru_cache
+def get_policy_cache() -> PolicyRulesCache:
+    """Get the process-wide registry of extractions in flight."""
+    return PolicyRulesCache()
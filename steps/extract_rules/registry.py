@@ -0,0 +1,277 @@
+"""Registry of poliza versions and their extracted rules.
+
+Every poliza that goes through extraction is registered once: its parse hash,
+the ``ExtractedRules``, the page of each heading and the cover metadata
+("Registro CNSF", "Producto", "Versión"). Records are stored as JSON under
+``POLICY_REGISTRY_DIR`` and the most used ones are kept in an in-process LRU,
+the only in-memory copy of extracted rules (``PolicyRulesCache`` only shares
+extractions in flight).
+
+Lookups are dictionary hits on an index kept in memory: by ``policy_id``, by
+SHA-256 of an uploaded poliza file, or by the hash of its parsed content. A
+claim whose poliza is registered therefore skips both parsing and extraction.
+File and content keys include the extraction settings, so changing the model
+or mode re-extracts instead of serving rules produced under the old ones.
+
+Versions of the same poliza form a lineage (its "Registro CNSF", or the
+product name without one); ``latest`` returns the most recently registered
+version of a lineage, whose rules speculative validation starts from.
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+
+from models import ExtractedRules, ParseResult, PolicyMetadata, PolicyRecord
+from utils.cache import ResultCache
+from utils.files import write_atomic
+from utils.logging import get_logger
+from utils.settings import get_settings
+
+from .policy_cache import PolicyRulesCache
+from .typed import heading_pages
+
+logger = get_logger(__name__)
+
+# Cover table cells: "| Registro CNSF: | H-2299-11 |" or "Registro CNSF: H-2299-11"
+_COVER_FIELDS = {
+    "registro_cnsf": r"registro\s+cnsf",
+    "producto": r"producto",
+    "version": r"versi[oó]n",
+}
+_COVER_VALUE = r"(?:^|\|)[\s*]*{label}[\s*]*:?[\s*]*(?:\|[\s*]*)?([^|\n*]+)"
+
+
+def cover_metadata(parse_result: ParseResult) -> PolicyMetadata:
+    """Identification values of the poliza's cover page."""
+    first = parse_result.pages[0] if parse_result.pages else None
+    cover = (first.md or first.text) if first else None
+    # Without pages, the start of the document stands in for the cover
+    cover = cover or (parse_result.markdown or parse_result.text)[:3000]
+    values = {}
+    for field, label in _COVER_FIELDS.items():
+        match = re.search(
+            _COVER_VALUE.format(label=label), cover, re.IGNORECASE | re.MULTILINE
+        )
+        values[field] = match.group(1).strip() if match else None
+    return PolicyMetadata(**values)
+
+
+def policy_id_for(metadata: PolicyMetadata, parse_key: str) -> str:
+    """``<Registro CNSF>@<Versión>@<key>``, or ``poliza-<key>`` without a cover.
+
+    ``parse_key`` hashes the parsed content and the extraction settings, so
+    extracting the same version under other settings, or a re-parse that reads
+    it differently, gets a record of its own instead of overwriting this one.
+    """
+    if metadata.registro_cnsf and metadata.version:
+        raw = f"{metadata.registro_cnsf}@{metadata.version}@{parse_key[:8]}"
+        return re.sub(r"[^\w.@-]+", "-", raw)
+    return f"poliza-{parse_key[:12]}"
+
+
+def lineage_for(metadata: PolicyMetadata) -> str | None:
+    """Key shared by every version of a poliza."""
+    lineage = metadata.registro_cnsf or metadata.producto
+    return re.sub(r"[^\w.-]+", "-", lineage).lower() if lineage else None
+
+
+def _file_digest(path: str | Path) -> str | None:
+    # File.path may also be a URI, which is left to the parser
+    return ResultCache.file_digest(path) if Path(path).is_file() else None
+
+
+def _scoped(digest: str, settings: tuple[object, ...]) -> str:
+    key = hashlib.sha256(digest.encode())
+    for part in settings:
+        key.update(f"\0{part}".encode())
+    return key.hexdigest()
+
+
+class PolicyRegistry:
+    """Persistent poliza versions with an LRU of hot records and an O(1) index."""
+
+    def __init__(self, directory: str | Path | None, hot_size: int):
+        self.directory = Path(directory) if directory else None
+        self.hot_size = hot_size
+        self._hot: OrderedDict[str, PolicyRecord] = OrderedDict()
+        # Scoped file digest / parse hash -> policy_id
+        self._by_file: dict[str, str] = {}
+        self._by_parse: dict[str, str] = {}
+        # Lineage -> policy_id of its most recently registered version
+        self._lineages: dict[str, str] = {}
+        self.hits = 0
+        self.misses = 0
+        # Index writes run in threads: only a newer snapshot may replace the file
+        self._save_lock = threading.Lock()
+        self._version = 0
+        self._saved_version = 0
+        self._load_index()
+
+    def _index_path(self) -> Path | None:
+        return self.directory / "index.json" if self.directory else None
+
+    def _record_path(self, policy_id: str) -> Path | None:
+        return (
+            self.directory / "records" / f"{policy_id}.json" if self.directory else None
+        )
+
+    def _load_index(self) -> None:
+        path = self._index_path()
+        if path is None or not path.exists():
+            return
+        index = json.loads(path.read_text())
+        self._by_file = index.get("files", {})
+        self._by_parse = index.get("parses", {})
+        self._lineages = index.get("lineages", {})
+        logger.info(
+            "policy_registry_loaded | directory=%s | files=%s | parses=%s",
+            self.directory,
+            len(self._by_file),
+            len(self._by_parse),
+        )
+
+    def _index_snapshot(self) -> tuple[int, dict[str, dict[str, str]]]:
+        # Copied on the loop: the thread writing them must not see later updates
+        self._version += 1
+        return self._version, {
+            "files": dict(self._by_file),
+            "parses": dict(self._by_parse),
+            "lineages": dict(self._lineages),
+        }
+
+    def _save(
+        self, record: PolicyRecord, snapshot: tuple[int, dict[str, dict[str, str]]]
+    ) -> None:
+        if self.directory is None:
+            return
+        version, index = snapshot
+        with self._save_lock:
+            write_atomic(
+                self._record_path(record.policy_id), record.model_dump_json().encode()
+            )
+            # A concurrent register may have written a later index already
+            if version > self._saved_version:
+                write_atomic(self._index_path(), json.dumps(index, indent=2).encode())
+                self._saved_version = version
+
+    def _remember(self, record: PolicyRecord) -> None:
+        self._hot[record.policy_id] = record
+        self._hot.move_to_end(record.policy_id)
+        while len(self._hot) > self.hot_size:
+            self._hot.popitem(last=False)
+
+    def get(self, policy_id: str) -> PolicyRecord | None:
+        """The record of a poliza version, from memory or from disk."""
+        record = self._hot.get(policy_id)
+        if record is not None:
+            self._hot.move_to_end(policy_id)
+            return record
+        path = self._record_path(policy_id)
+        if path is None or not path.exists():
+            return None
+        record = PolicyRecord.model_validate_json(path.read_bytes())
+        self._remember(record)
+        return record
+
+    def latest(self, lineage: str) -> PolicyRecord | None:
+        """The most recently registered version of a lineage."""
+        policy_id = self._lineages.get(lineage)
+        return self.get(policy_id) if policy_id else None
+
+    def _lookup(
+        self, index: dict[str, str], key: str, source: str
+    ) -> PolicyRecord | None:
+        policy_id = index.get(key)
+        record = self.get(policy_id) if policy_id else None
+        if record is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        logger.info("policy_registry_hit | policy_id=%s | by=%s", policy_id, source)
+        return record
+
+    async def find_file(
+        self, path: str | Path, settings: tuple[object, ...]
+    ) -> PolicyRecord | None:
+        """The registered poliza a file was parsed into, if any."""
+        digest = await asyncio.to_thread(_file_digest, path)
+        if digest is None:
+            return None
+        return self._lookup(self._by_file, _scoped(digest, settings), "file")
+
+    def find_parse(
+        self, parse_result: ParseResult, settings: tuple[object, ...]
+    ) -> PolicyRecord | None:
+        """The registered poliza with this parsed content, if any."""
+        key = PolicyRulesCache.key(parse_result, *settings)
+        return self._lookup(self._by_parse, key, "parse")
+
+    async def register(
+        self,
+        parse_result: ParseResult,
+        rules: ExtractedRules,
+        settings: tuple[object, ...],
+        file_path: str | Path | None = None,
+    ) -> PolicyRecord:
+        """Register a poliza version, or add a file to the one already registered."""
+        parse_key = PolicyRulesCache.key(parse_result, *settings)
+        digest = await asyncio.to_thread(_file_digest, file_path) if file_path else None
+
+        policy_id = self._by_parse.get(parse_key)
+        record = self.get(policy_id) if policy_id else None
+        if record is not None and rules == record.rules:
+            if digest is None or digest in record.file_digests:
+                return record
+            record = record.model_copy(
+                update={"file_digests": [*record.file_digests, digest]}
+            )
+        else:
+            parse_hash = PolicyRulesCache.key(parse_result)
+            metadata = cover_metadata(parse_result)
+            record = PolicyRecord(
+                policy_id=policy_id_for(metadata, parse_key),
+                parse_hash=parse_hash,
+                file_digests=[digest] if digest else [],
+                metadata=metadata,
+                rules=rules,
+                headings=heading_pages(parse_result),
+                registered_at=time.time(),
+            )
+            logger.info(
+                "policy_registered | policy_id=%s | producto=%s | headings=%s",
+                record.policy_id,
+                metadata.producto,
+                len(record.headings),
+            )
+            lineage = lineage_for(metadata)
+            if lineage:
+                self._lineages[lineage] = record.policy_id
+
+        self._by_parse[parse_key] = record.policy_id
+        if digest:
+            self._by_file[_scoped(digest, settings)] = record.policy_id
+        self._remember(record)
+        await asyncio.to_thread(self._save, record, self._index_snapshot())
+        return record
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hot": len(self._hot),
+            "files": len(self._by_file),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+@lru_cache
+def get_policy_registry() -> PolicyRegistry:
+    """Get the process-wide poliza registry configured from settings."""
+    config = get_settings()
+    return PolicyRegistry(config.POLICY_REGISTRY_DIR, config.POLICY_REGISTRY_HOT_SIZE)
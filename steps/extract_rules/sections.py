@@ -0,0 +1,94 @@
+"""Split a poliza into heading sections and pack them into extraction chunks."""
+
+from dataclasses import dataclass, field
+
+from models import Heading, ParseResult
+
+# Label of the content no heading section covers (cover page, section intros)
+REMAINDER = "Resto del documento"
+
+
+@dataclass
+class Section:
+    path: str
+    text: str
+
+
+@dataclass
+class Chunk:
+    """Consecutive sections sent to the model in one call."""
+
+    sections: list[Section] = field(default_factory=list)
+
+    @property
+    def size(self) -> int:
+        return sum(len(s.text) for s in self.sections)
+
+    @property
+    def paths(self) -> list[str]:
+        return [s.path for s in self.sections]
+
+    def render(self) -> str:
+        return "\n\n".join(f"### SECCIÓN: {s.path}\n{s.text}" for s in self.sections)
+
+
+def _text(result: ParseResult) -> str:
+    return result.markdown or result.text or ""
+
+
+def split_sections(parse_result: ParseResult, max_chars: int) -> list[Section]:
+    """Split the document into heading sections of at most ``max_chars``.
+
+    Sections over the limit are replaced by their subsections; a section
+    without subheadings is kept whole even if larger. Content outside every
+    chosen section (text before the first heading, or between a heading and
+    its first subheading) is gathered into one trailing ``REMAINDER`` section,
+    so nothing in the document is skipped.
+    """
+    sections: list[Section] = []
+    covered: set[int] = set()
+
+    def visit(headings: list[Heading], path: list[str]) -> None:
+        for heading in headings:
+            heading_path = [*path, heading.heading]
+            section = parse_result.get_section(heading_path)
+            if section is None:
+                continue
+            if len(_text(section)) > max_chars and heading.subheadings:
+                visit(heading.subheadings, heading_path)
+                continue
+            sections.append(Section(path=" > ".join(heading_path), text=_text(section)))
+            covered.update(id(item) for page in section.pages for item in page.items)
+
+    visit(parse_result.headings, [])
+
+    remainder_pages = []
+    for page in parse_result.pages:
+        items = [item for item in page.items if id(item) not in covered]
+        if items:
+            remainder_pages.append(
+                type(page)(
+                    page=page.page,
+                    items=items,
+                    text="\n\n".join(i.value for i in items if i.value) or None,
+                    md="\n\n".join(i.md for i in items if i.md) or None,
+                )
+            )
+    remainder = _text(parse_result.build_result_from_pages(remainder_pages))
+    if remainder.strip():
+        sections.append(Section(path=REMAINDER, text=remainder))
+    return sections
+
+
+def pack_sections(sections: list[Section], max_chars: int) -> list[Chunk]:
+    """Group consecutive sections into chunks of up to ``max_chars``."""
+    chunks: list[Chunk] = []
+    current = Chunk()
+    for section in sections:
+        if current.sections and current.size + len(section.text) > max_chars:
+            chunks.append(current)
+            current = Chunk()
+        current.sections.append(section)
+    if current.sections:
+        chunks.append(current)
+    return chunks
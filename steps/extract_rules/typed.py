@@ -0,0 +1,151 @@
+"""Local completion of the typed rules of an ``ExtractedRules``.
+
+The model fills ``ExtractedRules.reglas`` along with the prose rules. Results
+that lack them (cached before typed rules existed, or a model that skipped
+the field) are backfilled by parsing ``reglas_clave``. Either way the page of
+each rule is resolved here from the parsed document, which the model never
+sees paginated.
+"""
+
+import re
+import unicodedata
+from decimal import Decimal, InvalidOperation
+
+from models import ExtractedRules, ParseResult, TypedRule
+
+_AMOUNT = re.compile(
+    r"(?:\$\s*(?P<pre>\d[\d.,]*))|(?P<post>\d[\d.,]*)\s*(?P<code>MXN|USD|EUR|COP|ARS|CLP|PEN|UYU)\b",
+    re.IGNORECASE,
+)
+_CURRENCY = re.compile(r"\b(MXN|USD|EUR|COP|ARS|CLP|PEN|UYU)\b", re.IGNORECASE)
+_CAP = re.compile(r"\b(tope|l[ií]mite|m[aá]xim[oa]|hasta)\b", re.IGNORECASE)
+_EXCLUSION = re.compile(
+    r"\b(excluid[oa]s?|excluye\w*|exclusi[oó]n\w*|no (?:se )?(?:cubre|ampara|paga)\w*)\b",
+    re.IGNORECASE,
+)
+_EVIDENCE = re.compile(
+    r"\b(nota t[eé]cnica|evidencia(?: fotogr[aá]fica)?|dictamen(?: t[eé]cnico)?|peritaje)\b",
+    re.IGNORECASE,
+)
+_UNIT = re.compile(r"\bpor (pieza|hora|evento|d[ií]a|siniestro)\b", re.IGNORECASE)
+# Leading "Tope de", "Límite máximo para" ... before the concept
+_CAP_PREFIX = re.compile(
+    r"^\s*(?:tope|l[ií]mite)(?:\s+m[aá]ximo)?\s+(?:de|para|en)?\s*", re.IGNORECASE
+)
+# Leading "Queda excluido el", "No se cubre la" ... before the concept
+_EXCLUSION_PREFIX = re.compile(
+    r"^\s*(?:quedan?\s+)?(?:excluid\w*|se excluye\w*|exclusi[oó]n\w*:?|no se (?:cubre|ampara|paga)\w*)"
+    r"\s+(?:(?:el|la|los|las|de)\s+)*",
+    re.IGNORECASE,
+)
+# Where the concept ends: the amount, or the verb of the condition
+_CONCEPT_END = re.compile(
+    r"\$|\d|:|\(|\b(?:requiere\w*|permitid\w*|solo|s[oó]lo|con|excluid\w*|no|tope|l[ií]mite|hasta|se)\b",
+    re.IGNORECASE,
+)
+
+
+def _amount(match: re.Match) -> float | None:
+    raw = (match.group("pre") or match.group("post")).rstrip(".,")
+    # "4,000.00" and "4.000,00": the last separator followed by 1-2 digits is decimal
+    decimal = re.search(r"[.,](\d{1,2})$", raw)
+    whole = raw[: decimal.start()] if decimal else raw
+    number = re.sub(r"[.,]", "", whole) + (f".{decimal.group(1)}" if decimal else "")
+    try:
+        return float(Decimal(number))
+    except InvalidOperation:
+        return None
+
+
+def parse_rule_text(text: str) -> TypedRule | None:
+    """Typed form of a prose rule, or None if it states no cap, exclusion or evidence.
+
+    "Tope de pintura $4,000.00 MXN por pieza" becomes concepto="Pintura",
+    tope=4000.0, moneda="MXN", unidad="por pieza".
+    """
+    amount = _AMOUNT.search(text)
+    has_cap = amount is not None and (_CAP.search(text) or amount.start() > 0)
+    excluded = _EXCLUSION.search(text) is not None
+    evidence = _EVIDENCE.search(text)
+    if not (has_cap or excluded or evidence):
+        return None
+
+    body = _EXCLUSION_PREFIX.sub("", _CAP_PREFIX.sub("", text))
+    end = _CONCEPT_END.search(body)
+    concept = (body[: end.start()] if end else body).strip(" .,;-")
+    if not concept:
+        return None
+
+    currency = _CURRENCY.search(text)
+    unit = _UNIT.search(text)
+    return TypedRule(
+        concepto=concept[0].upper() + concept[1:],
+        tope=_amount(amount) if has_cap else None,
+        moneda=currency.group(1).upper() if currency else None,
+        unidad=f"por {unit.group(1).lower()}" if unit else None,
+        excluido=excluded,
+        requiere_evidencia=evidence.group(1).lower() if evidence else None,
+    )
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    return " ".join("".join(c for c in text if not unicodedata.combining(c)).split())
+
+
+def heading_pages(parse_result: ParseResult) -> dict[str, int]:
+    """First page of every heading of the parsed document, in document order."""
+    headings: dict[str, int] = {}
+    for page in parse_result.pages:
+        for item in page.items:
+            if item.type == "heading":
+                text = getattr(item, "value", getattr(item, "text", "")) or ""
+                headings.setdefault(text.strip(), page.page)
+    return headings
+
+
+def _page_index(
+    parse_result: ParseResult,
+) -> tuple[dict[str, int], list[tuple[int, str]]]:
+    """First page of every heading, and the normalized text of every page."""
+    headings: dict[str, int] = {}
+    for text, page in heading_pages(parse_result).items():
+        headings.setdefault(_normalize(text), page)
+    texts = [
+        (page.page, _normalize(page.md or page.text or ""))
+        for page in parse_result.pages
+    ]
+    return headings, texts
+
+
+def complete_typed_rules(
+    rules: ExtractedRules, parse_result: ParseResult
+) -> ExtractedRules:
+    """Backfill missing typed rules and resolve the page of each one."""
+    if rules.reglas:
+        typed = list(rules.reglas)
+    else:
+        typed = []
+        for text in rules.reglas_clave:
+            rule = parse_rule_text(text)
+            if rule is None:
+                continue
+            # Map-reduce traces each prose rule to the sections it came from
+            sources = rules.fuentes.get(text)
+            if sources:
+                rule.seccion = sources[0]
+            typed.append(rule)
+
+    headings, texts = _page_index(parse_result)
+    located = []
+    for rule in typed:
+        page = None
+        if rule.seccion:
+            # Map-reduce sections are heading paths ("SECCIÓN I > 1.3 Baremos")
+            page = headings.get(_normalize(rule.seccion.rsplit(" > ", 1)[-1]))
+        if page is None:
+            concept = _normalize(rule.concepto)
+            page = next((number for number, text in texts if concept in text), None)
+        located.append(rule.model_copy(update={"pagina": page}))
+
+    return rules.model_copy(update={"reglas": located})
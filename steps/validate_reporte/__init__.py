@@ -1,46 +1,111 @@
-from llama_index.core.prompts import PromptTemplate
+from models import ExtractedRules, FacturaValidation, ReporteValidation
+from utils.logging import get_logger
+from utils.rate_limit import claim_id_var
+from utils.settings import get_settings
 
-from models import ExtractedRules, ParseResult, ReporteValidation
-from utils.llm import get_llm
+from . import memo, rules_first, speculation
+from .batching import get_batcher
+from .preparation import PreparedReporte, prepare_reporte
+from .totals import compute_totals
+from .validation import validate_factura
 
-PROMPT_VALIDACION = """
-Eres un Auditor Financiero Estricto (Claims Auditor).
-Concilia la Factura contra las Reglas.
+__all__ = [
+    "PreparedReporte",
+    "prepare_reporte",
+    "reconcile_speculation",
+    "validate_reporte",
+]
 
-INPUT 1: REGLAS (Contexto):
-{reglas_context}
+logger = get_logger(__name__)
 
-INPUT 2: FACTURA (Markdown):
-{factura_text}
 
-INSTRUCCIONES CRÍTICAS DE DECISIÓN:
-1. CAMPO 'COSTO': Debes extraer el precio EXACTO que aparece en la factura del taller. NO lo ajustes a la baja. Si la factura dice $5,000, pon 5000.
-
-2. LOGICA DE APROBACIÓN:
-   - CASO A (RECHAZO POR PRECIO): Si el costo de la factura es MAYOR al tope de la póliza (ej. Factura $5000 vs Tope $4000), marca decision="RECHAZADO". En la explicación di: "Excede el tope de $4,000".
-   - CASO B (DAÑO OCULTO): Si es una pieza estructural nueva (Absorbedor, Alma) y hay nota técnica ("fractura", "daño"), marca decision="JUSTIFICADO_POR_NOTA".
-   - CASO C (OK): Si coincide y el precio es menor/igual al tope, marca decision="APROBADO".
+async def validate_reporte(
+    reporte: PreparedReporte, extracted_rules: ExtractedRules
+) -> ReporteValidation:
+    if not get_settings().VALIDATION_RULES_FIRST:
+        validation = await _validate_rows(reporte, extracted_rules)
+        return compute_totals(validation, extracted_rules, reporte.amounts)
 
-3. OBJETIVO VISUAL:
-   - Queremos detectar los errores. No seas permisivo. Si se pasan del tope, es RECHAZO.
+    # Rows an exclusion or a cap rejects outright never reach the model
+    rule_plan = rules_first.plan(reporte, extracted_rules)
+    validation = None
+    if rule_plan.pending:
+        validation = await _validate_rows(rule_plan.reporte, extracted_rules)
+    validation = rules_first.merge(rule_plan, validation)
 
-Salida requerida: JSON basado en el esquema ReporteValidation.
-"""
+    return compute_totals(validation, extracted_rules, reporte.amounts)
 
 
-async def validate_reporte(
-    parse_result: ParseResult, extracted_rules: ExtractedRules
+async def reconcile_speculation(
+    reporte: PreparedReporte,
+    speculative: ReporteValidation,
+    speculative_rules: ExtractedRules,
+    extracted_rules: ExtractedRules,
 ) -> ReporteValidation:
-    llm = get_llm(model="claude-sonnet-4-5")
-    prompt = PromptTemplate(PROMPT_VALIDACION)
+    """The validation under the extracted rules, reusing a speculative one.
 
-    reglas_context = f"Deducible: {extracted_rules.deducible}\nReglas:\n" + "\n".join(
-        [f"- {r}" for r in extracted_rules.reglas_clave]
-    )
+    See ``speculation`` for which items are validated again.
+    """
+    claim_id = claim_id_var.get()
+    stale = speculation.stale_items(speculative, speculative_rules, extracted_rules)
+    if not stale:
+        same = speculative_rules.deducible == extracted_rules.deducible
+        logger.info(
+            "speculation_committed | claim_id=%s | items=%s | totals=%s",
+            claim_id,
+            len(speculative.items),
+            "kept" if same else "recomputed",
+        )
+        if same:
+            return speculative
+        return compute_totals(
+            FacturaValidation(items=speculative.items, avisos=speculative.avisos),
+            extracted_rules,
+            reporte.amounts,
+        )
+
+    subset = speculation.revalidation_subset(reporte, stale)
+    if subset is None:
+        logger.info(
+            "speculation_discarded | claim_id=%s | stale=%s | reason=unmatched_rows",
+            claim_id,
+            len(stale),
+        )
+        return await validate_reporte(reporte, extracted_rules)
 
-    return await llm.astructured_predict(
-        ReporteValidation,
-        prompt,
-        reglas_context=reglas_context,
-        factura_text=parse_result.markdown or parse_result.text,
+    revalidated = await validate_reporte(subset, extracted_rules)
+    logger.info(
+        "speculation_revalidated | claim_id=%s | items=%s | stale=%s",
+        claim_id,
+        len(speculative.items),
+        len(stale),
     )
+    merged = speculation.merge_revalidated(speculative, stale, revalidated)
+    return compute_totals(merged, extracted_rules, reporte.amounts)
+
+
+async def _validate_rows(
+    reporte: PreparedReporte, extracted_rules: ExtractedRules
+) -> FacturaValidation:
+    if not memo.get_decision_memo().enabled:
+        return await _validate(reporte.factura_text, extracted_rules)
+
+    # Rows decided before are answered locally; only the rest reach the model
+    memo_plan = memo.plan(reporte, extracted_rules)
+    validation = None
+    if memo_plan.pending:
+        validation = await _validate(memo_plan.factura_text, extracted_rules)
+    return memo.merge(memo_plan, validation)
+
+
+async def _validate(
+    factura_text: str, extracted_rules: ExtractedRules
+) -> FacturaValidation:
+    config = get_settings()
+    if (
+        config.VALIDATION_BATCH_SIZE > 1
+        and len(factura_text) <= config.VALIDATION_BATCH_MAX_CHARS
+    ):
+        # Small reportes share one call with others validated against the same rules
+        return await get_batcher().submit(factura_text, extracted_rules)
+    return await validate_factura(factura_text, extracted_rules)
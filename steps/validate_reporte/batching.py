@@ -0,0 +1,178 @@
+"""Opportunistic micro-batching of small reporte validations.
+
+Reportes validated against the same rules within a short window (or until
+``VALIDATION_BATCH_SIZE`` of them are waiting) are sent to the model in a
+single structured call, and each result is routed back to the workflow that is
+awaiting it. For reportes with a handful of line items the per-request
+overhead dominates, so one call for N reportes costs far less than N calls.
+"""
+
+import asyncio
+import time
+import weakref
+from dataclasses import dataclass, field
+
+from models import ExtractedRules, FacturaValidation
+from utils.logging import get_logger
+from utils.metrics import LLMUsage, track_usage, usage_var
+from utils.rate_limit import claim_id_var
+from utils.settings import get_settings
+
+from .prompts import build_reglas_context
+from .validation import validate_factura, validate_facturas
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class _Pending:
+    claim_id: str
+    factura_text: str
+    future: asyncio.Future
+    usage: LLMUsage | None
+
+
+@dataclass
+class _Group:
+    rules: ExtractedRules
+    pending: list[_Pending] = field(default_factory=list)
+    opened_at: float = field(default_factory=time.monotonic)
+    timer: asyncio.TimerHandle | None = None
+
+
+class ValidationBatcher:
+    """Groups validations that share the same rules into batched LLM calls."""
+
+    def __init__(self, max_items: int, window_ms: float):
+        self.max_items = max_items
+        self.window = window_ms / 1000
+        self._groups: dict[str, _Group] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self.batches = 0
+        self.items = 0
+
+    async def submit(
+        self, factura_text: str, extracted_rules: ExtractedRules
+    ) -> FacturaValidation:
+        """Queue a factura for validation and wait for its result."""
+        loop = asyncio.get_running_loop()
+        key = build_reglas_context(extracted_rules)
+        group = self._groups.setdefault(key, _Group(rules=extracted_rules))
+
+        claim_id = claim_id_var.get() or f"reporte-{len(group.pending) + 1}"
+        taken = {p.claim_id for p in group.pending}
+        if claim_id in taken:
+            claim_id = f"{claim_id}-{len(group.pending) + 1}"
+
+        future = loop.create_future()
+        group.pending.append(
+            _Pending(claim_id, factura_text, future, usage=usage_var.get())
+        )
+        if len(group.pending) >= self.max_items:
+            self._flush(key)
+        elif group.timer is None:
+            group.timer = loop.call_later(self.window, self._flush, key)
+
+        return await future
+
+    def _flush(self, key: str) -> None:
+        group = self._groups.pop(key, None)
+        if group is None:
+            return
+        if group.timer is not None:
+            group.timer.cancel()
+        task = asyncio.ensure_future(self._run(group))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, group: _Group) -> None:
+        try:
+            await self._validate_batch(group)
+        except BaseException as e:
+            _fail(group.pending, e)
+            # Errors reach the waiting claims; cancellation and exits propagate
+            if not isinstance(e, Exception):
+                raise
+
+    async def _validate_batch(self, group: _Group) -> None:
+        pending = group.pending
+        started = time.monotonic()
+        facturas = {p.claim_id: p.factura_text for p in pending}
+
+        with track_usage() as usage:
+            if len(pending) == 1:
+                only = pending[0]
+                results = {
+                    only.claim_id: await validate_factura(
+                        only.factura_text, group.rules
+                    )
+                }
+            else:
+                results = await validate_facturas(facturas, group.rules)
+
+        self.batches += 1
+        self.items += len(pending)
+        logger.info(
+            "validation_batch_completed | size=%s | queued_s=%.3f | call_s=%.3f | missing=%s",
+            len(pending),
+            started - group.opened_at,
+            time.monotonic() - started,
+            len(pending) - len(results),
+        )
+
+        for p in pending:
+            # Each claim is charged an equal share of the batched call
+            if p.usage is not None:
+                p.usage.add(usage, share=1 / len(pending))
+            if p.claim_id in results:
+                if not p.future.done():
+                    p.future.set_result(results[p.claim_id])
+            else:
+                # The model dropped this claim: validate it on its own
+                task = asyncio.ensure_future(self._run_single(p, group.rules))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _run_single(self, pending: _Pending, rules: ExtractedRules) -> None:
+        try:
+            with track_usage() as usage:
+                result = await validate_factura(pending.factura_text, rules)
+        except BaseException as e:
+            _fail([pending], e)
+            if not isinstance(e, Exception):
+                raise
+            return
+        if pending.usage is not None:
+            pending.usage.add(usage)
+        # The waiting workflow may have been cancelled meanwhile
+        if not pending.future.done():
+            pending.future.set_result(result)
+
+
+def _fail(pending: list[_Pending], error: BaseException) -> None:
+    """Resolve the claims still waiting: cancelled with the batch, or failed."""
+    for p in pending:
+        if p.future.done():
+            continue
+        if isinstance(error, asyncio.CancelledError):
+            p.future.cancel()
+        else:
+            p.future.set_exception(error)
+
+
+_batchers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, ValidationBatcher]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_batcher() -> ValidationBatcher:
+    """Get the batcher of the running event loop."""
+    loop = asyncio.get_running_loop()
+    batcher = _batchers.get(loop)
+    if batcher is None:
+        config = get_settings()
+        batcher = _batchers[loop] = ValidationBatcher(
+            max_items=config.VALIDATION_BATCH_SIZE,
+            window_ms=config.VALIDATION_BATCH_WINDOW_MS,
+        )
+    return batcher
@@ -0,0 +1,148 @@
+"""Local index tying invoice line descriptions to the poliza rule governing them.
+
+Each typed rule of an ``ExtractedRules`` is indexed under its concept and the
+synonyms of that concept ("Partes Estructurales" also answers to "absorbedor",
+"larguero" ...). Terms are accent- and case-normalized and split into
+character trigrams in an inverted index. A lookup scores every candidate term
+by the share of its trigrams found in the description, so "Pintura general
+defensa" finds the painting cap in microseconds without a model call. Short
+terms carry too few trigrams to tell a word from a piece of another ("vidrio"
+is not in "vidriera"), so they must appear as whole words.
+"""
+
+import re
+import unicodedata
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import lru_cache
+
+from pydantic import TypeAdapter
+
+from models import ExtractedRules, TypedRule
+
+# Share of a term's trigrams that must appear in the description
+MATCH_THRESHOLD = 0.75
+# Terms up to this long only match as whole words (or their plural)
+SHORT_TERM_CHARS = 6
+
+# Concept -> words invoices use for it (normalized: lowercase, no accents)
+SYNONYMS: dict[str, list[str]] = {
+    "pintura": [
+        "pintura",
+        "pintar",
+        "repintado",
+        "barniz",
+        "bicapa",
+        "tricapa",
+    ],
+    "mano de obra": [
+        "mano de obra",
+        "hojalateria",
+        "instalacion",
+        "desmontaje",
+        "montaje",
+        "reparacion",
+    ],
+    "partes estructurales": [
+        "estructural",
+        "absorbedor",
+        "refuerzo",
+        "chasis",
+        "larguero",
+        "travesano",
+        "bastidor",
+    ],
+    "danos ocultos": ["oculto", "absorbedor", "refuerzo"],
+    # Not "servicio": "Servicio de grúa" is not maintenance
+    "mantenimiento": ["mantenimiento", "aceite", "filtro", "afinacion"],
+    "cristales": ["cristal", "vidrio", "parabrisas", "medallon", "aleta", "quemacocos"],
+    "espejos": ["espejo", "retrovisor"],
+}
+
+
+def normalize(text: str) -> str:
+    """Lowercase, strip accents and collapse everything but letters and digits."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text).split())
+
+
+def trigrams(text: str) -> set[str]:
+    padded = f" {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+@dataclass(frozen=True)
+class RuleMatch:
+    rule: TypedRule
+    term: str
+    score: float
+
+
+class RuleIndex:
+    """Trigram inverted index over the concepts and synonyms of typed rules."""
+
+    def __init__(self, rules: list[TypedRule]):
+        self.rules = rules
+        # term -> index of the rule it belongs to; first rule wins on shared terms
+        self._terms: dict[str, int] = {}
+        for i, rule in enumerate(rules):
+            for term in self._terms_for(rule):
+                self._terms.setdefault(term, i)
+        self._term_list = list(self._terms)
+        self._sizes = [len(trigrams(term)) for term in self._term_list]
+        self._words = {
+            t: re.compile(rf"\b{re.escape(term)}(?:e?s)?\b")
+            for t, term in enumerate(self._term_list)
+            if len(term) <= SHORT_TERM_CHARS
+        }
+        self._postings: dict[str, list[int]] = defaultdict(list)
+        for t, term in enumerate(self._term_list):
+            for gram in trigrams(term):
+                self._postings[gram].append(t)
+
+    @staticmethod
+    def _terms_for(rule: TypedRule) -> set[str]:
+        concept = normalize(rule.concepto)
+        terms = {concept}
+        for key, synonyms in SYNONYMS.items():
+            # "Pintura (por pieza)" and "Daños ocultos en piezas" both pick up their group
+            if key in concept or concept in key or concept in synonyms:
+                terms.update(synonyms)
+        return {term for term in terms if term}
+
+    def lookup(self, description: str) -> RuleMatch | None:
+        """Best-scoring rule for an item description, if any clears the threshold."""
+        text = normalize(description)
+        hits: dict[int, int] = defaultdict(int)
+        for gram in trigrams(text):
+            for t in self._postings.get(gram, ()):
+                hits[t] += 1
+        best: tuple[float, int, int] | None = None
+        for t, count in hits.items():
+            score = count / self._sizes[t]
+            # "filtro" in "infiltrometro": short terms need the whole word
+            if t in self._words and not self._words[t].search(text):
+                continue
+            # Prefer the higher score, then the longer (more specific) term
+            candidate = (score, len(self._term_list[t]), t)
+            if score >= MATCH_THRESHOLD and (best is None or candidate > best):
+                best = candidate
+        if best is None:
+            return None
+        score, _, t = best
+        term = self._term_list[t]
+        return RuleMatch(rule=self.rules[self._terms[term]], term=term, score=score)
+
+
+_RULES = TypeAdapter(list[TypedRule])
+
+
+@lru_cache(maxsize=128)
+def _build(rules_json: bytes) -> RuleIndex:
+    return RuleIndex(_RULES.validate_json(rules_json))
+
+
+def get_rule_index(extracted_rules: ExtractedRules) -> RuleIndex:
+    """The index of a rule set, built once per distinct set of typed rules."""
+    return _build(_RULES.dump_json(extracted_rules.reglas))
@@ -0,0 +1,230 @@
+"""Reuse of item decisions across reportes validated against the same rules.
+
+The same repair lines recur across many reportes. Before a factura goes to the
+model its table rows are read locally, and every row whose decision is already
+known is taken from the memo and dropped from the factura the model sees. Only
+new combinations reach the model; when every row is known there is no call.
+
+A row is keyed by its normalized description, its amount in cents, a
+fingerprint of the rules and of the model that decided it, and the narrative
+sentences naming the item (the technical note that can justify hidden damage),
+so the same item under a different note is decided again. Rows are looked up
+under ``VALIDATION_MODEL``; a decision the fallback model took is stored under
+the fallback and never answers for the primary. A sampled share of hits is
+sent to the model anyway, and a decision that changed replaces the memoized
+one. The memo is off unless ``DECISION_MEMO_SIZE`` is set.
+"""
+
+import hashlib
+import random
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from decimal import Decimal
+from functools import lru_cache
+
+from models import ExtractedRules, FacturaValidation, ItemCheck
+from utils.logging import get_logger
+from utils.rate_limit import claim_id_var
+from utils.settings import get_settings
+
+from .matching import normalize
+from .preparation import FacturaLine, PreparedReporte
+
+logger = get_logger(__name__)
+
+
+def rules_fingerprint(extracted_rules: ExtractedRules, model: str) -> str:
+    """Hash of everything besides the row itself that shapes a decision."""
+    payload = extracted_rules.model_dump_json(include={"reglas_clave", "reglas"})
+    return hashlib.sha256(f"{model}\0{payload}".encode()).hexdigest()
+
+
+class DecisionMemo:
+    """LRU of item decisions with optional expiry and sampled re-verification."""
+
+    def __init__(self, max_size: int, ttl: float = 0, verify_rate: float = 0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.verify_rate = verify_rate
+        self._entries: OrderedDict[tuple, tuple[float, ItemCheck]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.verified = 0
+        self.mismatches = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    @staticmethod
+    def key(line: FacturaLine, fingerprint: str) -> tuple:
+        return (line.normalized, line.costo, fingerprint, line.note)
+
+    def get(self, key: tuple) -> ItemCheck | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        stored_at, check = entry
+        if self.ttl and time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return check
+
+    def put(self, key: tuple, check: ItemCheck) -> None:
+        self._entries[key] = (time.monotonic(), check)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def should_verify(self) -> bool:
+        return self.verify_rate > 0 and random.random() < self.verify_rate
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 4),
+            "verified": self.verified,
+            "mismatches": self.mismatches,
+        }
+
+
+@lru_cache
+def get_decision_memo() -> DecisionMemo:
+    """Get the process-wide decision memo configured from settings."""
+    config = get_settings()
+    return DecisionMemo(
+        config.DECISION_MEMO_SIZE,
+        ttl=config.DECISION_MEMO_TTL,
+        verify_rate=config.DECISION_MEMO_VERIFY_RATE,
+    )
+
+
+@dataclass
+class MemoPlan:
+    """Which rows of a factura the memo answered and what is left for the model."""
+
+    lines: list[FacturaLine]
+    # Keys under the model the rows were looked up for
+    keys: list[tuple]
+    model: str
+    extracted_rules: ExtractedRules
+    known: dict[int, ItemCheck]
+    # Rows answered by the memo but sent to the model to check the decision
+    verifying: dict[int, ItemCheck]
+    factura_text: str
+
+    @property
+    def pending(self) -> bool:
+        """Whether any row still needs the model."""
+        return len(self.known) < len(self.lines) or not self.lines
+
+
+def plan(reporte: PreparedReporte, extracted_rules: ExtractedRules) -> MemoPlan:
+    """Answer the known rows of a factura and strip them from the model's input."""
+    memo = get_decision_memo()
+    lines = reporte.lines
+    model = get_settings().VALIDATION_MODEL
+    fingerprint = rules_fingerprint(extracted_rules, model)
+    keys = [memo.key(line, fingerprint) for line in lines]
+
+    known: dict[int, ItemCheck] = {}
+    verifying: dict[int, ItemCheck] = {}
+    for i, key in enumerate(keys):
+        check = memo.get(key)
+        if check is None:
+            continue
+        if memo.should_verify():
+            verifying[i] = check
+        else:
+            known[i] = check
+
+    text = reporte.without_rows({lines[i].line for i in known})
+    return MemoPlan(lines, keys, model, extracted_rules, known, verifying, text)
+
+
+def _same_line(line: FacturaLine, check: ItemCheck) -> bool:
+    return normalize(check.item) == line.normalized
+
+
+def merge(
+    memo_plan: MemoPlan, validation: FacturaValidation | None
+) -> FacturaValidation:
+    """Combine memoized and model decisions in factura order, memoizing the new ones.
+
+    Model items are tied to rows by description and, failing that, by a unique
+    amount. Items the model returned that match no row are kept at the end,
+    unless they repeat a row the memo already answered. A row the model left
+    without a decision is not paid and is reported in ``avisos``.
+    """
+    memo = get_decision_memo()
+    remaining = list(validation.items) if validation else []
+    items = []
+    avisos = list(validation.avisos) if validation else []
+    for i, line in enumerate(memo_plan.lines):
+        if i in memo_plan.known:
+            cached = memo_plan.known[i]
+            items.append(
+                cached.model_copy(
+                    update={"item": line.item, "costo": float(line.costo)}
+                )
+            )
+            continue
+
+        match = next((c for c in remaining if _same_line(line, c)), None)
+        if match is None:
+            same_cost = [c for c in remaining if Decimal(str(c.costo)) == line.costo]
+            match = same_cost[0] if len(same_cost) == 1 else None
+        if match is None:
+            logger.warning(
+                "decision_memo_row_missing | claim_id=%s | item=%s",
+                claim_id_var.get(),
+                line.item,
+            )
+            avisos.append(f"'{line.item}': el modelo no lo decidió, no se paga")
+            continue
+        remaining.remove(match)
+        items.append(match)
+
+        previous = memo_plan.verifying.get(i)
+        if previous is not None:
+            memo.verified += 1
+            if previous.decision != match.decision:
+                memo.mismatches += 1
+                logger.warning(
+                    "decision_memo_mismatch | claim_id=%s | item=%s | memo=%s | model=%s",
+                    claim_id_var.get(),
+                    line.item,
+                    previous.decision,
+                    match.decision,
+                )
+        key = memo_plan.keys[i]
+        if match.modelo and match.modelo != memo_plan.model:
+            key = memo.key(
+                line, rules_fingerprint(memo_plan.extracted_rules, match.modelo)
+            )
+        memo.put(key, match)
+
+    # The narrative still names rows the memo answered; the model may echo them
+    answered = {memo_plan.lines[i].normalized for i in memo_plan.known}
+    items.extend(c for c in remaining if normalize(c.item) not in answered)
+    logger.info(
+        "decision_memo | claim_id=%s | lines=%s | reused=%s | verified=%s | hit_rate=%.2f",
+        claim_id_var.get(),
+        len(memo_plan.lines),
+        len(memo_plan.known),
+        len(memo_plan.verifying),
+        memo.hit_rate,
+    )
+    return FacturaValidation(items=items, avisos=avisos)
@@ -0,0 +1,116 @@
+"""Reporte-side preparation that does not depend on the poliza rules.
+
+Choosing the factura text, reading its priced table rows, normalizing their
+descriptions and collecting every amount it mentions only need the parsed
+reporte. The workflow runs it as a step of its own as soon as the reporte is
+parsed, while the poliza is still being extracted, so validation starts with
+the factura ready.
+"""
+
+import re
+from collections.abc import Collection
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+
+from models import ParseResult
+
+from .matching import normalize
+from .totals import factura_amounts
+
+# A table cell holding only an amount: "$3,500.00", "3.500,00 MXN"
+_AMOUNT_CELL = re.compile(r"^\$?\s*\d[\d.,]*(?:\s*[A-Z]{3})?$")
+_SEPARATOR_ROW = re.compile(r"^\|?[\s:|-]+\|?$")
+_SENTENCE_END = re.compile(r"(?<=[.!?;])\s+")
+
+
+def _cell_amount(cell: str) -> Decimal | None:
+    raw = re.sub(r"[^\d.,]", "", cell).rstrip(".,")
+    # "4,000.00" and "4.000,00": the last separator followed by 1-2 digits is decimal
+    decimal = re.search(r"[.,](\d{1,2})$", raw)
+    whole = raw[: decimal.start()] if decimal else raw
+    number = re.sub(r"[.,]", "", whole) + (f".{decimal.group(1)}" if decimal else "")
+    try:
+        return Decimal(number)
+    except InvalidOperation:
+        return None
+
+
+@dataclass(frozen=True)
+class FacturaLine:
+    """A priced row of a factura table."""
+
+    line: int
+    item: str
+    # Accent- and case-normalized description, as memo keys and rule lookups use it
+    normalized: str
+    costo: Decimal
+    # Normalized sentences of the narrative naming the item ("" if none)
+    note: str
+
+    @property
+    def has_note(self) -> bool:
+        return bool(self.note)
+
+
+def factura_lines(factura_text: str) -> list[FacturaLine]:
+    """Priced table rows of a factura, with the narrative sentences naming each item.
+
+    The description is the first non-amount cell and the cost the last amount
+    cell (the row total when unit price and total are both listed).
+    """
+    rows = []
+    narrative = []
+    for number, line in enumerate(factura_text.splitlines()):
+        stripped = line.strip()
+        if not stripped.startswith("|"):
+            narrative.append(line)
+            continue
+        if _SEPARATOR_ROW.match(stripped):
+            continue
+        cells = [cell.strip() for cell in stripped.strip("|").split("|")]
+        amounts = [cell for cell in cells if _AMOUNT_CELL.match(cell)]
+        descriptions = [cell for cell in cells if cell and cell not in amounts]
+        if not amounts or not descriptions:
+            continue
+        costo = _cell_amount(amounts[-1])
+        if costo is not None:
+            rows.append((number, descriptions[0], costo))
+
+    sentences = [
+        normalize(sentence)
+        for sentence in _SENTENCE_END.split(" ".join(narrative))
+        if sentence.strip()
+    ]
+    lines = []
+    for number, item, costo in rows:
+        normalized = normalize(item)
+        note = " ".join(s for s in sentences if normalized in s)
+        lines.append(FacturaLine(number, item, normalized, costo, note))
+    return lines
+
+
+@dataclass(frozen=True)
+class PreparedReporte:
+    """A reporte's factura, read and ready to validate against any rules."""
+
+    factura_text: str
+    lines: list[FacturaLine]
+    amounts: frozenset[Decimal]
+
+    def without_rows(self, rows: Collection[int]) -> str:
+        """The factura text without the given table rows (``FacturaLine.line``)."""
+        return "\n".join(
+            line
+            for number, line in enumerate(self.factura_text.splitlines())
+            if number not in rows
+        )
+
+
+def prepare_reporte(parse_result: ParseResult) -> PreparedReporte:
+    """Read the factura of a parsed reporte."""
+    factura_text = parse_result.markdown or parse_result.text
+    return PreparedReporte(
+        factura_text=factura_text,
+        lines=factura_lines(factura_text),
+        amounts=frozenset(factura_amounts(factura_text)),
+    )
@@ -0,0 +1,83 @@
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+from models import ExtractedRules
+from utils.llm import cached_prefix_prompt
+
+if TYPE_CHECKING:
+    from llama_index.core.prompts import ChatPromptTemplate
+
+# Static instructions first and per-policy rules right after: together they form
+# a prefix that is identical for every reporte of the same policy, so the
+# provider can serve it from its prompt cache. Only the facturas vary.
+PROMPT_VALIDACION_PREFIJO = """
+Eres un Auditor Financiero Estricto (Claims Auditor).
+Concilia la Factura contra las Reglas.
+
+INSTRUCCIONES CRÍTICAS DE DECISIÓN:
+1. CAMPO 'COSTO': Debes extraer el precio EXACTO que aparece en la factura del taller. NO lo ajustes a la baja. Si la factura dice $5,000, pon 5000.
+
+2. LOGICA DE APROBACIÓN:
+   - CASO A (RECHAZO POR PRECIO): Si el costo de la factura es MAYOR al tope de la póliza (ej. Factura $5000 vs Tope $4000), marca decision="RECHAZADO". En la explicación di: "Excede el tope de $4,000".
+   - CASO B (DAÑO OCULTO): Si es una pieza estructural nueva (Absorbedor, Alma) y hay nota técnica ("fractura", "daño"), marca decision="JUSTIFICADO_POR_NOTA".
+   - CASO C (OK): Si coincide y el precio es menor/igual al tope, marca decision="APROBADO".
+
+3. NO CALCULES TOTALES: solo decide cada línea; los totales y el deducible se calculan aparte.
+
+4. OBJETIVO VISUAL:
+   - Queremos detectar los errores. No seas permisivo. Si se pasan del tope, es RECHAZO.
+
+INPUT 1: REGLAS (Contexto):
+{reglas_context}
+"""
+
+PROMPT_VALIDACION_FACTURA = """
+INPUT 2: FACTURA (Markdown):
+{factura_text}
+
+Salida requerida: JSON basado en el esquema FacturaValidation.
+"""
+
+PROMPT_VALIDACION_LOTE = """
+INPUT 2: FACTURAS (Markdown), una por reclamo:
+{facturas_text}
+
+Valida cada factura de forma independiente contra las mismas reglas.
+Salida requerida: JSON basado en el esquema BatchValidation, con un elemento por
+reclamo y el mismo claim_id indicado en su encabezado.
+"""
+
+
+# Templates are built on first use so importing the step does not load llama_index
+@lru_cache
+def validation_prompt() -> "ChatPromptTemplate":
+    """Prompt validating a single factura."""
+    return cached_prefix_prompt(PROMPT_VALIDACION_PREFIJO, PROMPT_VALIDACION_FACTURA)
+
+
+@lru_cache
+def batch_validation_prompt() -> "ChatPromptTemplate":
+    """Prompt validating several facturas under the same rules."""
+    return cached_prefix_prompt(PROMPT_VALIDACION_PREFIJO, PROMPT_VALIDACION_LOTE)
+
+
+@lru_cache(maxsize=128)
+def _format_reglas(deducible: float, reglas_clave: tuple[str, ...]) -> str:
+    return f"Deducible: {deducible}\nReglas:\n" + "\n".join(
+        [f"- {r}" for r in reglas_clave]
+    )
+
+
+def build_reglas_context(extracted_rules: ExtractedRules) -> str:
+    """Render the rules block of the prompt, once per distinct rule set."""
+    return _format_reglas(
+        extracted_rules.deducible, tuple(extracted_rules.reglas_clave)
+    )
+
+
+def format_facturas(facturas: dict[str, str]) -> str:
+    """Lay out several facturas, each under a header naming its claim."""
+    return "\n\n".join(
+        f"### RECLAMO claim_id={claim_id}\n{text}"
+        for claim_id, text in facturas.items()
+    )
@@ -0,0 +1,83 @@
+"""Factura rows the poliza's typed rules decide without the model.
+
+The validation prompt rejects an excluded concept and a cost above its cap
+whatever else the factura says. Rows that the rule index ties to such a rule
+(an exclusion, or a cap per piece, event or claim the cost exceeds) are
+rejected here and stripped from the factura the model sees; when every row is
+decided there is no call. Rows that need judgement (evidence in the technical
+note, caps per hour or per day, no matching rule) still go to the model.
+Off with ``VALIDATION_RULES_FIRST=false``.
+"""
+
+import sys
+from dataclasses import dataclass
+
+from models import ExtractedRules, FacturaValidation, ItemCheck
+from utils.logging import get_logger
+from utils.rate_limit import claim_id_var
+
+from .matching import get_rule_index, normalize
+from .preparation import PreparedReporte
+from .totals import rule_rejection
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class RulePlan:
+    """Rows the rules decided and the reporte left for the model."""
+
+    # Row number (``FacturaLine.line``) -> decision
+    decided: dict[int, ItemCheck]
+    reporte: PreparedReporte
+    # Row numbers of the full reporte, to put the items back in factura order
+    order: dict[str, int]
+
+    @property
+    def pending(self) -> bool:
+        """Whether any row still needs the model."""
+        return bool(self.reporte.lines) or not self.decided
+
+
+def plan(reporte: PreparedReporte, extracted_rules: ExtractedRules) -> RulePlan:
+    """Reject the rows a rule decides and strip them from the reporte."""
+    index = get_rule_index(extracted_rules)
+    decided: dict[int, ItemCheck] = {}
+    for line in reporte.lines:
+        match = index.lookup(line.item)
+        if match and (why := rule_rejection(match.rule, line.costo)):
+            decided[line.line] = ItemCheck(
+                item=line.item,
+                costo=float(line.costo),
+                decision="RECHAZADO",
+                explicacion=why,
+            )
+
+    order = {line.normalized: line.line for line in reporte.lines}
+    if decided:
+        logger.info(
+            "rules_first | claim_id=%s | lines=%s | decided=%s",
+            claim_id_var.get(),
+            len(reporte.lines),
+            len(decided),
+        )
+        reporte = PreparedReporte(
+            factura_text=reporte.without_rows(decided),
+            lines=[line for line in reporte.lines if line.line not in decided],
+            amounts=reporte.amounts,
+        )
+    return RulePlan(decided, reporte, order)
+
+
+def merge(
+    rule_plan: RulePlan, validation: FacturaValidation | None
+) -> FacturaValidation:
+    """The rule decisions and the model's, in factura order.
+
+    Model items that match no row by description keep their place at the end.
+    """
+    items = [*rule_plan.decided.values(), *(validation.items if validation else [])]
+    items.sort(key=lambda item: rule_plan.order.get(normalize(item.item), sys.maxsize))
+    return FacturaValidation(
+        items=items, avisos=validation.avisos if validation else []
+    )
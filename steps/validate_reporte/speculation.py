@@ -0,0 +1,118 @@
+"""Reconciliation of a reporte validated speculatively with a previous poliza version.
+
+When a new version of a registered poliza arrives, the reporte can be
+validated right away with the rules of the lineage's latest version while the
+new rules are extracted. Once they are, the two rule sets are compared:
+
+- Same rules: the speculative result is kept as is.
+- Only the deductible changed: the totals are recomputed, without the model.
+- Otherwise, only the items whose governing typed rule was added, removed or
+  changed (or now resolves to a different rule) go back to the model, as a
+  factura reduced to their rows. Items no typed rule governs depend on the
+  free-text rules and are revalidated whenever those changed.
+
+If a stale item cannot be tied to a factura row, the whole reporte is
+validated again.
+"""
+
+from decimal import Decimal
+
+from models import ExtractedRules, FacturaValidation, ItemCheck, ReporteValidation
+from utils.logging import get_logger
+from utils.rate_limit import claim_id_var
+
+from .matching import get_rule_index, normalize
+from .preparation import FacturaLine, PreparedReporte
+
+logger = get_logger(__name__)
+
+# Where a rule was found does not change the decisions it leads to
+_LOCATION_FIELDS = {"seccion", "pagina"}
+
+
+def changed_concepts(old: ExtractedRules, new: ExtractedRules) -> set[str]:
+    """Normalized concepts of the typed rules added, removed or changed."""
+    before = {
+        normalize(r.concepto): r.model_dump(exclude=_LOCATION_FIELDS)
+        for r in old.reglas
+    }
+    after = {
+        normalize(r.concepto): r.model_dump(exclude=_LOCATION_FIELDS)
+        for r in new.reglas
+    }
+    return {c for c in before.keys() | after.keys() if before.get(c) != after.get(c)}
+
+
+def stale_items(
+    validation: ReporteValidation, old: ExtractedRules, new: ExtractedRules
+) -> list[ItemCheck]:
+    """Items whose decision may differ under the new rules."""
+    changed = changed_concepts(old, new)
+    free_text_changed = set(old.reglas_clave) != set(new.reglas_clave)
+    old_index, new_index = get_rule_index(old), get_rule_index(new)
+
+    stale = []
+    for item in validation.items:
+        before, after = old_index.lookup(item.item), new_index.lookup(item.item)
+        concepts = {normalize(m.rule.concepto) for m in (before, after) if m}
+        if (
+            concepts & changed
+            or len(concepts) > 1
+            or (not concepts and free_text_changed)
+        ):
+            stale.append(item)
+    return stale
+
+
+def _row_of(item: ItemCheck, lines: list[FacturaLine]) -> FacturaLine | None:
+    name = normalize(item.item)
+    row = next((line for line in lines if line.normalized == name), None)
+    if row is None:
+        same_cost = [line for line in lines if line.costo == Decimal(str(item.costo))]
+        row = same_cost[0] if len(same_cost) == 1 else None
+    return row
+
+
+def revalidation_subset(
+    reporte: PreparedReporte, stale: list[ItemCheck]
+) -> PreparedReporte | None:
+    """The reporte reduced to the rows of the stale items, if each has one."""
+    rows = [_row_of(item, reporte.lines) for item in stale]
+    if any(row is None for row in rows):
+        return None
+    stale_rows = {row.line for row in rows}
+    return PreparedReporte(
+        factura_text=reporte.without_rows(
+            {line.line for line in reporte.lines} - stale_rows
+        ),
+        lines=[line for line in reporte.lines if line.line in stale_rows],
+        amounts=reporte.amounts,
+    )
+
+
+def merge_revalidated(
+    speculative: ReporteValidation,
+    stale: list[ItemCheck],
+    revalidated: ReporteValidation,
+) -> FacturaValidation:
+    """The speculative items with the stale ones replaced by their new decisions."""
+    remaining = list(revalidated.items)
+    items = []
+    for item in speculative.items:
+        if not any(item is s for s in stale):
+            items.append(item)
+            continue
+        name = normalize(item.item)
+        match = next((c for c in remaining if normalize(c.item) == name), None)
+        if match is None:
+            logger.warning(
+                "speculation_item_missing | claim_id=%s | item=%s",
+                claim_id_var.get(),
+                item.item,
+            )
+            items.append(item)
+            continue
+        remaining.remove(match)
+        items.append(match)
+    items.extend(remaining)
+    return FacturaValidation(items=items, avisos=revalidated.avisos)
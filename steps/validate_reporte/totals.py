@@ -0,0 +1,159 @@
+"""Exact totals and deductible application for a validated factura.
+
+The model (or, for rows a rule settles outright, ``rules_first``) only
+decides each line item. Amounts are added up here with Decimal
+arithmetic, the deductible is always applied, and each figure is rounded once
+to cents. Anything that does not add up is flagged on the result: unknown
+decisions, amounts that do not appear in the factura, a deductible outside
+``[0, 1]``, or a paid item that the rule it matches in the poliza caps below
+its cost or excludes. The warnings of the rule extraction (conflicting rules,
+a missing deductible) and of the merge of decisions (rows left undecided) are
+flagged with them.
+"""
+
+import re
+from collections.abc import Collection
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from models import ExtractedRules, FacturaValidation, ReporteValidation, TypedRule
+from utils.logging import get_logger
+from utils.rate_limit import claim_id_var
+
+from .matching import get_rule_index
+
+logger = get_logger(__name__)
+
+PAID_DECISIONS = frozenset({"APROBADO", "JUSTIFICADO_POR_NOTA"})
+DECISIONS = PAID_DECISIONS | {"RECHAZADO"}
+CENTS = Decimal("0.01")
+# Caps stated per hour or per day cannot be compared with a line total
+_ITEM_CAP_UNITS = {None, "por pieza", "por evento", "por siniestro"}
+
+# "5000", "5,000.00", "5.000,00"
+_AMOUNT = re.compile(r"\d{1,3}(?:[.,]\d{3})+(?:[.,]\d{1,2})?|\d+(?:[.,]\d{1,2})?")
+
+
+def _decimal(value: float) -> Decimal:
+    # Through str, so 0.1 stays 0.1 instead of its binary expansion
+    return Decimal(str(value))
+
+
+def _cents(value: Decimal) -> Decimal:
+    return value.quantize(CENTS, rounding=ROUND_HALF_UP)
+
+
+def factura_amounts(text: str) -> set[Decimal]:
+    """Every amount written in the factura, read both as 1,234.56 and 1.234,56."""
+    amounts = set()
+    for match in _AMOUNT.findall(text):
+        for thousands, decimal in ((",", "."), (".", ",")):
+            number = match.replace(thousands, "").replace(decimal, ".")
+            try:
+                amounts.add(_cents(Decimal(number)))
+            except InvalidOperation:
+                continue
+    return amounts
+
+
+def _deducible(value: float, issues: list[str]) -> Decimal:
+    deducible = _decimal(value)
+    if 1 < deducible <= 100:
+        # Extracted as a percentage (20) instead of a fraction (0.20)
+        issues.append(f"Deducible {value} interpretado como {deducible}%")
+        return deducible / 100
+    if not 0 <= deducible <= 1:
+        issues.append(f"Deducible fuera de rango: {value}")
+        return min(max(deducible, Decimal(0)), Decimal(1))
+    return deducible
+
+
+def rule_rejection(rule: TypedRule, costo: Decimal) -> str | None:
+    """Why the rule rejects an item outright, or None if it leaves it to judgement.
+
+    An excluded concept, or a cost above a cap per piece, event or claim.
+    """
+    if rule.excluido:
+        return f"{rule.concepto} está excluido"
+    if (
+        rule.tope is not None
+        and rule.unidad in _ITEM_CAP_UNITS
+        and costo > _decimal(rule.tope)
+    ):
+        return f"Excede el tope de ${rule.tope:,.2f} ({rule.concepto})"
+    return None
+
+
+def compute_totals(
+    validation: FacturaValidation,
+    extracted_rules: ExtractedRules,
+    amounts: Collection[Decimal],
+) -> ReporteValidation:
+    """Add up the payable items and apply the deductible.
+
+    Args:
+        validation: Per-item decisions returned by the model
+        extracted_rules: Rules holding the deductible
+        amounts: Amounts written in the factura (``factura_amounts``), to check
+            the items' costs
+
+    Returns:
+        The validation with its totals and any inconsistencies found
+    """
+    issues = [*extracted_rules.avisos, *validation.avisos]
+    deducible = _deducible(extracted_rules.deducible, issues)
+    index = get_rule_index(extracted_rules)
+
+    subtotal = Decimal(0)
+    items = []
+    unmatched = 0
+    for item in validation.items:
+        costo = _decimal(item.costo)
+        decision = item.decision.strip().upper()
+        match = index.lookup(item.item)
+        rule = match.rule if match else None
+        unmatched += rule is None
+        items.append(
+            item.model_copy(update={"regla_aplicada": rule.concepto if rule else None})
+        )
+        if decision not in DECISIONS:
+            issues.append(
+                f"'{item.item}': decisión desconocida '{item.decision}', no se paga"
+            )
+        elif decision in PAID_DECISIONS:
+            subtotal += costo
+            if rule is not None and (why := rule_rejection(rule, costo)):
+                issues.append(f"'{item.item}': pagado pese a la póliza ({why})")
+        if costo < 0:
+            issues.append(f"'{item.item}': costo negativo {item.costo:,.2f}")
+        if _cents(abs(costo)) not in amounts:
+            issues.append(
+                f"'{item.item}': el costo {item.costo:,.2f} no aparece en la factura"
+            )
+
+    logger.info(
+        "rule_matching | items=%s | matched=%s | unmatched=%s",
+        len(items),
+        len(items) - unmatched,
+        unmatched,
+    )
+
+    subtotal = _cents(subtotal)
+    monto_deducible = _cents(subtotal * deducible)
+    total = subtotal - monto_deducible
+
+    if issues:
+        logger.warning(
+            "validation_totals_inconsistent | claim_id=%s | issues=%s",
+            claim_id_var.get(),
+            issues,
+        )
+
+    return ReporteValidation(
+        items=items,
+        subtotal_aprobado=float(subtotal),
+        deducible=float(deducible),
+        monto_deducible=float(monto_deducible),
+        total_aprobado=float(total),
+        inconsistencias=issues,
+        avisos=validation.avisos,
+    )
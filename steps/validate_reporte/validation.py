@@ -0,0 +1,54 @@
+from models import BatchValidation, ExtractedRules, FacturaValidation, ItemCheck
+from utils.llm import astructured_predict_with_model
+from utils.settings import get_settings
+
+from .prompts import (
+    batch_validation_prompt,
+    build_reglas_context,
+    format_facturas,
+    validation_prompt,
+)
+
+
+def _decided_by(items: list[ItemCheck], model: str) -> list[ItemCheck]:
+    return [item.model_copy(update={"modelo": model}) for item in items]
+
+
+async def validate_factura(
+    factura_text: str, extracted_rules: ExtractedRules
+) -> FacturaValidation:
+    """Validate a single factura with its own LLM call."""
+    validation, model = await astructured_predict_with_model(
+        FacturaValidation,
+        validation_prompt(),
+        model=get_settings().VALIDATION_MODEL,
+        reglas_context=build_reglas_context(extracted_rules),
+        factura_text=factura_text,
+    )
+    return FacturaValidation(items=_decided_by(validation.items, model))
+
+
+async def validate_facturas(
+    facturas: dict[str, str], extracted_rules: ExtractedRules
+) -> dict[str, FacturaValidation]:
+    """Validate several facturas against the same rules in one LLM call.
+
+    Args:
+        facturas: Factura text keyed by claim ID
+        extracted_rules: Rules shared by every factura
+
+    Returns:
+        Validations keyed by claim ID; claims the model left out are missing
+    """
+    batch, model = await astructured_predict_with_model(
+        BatchValidation,
+        batch_validation_prompt(),
+        model=get_settings().VALIDATION_MODEL,
+        reglas_context=build_reglas_context(extracted_rules),
+        facturas_text=format_facturas(facturas),
+    )
+    return {
+        result.claim_id: FacturaValidation(items=_decided_by(result.items, model))
+        for result in batch.reportes
+        if result.claim_id in facturas
+    }
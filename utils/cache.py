@@ -0,0 +1,115 @@
+"""On-disk cache of parse results and LLM outputs.
+
+Entries are keyed by a hash of everything that determines the result (file
+contents and parse options, or model, output schema and rendered prompt) and
+stored as gzipped JSON under ``CACHE_DIR``. With ``CACHE_MODE=only`` results
+are served exclusively from the cache, so replay workers and offline
+benchmarks run without any provider credentials.
+"""
+
+import asyncio
+import gzip
+import hashlib
+import json
+from collections.abc import Awaitable, Callable
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, TypeVar
+
+from pydantic import BaseModel
+
+from utils.files import write_atomic
+from utils.logging import get_logger
+from utils.settings import get_settings
+
+logger = get_logger(__name__)
+
+Model = TypeVar("Model", bound=BaseModel)
+
+
+class CacheMissError(LookupError):
+    """Raised in cache-only mode when a result is not in the cache."""
+
+
+class ResultCache:
+    """Content-addressed store of pydantic results, one file per entry."""
+
+    def __init__(self, directory: str | Path, mode: str = "off"):
+        self.directory = Path(directory)
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    @staticmethod
+    def key(*parts: Any) -> str:
+        """Stable hash of JSON-serializable key parts."""
+        payload = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    @staticmethod
+    def file_digest(path: str | Path) -> str:
+        """SHA-256 of a file's contents."""
+        with open(path, "rb") as f:
+            return hashlib.file_digest(f, "sha256").hexdigest()
+
+    def _path(self, namespace: str, key: str) -> Path:
+        return self.directory / namespace / key[:2] / f"{key}.json.gz"
+
+    def get(self, namespace: str, key: str, model_cls: type[Model]) -> Model | None:
+        path = self._path(namespace, key)
+        try:
+            data = gzip.decompress(path.read_bytes())
+        except FileNotFoundError:
+            return None
+        return model_cls.model_validate_json(data)
+
+    def put(self, namespace: str, key: str, value: BaseModel) -> None:
+        data = gzip.compress(value.model_dump_json().encode(), compresslevel=6)
+        # Concurrent readers never see a partial entry
+        write_atomic(self._path(namespace, key), data)
+
+    async def get_or_compute(
+        self,
+        namespace: str,
+        key: str,
+        model_cls: type[Model],
+        compute: Callable[[], Awaitable[Model]],
+        keep: Callable[[], bool] | None = None,
+    ) -> Model:
+        """Return the cached result, or compute and store it.
+
+        ``keep`` is checked once ``compute`` returns; a result it rejects is
+        returned without being stored.
+
+        Raises:
+            CacheMissError: In cache-only mode, when the result is not cached
+        """
+        if not self.enabled:
+            return await compute()
+
+        cached = await asyncio.to_thread(self.get, namespace, key, model_cls)
+        if cached is not None:
+            self.hits += 1
+            logger.info("cache_hit | namespace=%s | key=%s", namespace, key[:12])
+            return cached
+
+        self.misses += 1
+        if self.mode == "only":
+            raise CacheMissError(f"No cached {namespace} result for key {key}")
+
+        logger.info("cache_miss | namespace=%s | key=%s", namespace, key[:12])
+        result = await compute()
+        if keep is None or keep():
+            await asyncio.to_thread(self.put, namespace, key, result)
+        return result
+
+
+@lru_cache
+def get_cache() -> ResultCache:
+    """Get the process-wide result cache configured from settings."""
+    config = get_settings()
+    return ResultCache(config.CACHE_DIR, config.CACHE_MODE)
@@ -0,0 +1,479 @@
+"""Capture of workflow step inputs and outputs for reproducing runs.
+
+With ``DEBUG`` on, every step of a run keeps a reference to its input event,
+its output and its timing. References are all a run pays for: nothing is
+serialized unless the run is kept when it ends, which happens when it failed,
+took longer than ``DEBUG_CAPTURE_SLOW_S``, or was sampled at
+``DEBUG_CAPTURE_RATE``. A kept run is serialized compactly (no ``None``
+fields, no raw LlamaParse JSON, gzipped) and written off the event loop to
+``DEBUG_CAPTURE_DIR``, a ring buffer that drops the oldest captures beyond
+``DEBUG_CAPTURE_MAX_RUNS`` files or ``DEBUG_CAPTURE_MAX_MB``.
+
+The documents a run starts from outlive it only as long as their owner keeps
+them: the server deletes its uploads and ingest archives the inbox. They are
+hard-linked next to the capture when the run starts, which costs no copy, and
+unlinked when the run is not kept; when linking fails (another filesystem)
+they are copied once the run is kept. The capture records each document's
+SHA-256, and a rerun uses the original file while it still matches, else the
+kept one.
+
+Capture files are named after the run's start time and ``task_id``, so a slow
+or failed run found in the logs or traces leads straight to its inputs:
+
+    uv run python -m utils.capture                          # Stored captures
+    uv run python -m utils.capture <file> --step parse_step # Input and output
+    uv run python -m utils.capture <file> --rerun           # Run it again
+"""
+
+import argparse
+import asyncio
+import functools
+import gzip
+import importlib
+import json
+import os
+import random
+import shutil
+import threading
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, ParamSpec, TypeVar
+
+from pydantic import BaseModel
+from workflows.events import Event, StartEvent
+
+from models import File, ParseResult
+from utils.cache import ResultCache
+from utils.files import write_atomic
+from utils.logging import get_logger
+from utils.settings import get_settings
+
+logger = get_logger(__name__)
+
+# Kept runs waiting to be written before new ones are dropped
+_MAX_PENDING = 8
+# Settings left out of the capture
+_SECRET_MARKERS = ("KEY", "SECRET", "TOKEN", "PASSWORD")
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+
+@dataclass
+class StepCapture:
+    """One step execution: its input event, its output and when it ran."""
+
+    step: str
+    started_s: float
+    duration_s: float
+    input: Any
+    output: Any = None
+    error: str | None = None
+
+
+@dataclass
+class CapturedInput:
+    """A document the run started from and its link next to the capture."""
+
+    file: File
+    # None until linked or copied
+    kept: Path | None = None
+
+
+@dataclass
+class RunCapture:
+    """Steps of one run, held by reference until the run ends."""
+
+    run_id: str
+    sampled: bool
+    started_at: float = field(default_factory=time.time)
+    started: float = field(default_factory=time.perf_counter)
+    steps: list[StepCapture] = field(default_factory=list)
+    inputs: list[CapturedInput] = field(default_factory=list)
+
+    @property
+    def name(self) -> str:
+        """File name stem shared by the capture and its inputs directory."""
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime(self.started_at))
+        return f"{stamp}-{self.run_id[:16]}"
+
+
+capture_var: ContextVar[RunCapture | None] = ContextVar("run_capture", default=None)
+
+
+@contextmanager
+def capturing(run_id: str) -> Iterator[RunCapture | None]:
+    """Make a new run capture current in this block; ``None`` with ``DEBUG`` off."""
+    config = get_settings()
+    if not config.DEBUG:
+        yield None
+        return
+    capture = RunCapture(run_id, sampled=random.random() < config.DEBUG_CAPTURE_RATE)
+    token = capture_var.set(capture)
+    try:
+        yield capture
+    finally:
+        capture_var.reset(token)
+
+
+def captured(func: Callable[P, Awaitable[R]]) -> Callable[P, Awaitable[R]]:
+    """Record a workflow step's input event and output in the run's capture."""
+
+    @functools.wraps(func)
+    async def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+        capture = capture_var.get()
+        if capture is None:
+            return await func(*args, **kwargs)
+
+        ev = next((a for a in [*args, *kwargs.values()] if isinstance(a, Event)), None)
+        if isinstance(ev, StartEvent):
+            get_capture_store().link_inputs(capture, ev.get("files", []))
+        started = time.perf_counter()
+        record = StepCapture(func.__name__, started - capture.started, 0.0, ev)
+        capture.steps.append(record)
+        try:
+            record.output = await func(*args, **kwargs)
+            return record.output
+        except BaseException as e:
+            record.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            record.duration_s = time.perf_counter() - started
+
+    return wrapper
+
+
+def finish_capture(capture: RunCapture | None, error: BaseException | None) -> None:
+    """Write the run's capture if it failed, was slow or was sampled."""
+    if capture is None:
+        return
+    duration_s = time.perf_counter() - capture.started
+    slow_s = get_settings().DEBUG_CAPTURE_SLOW_S
+    if error is not None:
+        reason = "error"
+    elif slow_s is not None and duration_s >= slow_s:
+        reason = "slow"
+    elif capture.sampled:
+        reason = "sampled"
+    else:
+        get_capture_store().discard(capture)
+        return
+    get_capture_store().save(capture, duration_s, reason, error)
+
+
+def compact(value: Any) -> Any:
+    """JSON-ready form of an event or output, without ``None`` fields or raw parse JSON."""
+    if not isinstance(value, BaseModel):
+        return value
+    # Raw LlamaParse JSON repeats the pages, which are kept
+    exclude = {
+        name: {"raw_json"}
+        for name in type(value).model_fields
+        if isinstance(getattr(value, name, None), ParseResult)
+    }
+    return {
+        "type": f"{type(value).__module__}.{type(value).__qualname__}",
+        "data": value.model_dump(mode="json", exclude_none=True, exclude=exclude),
+    }
+
+
+def load_event(payload: dict[str, Any]) -> Any:
+    """Rebuild an event from its ``compact`` form."""
+    module, _, name = payload["type"].rpartition(".")
+    cls = getattr(importlib.import_module(module), name)
+    data = payload["data"]
+    if issubclass(cls, StartEvent):
+        # Start event fields are free-form: restore the documents they carry
+        fields = dict(data.get("_data", data))
+        if "files" in fields:
+            fields["files"] = [File.model_validate(f) for f in fields["files"]]
+        return cls(**fields)
+    return cls.model_validate(data)
+
+
+def _settings_snapshot() -> dict[str, Any]:
+    return {
+        name: value
+        for name, value in get_settings().model_dump(mode="json").items()
+        if not any(marker in name for marker in _SECRET_MARKERS)
+    }
+
+
+class CaptureStore:
+    """Directory of gzipped run captures bounded by count and total size."""
+
+    def __init__(self, directory: str | Path, max_runs: int, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_runs = max_runs
+        self.max_bytes = max_bytes
+        self.saved = 0
+        self.dropped = 0
+        self._slots = threading.Semaphore(_MAX_PENDING)
+        self._lock = threading.Lock()
+        # (path, size) oldest first; read from disk on the first write
+        self._files: deque[tuple[Path, int]] | None = None
+
+    def _inputs_dir(self, name: str) -> Path:
+        return self.directory / f"{name}.inputs"
+
+    def link_inputs(self, capture: RunCapture, files: list[File]) -> None:
+        """Hard-link the run's documents next to its future capture.
+
+        A link is a metadata operation, cheap enough for the event loop; the
+        documents are only copied, off the loop, if the run is kept.
+        """
+        directory = self._inputs_dir(capture.name)
+        for i, file in enumerate(files):
+            entry = CapturedInput(file)
+            capture.inputs.append(entry)
+            target = directory / f"{i}-{Path(file.name).name}"
+            try:
+                directory.mkdir(parents=True, exist_ok=True)
+                os.link(file.path, target)
+            except OSError:
+                continue
+            entry.kept = target
+
+    def discard(self, capture: RunCapture) -> None:
+        """Drop the linked documents of a run that is not kept."""
+        if not any(entry.kept for entry in capture.inputs):
+            return
+        directory = self._inputs_dir(capture.name)
+        try:
+            asyncio.get_running_loop().run_in_executor(
+                None, shutil.rmtree, directory, True
+            )
+        except RuntimeError:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def _keep_inputs(self, capture: RunCapture) -> tuple[list[dict[str, Any]], int]:
+        """Digest of every document, copying those that could not be linked."""
+        directory = self._inputs_dir(capture.name)
+        inputs = []
+        size = 0
+        for i, entry in enumerate(capture.inputs):
+            target = directory / f"{i}-{Path(entry.file.name).name}"
+            if entry.kept is None:
+                try:
+                    directory.mkdir(parents=True, exist_ok=True)
+                    shutil.copyfile(entry.file.path, target)
+                    entry.kept = target
+                except OSError as e:
+                    logger.warning(
+                        "capture_input_lost | run_id=%s | file=%s | error=%s",
+                        capture.run_id[:16],
+                        entry.file.name,
+                        e,
+                    )
+            digest = None
+            if entry.kept is not None:
+                digest = ResultCache.file_digest(entry.kept)
+                size += entry.kept.stat().st_size
+            inputs.append(
+                {
+                    "name": entry.file.name,
+                    "path": entry.file.path,
+                    "sha256": digest,
+                    "kept": entry.kept.name if entry.kept else None,
+                }
+            )
+        return inputs, size
+
+    def save(
+        self,
+        capture: RunCapture,
+        duration_s: float,
+        reason: str,
+        error: BaseException | None,
+    ) -> None:
+        if not self._slots.acquire(blocking=False):
+            self.dropped += 1
+            logger.warning("capture_dropped | run_id=%s", capture.run_id[:16])
+            return
+        error_text = f"{type(error).__name__}: {error}" if error else None
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write(capture, duration_s, reason, error_text)
+        else:
+            # Serialization and file I/O stay off the event loop
+            loop.run_in_executor(
+                None, self._write, capture, duration_s, reason, error_text
+            )
+
+    def _write(
+        self,
+        capture: RunCapture,
+        duration_s: float,
+        reason: str,
+        error: str | None,
+    ) -> None:
+        try:
+            inputs, inputs_size = self._keep_inputs(capture)
+            payload = {
+                "run_id": capture.run_id,
+                "reason": reason,
+                "started_at": capture.started_at,
+                "duration_s": round(duration_s, 3),
+                "error": error,
+                "settings": _settings_snapshot(),
+                "inputs": inputs,
+                "steps": [
+                    {
+                        "step": s.step,
+                        "started_s": round(s.started_s, 3),
+                        "duration_s": round(s.duration_s, 3),
+                        "input": compact(s.input),
+                        "output": compact(s.output),
+                        "error": s.error,
+                    }
+                    for s in capture.steps
+                ],
+            }
+            data = gzip.compress(
+                json.dumps(payload, ensure_ascii=False, default=str).encode(),
+                compresslevel=6,
+            )
+            path = self.directory / f"{capture.name}.json.gz"
+            with self._lock:
+                write_atomic(path, data)
+                self._rotate(path, len(data) + inputs_size)
+                self.saved += 1
+            logger.info(
+                "capture_saved | run_id=%s | reason=%s | steps=%s | bytes=%s",
+                capture.run_id[:16],
+                reason,
+                len(capture.steps),
+                len(data),
+            )
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(
+                "capture_failed | run_id=%s | error=%s", capture.run_id[:16], e
+            )
+        finally:
+            self._slots.release()
+
+    def _footprint(self, path: Path) -> int:
+        """Bytes of a capture file and of the documents kept with it."""
+        inputs = self._inputs_dir(path.name.removesuffix(".json.gz"))
+        kept = inputs.iterdir() if inputs.is_dir() else ()
+        return path.stat().st_size + sum(p.stat().st_size for p in kept)
+
+    def _rotate(self, path: Path, size: int) -> None:
+        if self._files is None:
+            self._files = deque(
+                (p, self._footprint(p))
+                for p in sorted(self.directory.glob("*.json.gz"))
+                if p != path
+            )
+        self._files.append((path, size))
+        total = sum(s for _, s in self._files)
+        while len(self._files) > 1 and (
+            len(self._files) > self.max_runs or total > self.max_bytes
+        ):
+            oldest, oldest_size = self._files.popleft()
+            oldest.unlink(missing_ok=True)
+            shutil.rmtree(
+                self._inputs_dir(oldest.name.removesuffix(".json.gz")),
+                ignore_errors=True,
+            )
+            total -= oldest_size
+
+    def stats(self) -> dict[str, int]:
+        return {"saved": self.saved, "dropped": self.dropped}
+
+
+@lru_cache
+def get_capture_store() -> CaptureStore:
+    """Get the process-wide capture store configured from settings."""
+    config = get_settings()
+    return CaptureStore(
+        config.DEBUG_CAPTURE_DIR,
+        config.DEBUG_CAPTURE_MAX_RUNS,
+        int(config.DEBUG_CAPTURE_MAX_MB * 1024 * 1024),
+    )
+
+
+def read_capture(path: str | Path) -> dict[str, Any]:
+    return json.loads(gzip.decompress(Path(path).read_bytes()))
+
+
+def _input_path(entry: dict[str, Any], inputs_dir: Path) -> str:
+    """The original document while it still matches its digest, else the kept one."""
+    original = Path(entry["path"])
+    if original.is_file() and ResultCache.file_digest(original) == entry["sha256"]:
+        return str(original)
+    if entry["kept"] and (inputs_dir / entry["kept"]).is_file():
+        return str(inputs_dir / entry["kept"])
+    raise FileNotFoundError(
+        f"{entry['name']} is gone from {original} and was not kept with the capture"
+    )
+
+
+async def rerun(capture: dict[str, Any], path: str | Path) -> Any:
+    """Run the workflow again from a capture's start event and its documents."""
+    from workflow import Demo
+
+    timeout = get_settings().WORKFLOW_SERVER_RUN_TIMEOUT
+    start = next(s for s in capture["steps"] if s["step"] == "start")
+    event = load_event(start["input"])
+    inputs = capture.get("inputs") or []
+    if inputs:
+        inputs_dir = Path(path).with_name(
+            Path(path).name.removesuffix(".json.gz") + ".inputs"
+        )
+        paths = await asyncio.to_thread(
+            lambda: [_input_path(entry, inputs_dir) for entry in inputs]
+        )
+        event.files = [
+            file.model_copy(update={"path": p})
+            for file, p in zip(event.files, paths, strict=True)
+        ]
+    return await Demo(timeout=timeout).run(start_event=event)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect captured workflow runs")
+    parser.add_argument("file", nargs="?", help="Capture file (lists all if omitted)")
+    parser.add_argument("--step", help="Print this step's input and output")
+    parser.add_argument("--rerun", action="store_true", help="Run the workflow again")
+    args = parser.parse_args()
+
+    if args.file is None:
+        for path in sorted(Path(get_settings().DEBUG_CAPTURE_DIR).glob("*.json.gz")):
+            capture = read_capture(path)
+            print(
+                f"{path.name}  {capture['reason']:<8} {capture['duration_s']:8.3f}s"
+                f"  {capture['error'] or ''}"
+            )
+        return
+
+    capture = read_capture(args.file)
+    if args.rerun:
+        result = asyncio.run(rerun(capture, args.file))
+        print(json.dumps(result, indent=2, ensure_ascii=False, default=str))
+        return
+    if args.step:
+        for s in capture["steps"]:
+            if s["step"] == args.step:
+                print(json.dumps(s, indent=2, ensure_ascii=False))
+        return
+
+    print(f"run {capture['run_id']}  {capture['duration_s']:.3f}s  {capture['reason']}")
+    for s in capture["steps"]:
+        in_type = (s["input"] or {}).get("type", "-").rpartition(".")[2]
+        out_type = (s["output"] or {}).get("type", "-").rpartition(".")[2]
+        print(
+            f"  {s['started_s']:8.3f}s {s['duration_s']:8.3f}s  {s['step']:<24}"
+            f" {in_type} -> {out_type}  {s['error'] or ''}"
+        )
+
+
+if __name__ == "__main__":
+    main()
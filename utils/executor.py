@@ -0,0 +1,73 @@
+"""Process pool for CPU-bound document transforms.
+
+Parsing results are turned into ``ParseResult`` models, merged and re-indexed in
+pure Python. Those transforms run here, outside the asyncio loop, so concurrent
+workflow steps keep serving network I/O.
+"""
+
+import asyncio
+import multiprocessing
+import os
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from typing import Any, TypeVar
+
+from utils.logging import get_logger
+from utils.settings import get_settings
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+
+@lru_cache
+def get_process_pool() -> ProcessPoolExecutor | None:
+    """Get the shared process pool, or None when CPU work runs inline.
+
+    Workers are started with ``spawn`` so the pool is safe to create from the
+    threaded Streamlit runtime.
+    """
+    workers = get_settings().CPU_WORKERS
+    if workers == 0:
+        return None
+
+    max_workers = workers or os.cpu_count() or 1
+    logger.info("process_pool_started | max_workers=%s", max_workers)
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+
+async def run_cpu_bound(fn: Callable[..., T], /, *args: Any, **kwargs: Any) -> T:
+    """Run a CPU-bound callable in the process pool.
+
+    Arguments and return values cross the process boundary by pickling, so
+    ``fn`` must be importable by name (a module-level function or a static
+    method) and its inputs plain data or pydantic models.
+
+    Args:
+        fn: Importable callable to execute
+        *args: Positional arguments for ``fn``
+        **kwargs: Keyword arguments for ``fn``
+
+    Returns:
+        The value returned by ``fn``
+    """
+    call = partial(fn, *args, **kwargs)
+    pool = get_process_pool()
+    if pool is None:
+        return call()
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(pool, call)
+
+
+def shutdown_process_pool() -> None:
+    """Shut down the shared process pool, if one was started."""
+    if get_process_pool.cache_info().currsize:
+        pool = get_process_pool()
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        get_process_pool.cache_clear()
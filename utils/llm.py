@@ -1,11 +1,32 @@
-"""LLM client factory."""
+"""LLM client factory and resilient structured calls."""
 
+import asyncio
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
 from functools import lru_cache
+from typing import TYPE_CHECKING, Any, TypeVar
 
-from llama_index.llms.anthropic import Anthropic
-from llama_index.llms.openai import OpenAI
+import httpx
+from pydantic import BaseModel, ValidationError
 
+from utils.cache import CacheMissError, get_cache
+from utils.logging import get_logger
+from utils.metrics import LLMUsage, record_usage, response_usage
+from utils.rate_limit import estimate_tokens, get_scheduler
 from utils.settings import get_settings
+from utils.tracing import span
+
+if TYPE_CHECKING:
+    from llama_index.core.prompts import BasePromptTemplate, ChatPromptTemplate
+
+logger = get_logger(__name__)
+
+Model = TypeVar("Model", bound=BaseModel)
+
+# HTTP statuses worth retrying: timeouts, conflicts, rate limits, overload
+_TRANSIENT_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
 
 
 @lru_cache
@@ -18,16 +39,19 @@ def get_llm_OpenAI(model: str):
     Raises:
         ValueError: If required credentials are missing
     """
-    config = get_settings()
+    # Provider SDKs take seconds to import; load them with the first client
+    from llama_index.llms.openai import OpenAI
 
-    if not config.OPENAI_API_KEY:
-        raise ValueError("OPENAI_API_KEY is required")
+    config = get_settings()
+    config.require_credentials("OPENAI_API_KEY")
 
     return OpenAI(
         model=model,
         api_key=config.OPENAI_API_KEY,
         max_output_tokens=30000,
-        timeout=1000,
+        # Deadlines and retries are enforced per call by astructured_predict
+        timeout=config.LLM_DEADLINE_MAX,
+        max_retries=0,
     )
 
 
@@ -43,7 +67,10 @@ def get_llm_Anthropic(model: str, thinking: bool = False, thinking_budget: int =
     Returns:
         Anthropic LLM client instance
     """
+    from llama_index.llms.anthropic import Anthropic
+
     config = get_settings()
+    config.require_credentials("ANTHROPIC_API_KEY")
 
     # Enable thinking mode with required parameters
     if thinking:
@@ -52,7 +79,8 @@ def get_llm_Anthropic(model: str, thinking: bool = False, thinking_budget: int =
             model=model,
             api_key=config.ANTHROPIC_API_KEY,
             max_tokens=max_tokens,
-            timeout=1000,
+            timeout=config.LLM_DEADLINE_MAX,
+            max_retries=0,
             temperature=1.0,  # Required for thinking mode
             thinking_dict={"type": "enabled", "budget_tokens": thinking_budget},
         )
@@ -61,7 +89,8 @@ def get_llm_Anthropic(model: str, thinking: bool = False, thinking_budget: int =
         model=model,
         api_key=config.ANTHROPIC_API_KEY,
         max_tokens=30000,
-        timeout=1000,
+        timeout=config.LLM_DEADLINE_MAX,
+        max_retries=0,
     )
 
 
@@ -82,15 +111,501 @@ def get_llm(model: str, thinking: bool = False, thinking_budget: int = 10000):
     Returns:
         LLM client instance
     """
+    if get_provider(model) == "anthropic":
+        return get_llm_Anthropic(
+            model=model, thinking=thinking, thinking_budget=thinking_budget
+        )
+    return get_llm_OpenAI(model=model)
+
+
+def get_provider(model: str) -> str:
+    """Infer the provider ("anthropic" or "openai") from a model name."""
     model_lower = model.lower()
 
-    # Infer provider from model name
     if any(keyword in model_lower for keyword in ["claude", "sonnet", "haiku"]):
-        return get_llm_Anthropic(
-            model=model, thinking=thinking, thinking_budget=thinking_budget
+        return "anthropic"
+    # Models containing "gpt" and anything unknown default to OpenAI
+    return "openai"
+
+
+def cached_prefix_prompt(prefix: str, suffix: str) -> "ChatPromptTemplate":
+    """Build a prompt whose ``prefix`` is marked for provider prompt caching.
+
+    Keep everything that repeats across calls (instructions, per-policy
+    context) in ``prefix`` and the per-call content in ``suffix``: the prefix
+    must be byte-identical between calls for the cache to hit.
+    """
+    from llama_index.core.base.llms.types import (
+        CacheControl,
+        CachePoint,
+        ChatMessage,
+        MessageRole,
+        TextBlock,
+    )
+    from llama_index.core.prompts import ChatPromptTemplate
+
+    return ChatPromptTemplate(
+        message_templates=[
+            ChatMessage(
+                role=MessageRole.USER,
+                blocks=[
+                    TextBlock(text=prefix),
+                    CachePoint(cache_control=CacheControl(type="ephemeral")),
+                    TextBlock(text=suffix),
+                ],
+            )
+        ]
+    )
+
+
+def _min_cached_prefix_tokens(model: str) -> int:
+    """Shortest prefix Anthropic caches; cache points before it are ignored."""
+    return 2048 if "haiku" in model.lower() else 1024
+
+
+def _cached_prefix_tokens(
+    prompt: "ChatPromptTemplate", prompt_args: dict[str, Any]
+) -> int | None:
+    """Estimated tokens before the first cache point, or None without one."""
+    from llama_index.core.base.llms.types import CachePoint, TextBlock
+
+    text = []
+    for message in prompt.format_messages(**prompt_args):
+        for block in message.blocks:
+            if isinstance(block, CachePoint):
+                return estimate_tokens("".join(text))
+            if isinstance(block, TextBlock):
+                text.append(block.text)
+    return None
+
+
+def _for_provider(
+    prompt: "BasePromptTemplate", model: str, prompt_args: dict[str, Any]
+) -> "BasePromptTemplate":
+    """Drop explicit cache points the provider would not use.
+
+    OpenAI caches prefixes implicitly. Anthropic only caches prefixes of at
+    least ``_min_cached_prefix_tokens``; a shorter one is sent without its
+    cache point so the request says what the provider will actually do.
+    """
+    from llama_index.core.base.llms.types import CachePoint
+    from llama_index.core.prompts import ChatPromptTemplate
+
+    if not isinstance(prompt, ChatPromptTemplate):
+        return prompt
+    if get_provider(model) == "anthropic":
+        prefix_tokens = _cached_prefix_tokens(prompt, prompt_args)
+        minimum = _min_cached_prefix_tokens(model)
+        if prefix_tokens is None or prefix_tokens >= minimum:
+            return prompt
+        logger.debug(
+            "prompt_cache_skipped | model=%s | prefix_tokens=%s | minimum=%s",
+            model,
+            prefix_tokens,
+            minimum,
+        )
+    return prompt.model_copy(
+        update={
+            "message_templates": [
+                message.model_copy(
+                    update={
+                        "blocks": [
+                            block
+                            for block in message.blocks
+                            if not isinstance(block, CachePoint)
+                        ]
+                    }
+                )
+                for message in prompt.message_templates
+            ]
+        }
+    )
+
+
+async def _structured_call(
+    llm: Any,
+    output_cls: type[Model],
+    prompt: "BasePromptTemplate",
+    prompt_args: dict[str, Any],
+) -> tuple[Model, dict[str, Any]]:
+    """Force a tool call returning ``output_cls`` and report the call's usage.
+
+    Same tool-calling flow as ``LLM.astructured_predict``, but through
+    ``achat_with_tools`` so the raw provider response, and its token usage,
+    stays available.
+    """
+    from llama_index.core.program.function_program import get_function_tool
+
+    response = await llm.achat_with_tools(
+        [get_function_tool(output_cls)],
+        chat_history=prompt.format_messages(llm=llm, **prompt_args),
+        tool_required=True,
+    )
+    tool_calls = llm.get_tool_calls_from_response(response, error_on_no_tool_call=False)
+    if not tool_calls:
+        raise LLMOutputError(f"{llm.model} answered without a {output_cls.__name__}")
+    return output_cls.model_validate(tool_calls[0].tool_kwargs), response_usage(
+        response.raw
+    )
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when a model's circuit is open and no fallback is configured."""
+
+
+class LLMOutputError(ValueError):
+    """Raised when a model answers without the requested structured output."""
+
+
+def is_llm_error(error: BaseException) -> bool:
+    """Whether a failure comes from the model call rather than the code around it.
+
+    Covers provider and network errors, deadlines, open circuits, cache-only
+    misses and answers that do not validate against the requested schema.
+    """
+    if isinstance(
+        error,
+        (
+            TimeoutError,
+            httpx.HTTPError,
+            CircuitOpenError,
+            CacheMissError,
+            LLMOutputError,
+            ValidationError,
+        ),
+    ):
+        return True
+    # Provider SDK errors, matched by package to keep the SDKs out of this import
+    return any(
+        cls.__module__.partition(".")[0] in {"anthropic", "openai"}
+        for cls in type(error).__mro__
+    )
+
+
+@dataclass
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for one model.
+
+    After ``threshold`` transient failures in a row the circuit opens and calls
+    fail fast for ``cooldown`` seconds; then a single trial call is let through
+    (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    threshold: int
+    cooldown: float
+    failures: int = 0
+    opened_at: float | None = None
+    trial_in_flight: bool = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def end_trial(self) -> None:
+        """Free the half-open trial slot without recording an outcome."""
+        self.trial_in_flight = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
+@dataclass
+class LatencyTracker:
+    """Sliding window of successful call latencies for one model."""
+
+    samples: deque[float] = field(default_factory=lambda: deque(maxlen=200))
+    min_samples: int = 20
+
+    def add(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def p95(self) -> float | None:
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+_latencies: dict[str, LatencyTracker] = {}
+
+
+def get_circuit_breaker(model: str) -> CircuitBreaker:
+    if model not in _breakers:
+        config = get_settings()
+        _breakers[model] = CircuitBreaker(
+            threshold=config.LLM_BREAKER_THRESHOLD,
+            cooldown=config.LLM_BREAKER_COOLDOWN,
+        )
+    return _breakers[model]
+
+
+def get_latency_tracker(model: str) -> LatencyTracker:
+    return _latencies.setdefault(model, LatencyTracker())
+
+
+def call_deadline(prompt_tokens: int) -> float:
+    """Per-call deadline in seconds, growing with the size of the prompt."""
+    config = get_settings()
+    deadline = (
+        config.LLM_DEADLINE_BASE
+        + config.LLM_DEADLINE_PER_1K_TOKENS * prompt_tokens / 1000
+    )
+    return min(deadline, config.LLM_DEADLINE_MAX)
+
+
+def is_transient(error: BaseException) -> bool:
+    """Whether an LLM call failure is worth retrying."""
+    if isinstance(error, (TimeoutError, httpx.TransportError)):
+        return True
+    status_code = getattr(error, "status_code", None)
+    if status_code in _TRANSIENT_STATUS_CODES:
+        return True
+    # Provider SDKs wrap network failures in their own connection/timeout errors
+    return type(error).__name__ in {"APIConnectionError", "APITimeoutError"}
+
+
+def _limited_tokens(usage: dict[str, Any], provider: str) -> int:
+    """Tokens a call counts against the provider's tokens/min limit."""
+    call = LLMUsage()
+    call.add_response_usage(usage)
+    tokens = call.input_tokens + call.output_tokens + call.cache_write_tokens
+    # Anthropic does not count prompt-cache reads against its input tokens limit
+    return tokens if provider == "anthropic" else tokens + call.cache_read_tokens
+
+
+async def _attempt(
+    output_cls: type[Model],
+    prompt: "BasePromptTemplate",
+    model: str,
+    tokens: int,
+    prompt_args: dict[str, Any],
+) -> Model:
+    """One rate-limited call bounded by its deadline."""
+    llm = get_llm(model=model)
+    provider = get_provider(model)
+    prompt = _for_provider(prompt, model, prompt_args)
+    with span("llm.attempt", model=model, prompt_tokens=tokens) as attempt_span:
+        async with get_scheduler().slot(provider, model, tokens=tokens) as slot:
+            if attempt_span:
+                attempt_span.set(queued_s=attempt_span.duration_s)
+            started = time.monotonic()
+            result, usage = await asyncio.wait_for(
+                _structured_call(llm, output_cls, prompt, prompt_args),
+                timeout=call_deadline(tokens),
+            )
+            get_latency_tracker(model).add(time.monotonic() - started)
+            record_usage(usage)
+            if usage:
+                slot.tokens_used = _limited_tokens(usage, provider)
+            return result
+
+
+async def _hedged_attempt(
+    output_cls: type[Model],
+    prompt: "BasePromptTemplate",
+    model: str,
+    tokens: int,
+    prompt_args: dict[str, Any],
+) -> Model:
+    """Call once and, if it outlives the model's p95 latency, race a duplicate."""
+    hedge_after = get_latency_tracker(model).p95()
+    primary = asyncio.ensure_future(
+        _attempt(output_cls, prompt, model, tokens, prompt_args)
+    )
+    if not get_settings().LLM_HEDGE or hedge_after is None:
+        return await primary
+
+    tasks = [primary]
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+        if done:
+            return primary.result()
+
+        logger.info("llm_hedge_fired | model=%s | after_s=%.2f", model, hedge_after)
+        hedge = asyncio.ensure_future(
+            _attempt(output_cls, prompt, model, tokens, prompt_args)
         )
-    elif "gpt" in model_lower:
-        return get_llm_OpenAI(model=model)
-    else:
-        # Default to OpenAI
-        return get_llm_OpenAI(model=model)
+        tasks.append(hedge)
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if not task.cancelled() and task.exception() is None:
+                    return task.result()
+        # Both failed: surface the primary's error
+        return primary.result()
+    finally:
+        # Also reached when the caller is cancelled while waiting
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+async def _call_with_retries(
+    output_cls: type[Model],
+    prompt: "BasePromptTemplate",
+    model: str,
+    tokens: int,
+    prompt_args: dict[str, Any],
+) -> Model:
+    config = get_settings()
+    attempt = 0
+    while True:
+        try:
+            return await _hedged_attempt(output_cls, prompt, model, tokens, prompt_args)
+        except Exception as e:
+            if not is_transient(e) or attempt >= config.LLM_MAX_RETRIES:
+                raise
+            # Exponential backoff with full jitter
+            delay = random.uniform(0, config.LLM_RETRY_BASE_DELAY * 2**attempt)
+            attempt += 1
+            logger.warning(
+                "llm_retry | model=%s | attempt=%s | delay_s=%.2f | error_type=%s",
+                model,
+                attempt,
+                delay,
+                type(e).__name__,
+            )
+            await asyncio.sleep(delay)
+
+
+async def astructured_predict(
+    output_cls: type[Model],
+    prompt: "BasePromptTemplate",
+    *,
+    model: str,
+    **prompt_args: Any,
+) -> Model:
+    """Run a structured prediction with rate limiting and failure handling.
+
+    Results are served from the result cache when it is enabled. Otherwise
+    each attempt waits for a slot on the shared scheduler and is bounded by a
+    deadline derived from the prompt size. Transient failures are retried with
+    exponential backoff, slow calls can be hedged after the model's p95
+    latency, and a per-model circuit breaker fails fast - or switches to
+    ``LLM_FALLBACK_MODEL`` - while the provider keeps failing.
+
+    Args:
+        output_cls: Pydantic model the response is parsed into
+        prompt: Prompt template to format with ``prompt_args``
+        model: Model name, routed like ``get_llm``
+        **prompt_args: Template variables
+
+    Returns:
+        An instance of ``output_cls``; ``astructured_predict_with_model``
+        also returns the model that answered (``model`` or the fallback)
+
+    Raises:
+        CircuitOpenError: If the circuit is open and there is no fallback
+        CacheMissError: In cache-only mode, when the result is not cached
+    """
+    result, _ = await astructured_predict_with_model(
+        output_cls, prompt, model=model, **prompt_args
+    )
+    return result
+
+
+async def astructured_predict_with_model(
+    output_cls: type[Model],
+    prompt: "BasePromptTemplate",
+    *,
+    model: str,
+    **prompt_args: Any,
+) -> tuple[Model, str]:
+    """``astructured_predict``, also returning the model that answered."""
+    prompt_text = prompt.format(**prompt_args)
+    cache = get_cache()
+    key = cache.key(
+        model, output_cls.__name__, output_cls.model_json_schema(), prompt_text
+    )
+    answered_by = model
+
+    async def compute() -> Model:
+        nonlocal answered_by
+        result, answered_by = await _predict(
+            output_cls, prompt, model, prompt_text, prompt_args
+        )
+        return result
+
+    with span("llm.structured_predict", model=model, schema=output_cls.__name__):
+        # Keys name the requested model, so a fallback's answer is not stored
+        result = await cache.get_or_compute(
+            "llm", key, output_cls, compute, keep=lambda: answered_by == model
+        )
+    return result, answered_by
+
+
+async def _predict(
+    output_cls: type[Model],
+    prompt: "BasePromptTemplate",
+    model: str,
+    prompt_text: str,
+    prompt_args: dict[str, Any],
+) -> tuple[Model, str]:
+    """Call ``model``, or the fallback while it fails; returns who answered."""
+    tokens = estimate_tokens(prompt_text)
+    breaker = get_circuit_breaker(model)
+
+    is_trial = breaker.state == "half_open"
+    if breaker.allow():
+        try:
+            result = await _call_with_retries(
+                output_cls, prompt, model, tokens, prompt_args
+            )
+        except Exception as e:
+            if not is_transient(e):
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            logger.error(
+                "llm_call_failed | model=%s | circuit=%s | error_type=%s",
+                model,
+                breaker.state,
+                type(e).__name__,
+            )
+            if not _fallback_model(model):
+                raise
+        else:
+            breaker.record_success()
+            return result, model
+        finally:
+            # A cancelled trial records no outcome; let the next call try instead
+            if is_trial:
+                breaker.end_trial()
+
+    fallback = _fallback_model(model)
+    if fallback is None:
+        raise CircuitOpenError(f"Circuit open for model {model}")
+
+    logger.warning("llm_fallback | model=%s | fallback=%s", model, fallback)
+    result = await _call_with_retries(output_cls, prompt, fallback, tokens, prompt_args)
+    return result, fallback
+
+
+def _fallback_model(model: str) -> str | None:
+    fallback = get_settings().LLM_FALLBACK_MODEL
+    return fallback if fallback and fallback != model else None
@@ -1,13 +1,28 @@
 """Logging configuration.
 
-Provides standard Python logging with structured key=value formatting.
+Provides standard Python logging with structured key=value formatting, or one
+JSON object per line with ``LOG_FORMAT=json``.
+
+Log calls only enqueue the record: formatting and writing happen on a
+listener thread, so logging does not block the event loop. Arguments are
+therefore formatted after the call returns; pass values that are not mutated
+afterwards (strings, numbers, finished results). Messages and JSON fields are
+capped at ``LOG_MAX_FIELD_CHARS``, and records are dropped rather than waited
+for when ``LOG_QUEUE_SIZE`` of them are pending.
 """
 
+import atexit
+import copy
+import json
 import logging
 import logging.config
+import queue
 from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+
+from utils.settings import get_settings
 
-# Context variable for task ID tracking
+# Context variable for task ID tracking; set per workflow run by utils.tracing
 task_id_var: ContextVar[str | None] = ContextVar("task_id", default=None)
 
 
@@ -15,10 +30,83 @@ class TaskContextFilter(logging.Filter):
     """Filter that adds task_id to log records from context."""
 
     def filter(self, record: logging.LogRecord) -> bool:
-        record.task_id = task_id_var.get() or "-"
+        # Already set when the record was queued from the caller's context
+        if getattr(record, "task_id", None) is None:
+            record.task_id = task_id_var.get() or "-"
         return True
 
 
+def _cap(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}...(+{len(text) - max_chars} chars)"
+
+
+class CappedFormatter(logging.Formatter):
+    """Text formatter that shortens oversized messages."""
+
+    def __init__(self, *args, max_chars: int = 2000, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_chars = max_chars
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        record = copy.copy(record)
+        record.message = _cap(record.message, self.max_chars)
+        return super().formatMessage(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with the ``event | key=value`` parts split out."""
+
+    def __init__(self, *args, max_chars: int = 2000, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_chars = max_chars
+
+    def format(self, record: logging.LogRecord) -> str:
+        event, *parts = record.getMessage().split(" | ")
+        fields = {}
+        for part in parts:
+            key, sep, value = part.partition("=")
+            if sep:
+                fields[key.strip()] = _cap(value, self.max_chars)
+            else:
+                fields.setdefault("detail", _cap(part, self.max_chars))
+        payload = {
+            "ts": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "logger": record.name,
+            "task_id": getattr(record, "task_id", "-"),
+            "event": _cap(event, self.max_chars),
+            "fields": fields,
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload["exc"] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Queue handler that leaves message formatting to the listener thread."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Tracebacks reference live frames: render them before the caller moves on
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
 LOG_CONFIG = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -29,19 +117,25 @@ LOG_CONFIG = {
     },
     "formatters": {
         "standard": {
-            "format": "%(asctime)s | %(levelname)-8s | %(name)s | %(message)s",
+            "()": CappedFormatter,
+            "fmt": "%(asctime)s | %(levelname)-8s | %(name)s | %(message)s",
             "datefmt": "%Y-%m-%d %H:%M:%S",
         },
         "detailed": {
-            "format": "%(asctime)s | %(levelname)-8s | %(name)s | task=%(task_id)s | %(message)s",
+            "()": CappedFormatter,
+            "fmt": "%(asctime)s | %(levelname)-8s | %(name)s | task=%(task_id)s | %(message)s",
             "datefmt": "%Y-%m-%d %H:%M:%S",
         },
+        "json": {
+            "()": JsonFormatter,
+            "datefmt": "%Y-%m-%dT%H:%M:%S%z",
+        },
     },
     "handlers": {
         "console": {
             "class": "logging.StreamHandler",
             "level": "DEBUG",
-            "formatter": "standard",
+            "formatter": "detailed",
             "filters": ["task_context"],
             "stream": "ext://sys.stderr",
         },
@@ -71,11 +165,40 @@ LOG_CONFIG = {
 _configured = False
 
 
+def _log_config() -> dict:
+    config = get_settings()
+    log_config = copy.deepcopy(LOG_CONFIG)
+    for formatter in log_config["formatters"].values():
+        formatter["max_chars"] = config.LOG_MAX_FIELD_CHARS
+    if config.LOG_FORMAT == "json":
+        log_config["handlers"]["console"]["formatter"] = "json"
+    return log_config
+
+
+def _route_through_queue() -> None:
+    """Move the configured handlers behind a queue drained by a listener thread."""
+    loggers = [logging.getLogger(), logging.getLogger("compliance")]
+    handlers = list(dict.fromkeys(h for lg in loggers for h in lg.handlers))
+    log_queue: queue.Queue = queue.Queue(maxsize=get_settings().LOG_QUEUE_SIZE)
+    queue_handler = DeferredQueueHandler(log_queue)
+    # The task ID lives in the caller's context: read it before the record is queued
+    queue_handler.addFilter(TaskContextFilter())
+    for lg in loggers:
+        for handler in list(lg.handlers):
+            lg.removeHandler(handler)
+        lg.addHandler(queue_handler)
+
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+
 def configure_logging() -> None:
     """Configure logging using the LOG_CONFIG dictionary."""
     global _configured
     if not _configured:
-        logging.config.dictConfig(LOG_CONFIG)
+        logging.config.dictConfig(_log_config())
+        _route_through_queue()
         _configured = True
 
 
@@ -0,0 +1,91 @@
+"""Per-step LLM usage metrics.
+
+Provider responses carry token usage, including prompt-cache reads and writes,
+in the raw response of each chat call. ``utils.llm`` adds that usage to the
+``LLMUsage`` active in the current context, so a workflow step can wrap its
+calls in ``track_usage`` and report what they consumed.
+"""
+
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from typing import Any
+
+
+@dataclass
+class LLMUsage:
+    """Token usage accumulated over one or more LLM calls.
+
+    ``calls`` is fractional for a claim charged a share of a batched call.
+    """
+
+    calls: float = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_read_tokens: int = 0
+    cache_write_tokens: int = 0
+
+    def add_response_usage(self, usage: dict[str, Any]) -> None:
+        """Add the ``usage`` object of an Anthropic or OpenAI response."""
+        self.calls += 1
+        # OpenAI reports cached tokens as a part of the prompt; caching has no write cost
+        if "prompt_tokens" in usage or "input_tokens_details" in usage:
+            details = (
+                usage.get("prompt_tokens_details")
+                or usage.get("input_tokens_details")
+                or {}
+            )
+            cached = details.get("cached_tokens") or 0
+            prompt = usage.get("prompt_tokens", usage.get("input_tokens")) or 0
+            self.input_tokens += prompt - cached
+            self.output_tokens += (
+                usage.get("completion_tokens", usage.get("output_tokens")) or 0
+            )
+            self.cache_read_tokens += cached
+        # Anthropic: input_tokens excludes cached tokens, which are reported apart
+        else:
+            self.input_tokens += usage.get("input_tokens") or 0
+            self.output_tokens += usage.get("output_tokens") or 0
+            self.cache_read_tokens += usage.get("cache_read_input_tokens") or 0
+            self.cache_write_tokens += usage.get("cache_creation_input_tokens") or 0
+
+    def add(self, other: "LLMUsage", share: float = 1.0) -> None:
+        """Add another usage record, or a share of it for a call split among claims."""
+        self.calls += other.calls * share
+        self.input_tokens += round(other.input_tokens * share)
+        self.output_tokens += round(other.output_tokens * share)
+        self.cache_read_tokens += round(other.cache_read_tokens * share)
+        self.cache_write_tokens += round(other.cache_write_tokens * share)
+
+    def to_dict(self) -> dict[str, float]:
+        return asdict(self)
+
+
+usage_var: ContextVar[LLMUsage | None] = ContextVar("llm_usage", default=None)
+
+
+@contextmanager
+def track_usage() -> Iterator[LLMUsage]:
+    """Collect the usage of every LLM call made inside this block."""
+    usage = LLMUsage()
+    token = usage_var.set(usage)
+    try:
+        yield usage
+    finally:
+        usage_var.reset(token)
+
+
+def response_usage(raw: Any) -> dict[str, Any]:
+    """The ``usage`` object of a raw Anthropic (dict) or OpenAI (model) response."""
+    usage = raw.get("usage") if isinstance(raw, dict) else getattr(raw, "usage", None)
+    if usage is not None and not isinstance(usage, dict):
+        usage = usage.model_dump()
+    return usage or {}
+
+
+def record_usage(usage: dict[str, Any]) -> None:
+    """Add one call's provider usage to the active ``LLMUsage``, if any."""
+    active = usage_var.get()
+    if active is not None:
+        active.add_response_usage(usage)
@@ -0,0 +1,386 @@
+"""Opt-in per-run profiling of workflow steps.
+
+Runs started inside ``profiling()`` are sampled every
+``PROFILE_INTERVAL_MS`` by a background thread. A step that is executing on
+the event loop contributes its Python stack (pydantic conversion, JSON
+dumps, merging); a step that is suspended contributes the chain of
+coroutines it is awaiting, ending in ``[await]`` (LLM calls, LlamaParse
+jobs, the process pool). CPU time is not inferred from the samples: a step
+holding the GIL starves the sampler thread, so on-loop samples undercount it.
+Instead every resume of the step's coroutine is timed with ``thread_time``,
+and the sum is the step's CPU time on the loop. With ``PROFILE_MEMORY`` the
+peak ``tracemalloc`` memory above the step's start is recorded as well;
+steps that overlap share the process's peak. Tracing allocations slows
+allocation-heavy code several times over, so wall times are only
+representative without it.
+
+Each run writes ``<step>.folded`` files (collapsed stacks for flamegraph.pl,
+inferno or speedscope) and a ``summary.txt`` table to
+``PROFILE_DIR/<time>-<task_id>/``. Work done in the process pool
+(``CPU_WORKERS``) shows up as an await; set ``CPU_WORKERS=0`` to profile
+ParseResult construction and merging inline.
+
+    uv run python workflow.py --profile
+"""
+
+import asyncio
+import functools
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from types import CodeType, FrameType
+from typing import Any, ParamSpec, TypeVar
+
+from utils.logging import get_logger
+from utils.settings import get_settings
+
+logger = get_logger(__name__)
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+AWAIT_FRAME = "[await]"
+
+
+@dataclass(eq=False)
+class StepProfile:
+    """Samples of one step execution."""
+
+    step: str
+    started_s: float
+    frame: FrameType | None = None
+    coro: Any = None
+    wall_s: float = 0.0
+    # Loop thread CPU time spent inside the step's coroutine
+    cpu_s: float = 0.0
+    start_memory: int = 0
+    peak_memory: int = 0
+    stacks: Counter[tuple[str, ...]] = field(default_factory=Counter)
+
+    def top_frame(self) -> str:
+        """Innermost frame of the most sampled on-loop stack."""
+        leaves: Counter[str] = Counter()
+        for stack, count in self.stacks.items():
+            if stack[-1] != AWAIT_FRAME:
+                leaves[stack[-1]] += count
+        return leaves.most_common(1)[0][0] if leaves else "-"
+
+
+@dataclass
+class RunProfile:
+    """Steps of one profiled run and where its output goes."""
+
+    run_id: str
+    directory: Path
+    started: float = field(default_factory=time.perf_counter)
+    steps: list[StepProfile] = field(default_factory=list)
+    finished: asyncio.Event = field(default_factory=asyncio.Event)
+    written: asyncio.Future | None = None
+
+    def summary(self) -> list[dict[str, Any]]:
+        return [
+            {
+                "step": s.step,
+                "start_s": round(s.started_s, 3),
+                "wall_s": round(s.wall_s, 3),
+                "cpu_s": round(s.cpu_s, 3),
+                "wait_s": round(s.wall_s - s.cpu_s, 3),
+                "peak_mb": round(max(s.peak_memory - s.start_memory, 0) / 2**20, 1),
+                "top_frame": s.top_frame(),
+            }
+            for s in self.steps
+        ]
+
+
+@lru_cache(maxsize=4096)
+def _label(code: CodeType) -> str:
+    name = f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    return name.replace(";", ",")
+
+
+def _await_stack(coro: Any) -> list[str]:
+    """Functions of a suspended coroutine chain, outermost first."""
+    stack = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        stack.append(_label(frame.f_code))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    stack.append(AWAIT_FRAME)
+    return stack
+
+
+class _Timed:
+    """Awaitable driving a step's coroutine, timing each resume on the loop."""
+
+    def __init__(self, coro: Any, step: StepProfile):
+        self.coro = coro
+        self.step = step
+
+    def __await__(self):
+        inner = self.coro.__await__()
+        value: Any = None
+        error: BaseException | None = None
+        while True:
+            started = time.thread_time()
+            try:
+                yielded = inner.send(value) if error is None else inner.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self.step.cpu_s += time.thread_time() - started
+            try:
+                value, error = (yield yielded), None
+            except GeneratorExit:
+                inner.close()
+                raise
+            except BaseException as e:  # noqa: BLE001 - delivered to the step
+                value, error = None, e
+
+
+_TIMED_CODE = _Timed.__await__.__code__
+
+
+class _Sampler:
+    """Background thread sampling the steps of every profiled run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._steps: set[StepProfile] = set()
+        self._runs = 0
+        self._stop: threading.Event | None = None
+        self._owns_tracemalloc = False
+
+    def attach(self) -> None:
+        config = get_settings()
+        with self._lock:
+            self._runs += 1
+            if self._stop is not None:
+                return
+            if config.PROFILE_MEMORY and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._owns_tracemalloc = True
+            self._stop = threading.Event()
+            threading.Thread(
+                target=self._loop,
+                args=(self._stop, config.PROFILE_INTERVAL_MS / 1000),
+                name="step-profiler",
+                daemon=True,
+            ).start()
+
+    def detach(self) -> None:
+        with self._lock:
+            self._runs -= 1
+            if self._runs or self._stop is None:
+                return
+            self._stop.set()
+            self._stop = None
+            if self._owns_tracemalloc:
+                tracemalloc.stop()
+                self._owns_tracemalloc = False
+
+    def add(self, step: StepProfile) -> None:
+        with self._lock:
+            self._steps.add(step)
+
+    def remove(self, step: StepProfile) -> None:
+        with self._lock:
+            self._steps.discard(step)
+
+    def _loop(self, stop: threading.Event, interval: float) -> None:
+        while not stop.wait(interval):
+            try:
+                self.sample()
+            except Exception as e:  # noqa: BLE001 - a lost sample must not end profiling
+                logger.debug("profile_sample_failed | error=%s", e)
+
+    def sample(self) -> None:
+        with self._lock:
+            steps = list(self._steps)
+        if not steps:
+            return
+        by_frame = {id(s.frame): s for s in steps}
+
+        on_loop = set()
+        for frame in sys._current_frames().values():
+            stack: list[str] = []
+            f: FrameType | None = frame
+            while f is not None:
+                step = by_frame.get(id(f))
+                if step is not None and step.frame is f:
+                    step.stacks[tuple(reversed(stack))] += 1
+                    on_loop.add(step)
+                    break
+                if f.f_code is not _TIMED_CODE:
+                    stack.append(_label(f.f_code))
+                f = f.f_back
+
+        for step in steps:
+            if step not in on_loop:
+                step.stacks[tuple(_await_stack(step.coro))] += 1
+
+        if tracemalloc.is_tracing():
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            for step in steps:
+                step.peak_memory = max(step.peak_memory, peak)
+
+
+_sampler = _Sampler()
+
+run_profile_var: ContextVar[RunProfile | None] = ContextVar("run_profile", default=None)
+
+
+@dataclass
+class ProfileSession:
+    """Runs profiled inside one ``profiling()`` block."""
+
+    directory: Path
+    runs: list[RunProfile] = field(default_factory=list)
+
+
+_session_var: ContextVar[ProfileSession | None] = ContextVar(
+    "profile_session", default=None
+)
+
+
+@asynccontextmanager
+async def profiling(
+    directory: str | Path | None = None,
+) -> AsyncIterator[ProfileSession]:
+    """Profile the workflow runs started in this block.
+
+    On exit, waits until every run has finished and its profile is written.
+    """
+    session = ProfileSession(Path(directory or get_settings().PROFILE_DIR))
+    token = _session_var.set(session)
+    try:
+        yield session
+    finally:
+        _session_var.reset(token)
+        for run in session.runs:
+            await run.finished.wait()
+            if run.written is not None:
+                await run.written
+
+
+@contextmanager
+def profiling_run(run_id: str) -> Iterator[RunProfile | None]:
+    """Make a new run profile current in this block, inside ``profiling()``."""
+    session = _session_var.get()
+    if session is None:
+        yield None
+        return
+    stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+    profile = RunProfile(run_id, session.directory / f"{stamp}-{run_id[:16]}")
+    session.runs.append(profile)
+    _sampler.attach()
+    token = run_profile_var.set(profile)
+    try:
+        yield profile
+    except BaseException:
+        # The run never started, so nothing else will finish its profile
+        finish_profile(profile)
+        raise
+    finally:
+        run_profile_var.reset(token)
+
+
+def profiled(func: Callable[P, Awaitable[R]]) -> Callable[P, Awaitable[R]]:
+    """Sample a workflow step while it runs, if its run is profiled."""
+
+    @functools.wraps(func)
+    async def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+        profile = run_profile_var.get()
+        if profile is None:
+            return await func(*args, **kwargs)
+
+        coro = func(*args, **kwargs)
+        started = time.perf_counter()
+        step = StepProfile(
+            func.__name__,
+            started - profile.started,
+            frame=sys._getframe(),
+            coro=coro,
+            start_memory=(
+                tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+            ),
+        )
+        profile.steps.append(step)
+        _sampler.add(step)
+        try:
+            return await _Timed(coro, step)
+        finally:
+            _sampler.remove(step)
+            step.wall_s = time.perf_counter() - started
+            step.frame = step.coro = None
+
+    return wrapper
+
+
+def finish_profile(profile: RunProfile | None) -> None:
+    """Stop sampling the run and write its flamegraph stacks and summary."""
+    if profile is None:
+        return
+    _sampler.detach()
+    rows = profile.summary()
+    for row in rows:
+        logger.info(
+            "profile_step | step=%s | wall_s=%s | cpu_s=%s | peak_mb=%s | top=%s",
+            row["step"],
+            row["wall_s"],
+            row["cpu_s"],
+            row["peak_mb"],
+            row["top_frame"],
+        )
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        _write(profile, rows)
+    else:
+        profile.written = loop.run_in_executor(None, _write, profile, rows)
+    profile.finished.set()
+
+
+def format_summary(rows: list[dict[str, Any]]) -> str:
+    header = f"{'step':<24} {'start_s':>8} {'wall_s':>8} {'cpu_s':>8} {'wait_s':>8} {'peak_mb':>8}  top_frame"
+    lines = [header, "-" * len(header)]
+    lines.extend(
+        f"{r['step']:<24} {r['start_s']:>8.3f} {r['wall_s']:>8.3f} {r['cpu_s']:>8.3f}"
+        f" {r['wait_s']:>8.3f} {r['peak_mb']:>8.1f}  {r['top_frame']}"
+        for r in rows
+    )
+    return "\n".join(lines) + "\n"
+
+
+def _write(profile: RunProfile, rows: list[dict[str, Any]]) -> None:
+    try:
+        profile.directory.mkdir(parents=True, exist_ok=True)
+        stacks: dict[str, Counter[tuple[str, ...]]] = {}
+        for s in profile.steps:
+            stacks.setdefault(s.step, Counter()).update(s.stacks)
+        for step, counter in stacks.items():
+            (profile.directory / f"{step}.folded").write_text(
+                "".join(
+                    f"{';'.join(stack)} {count}\n" for stack, count in counter.items()
+                ),
+                encoding="utf-8",
+            )
+        (profile.directory / "summary.txt").write_text(
+            format_summary(rows), encoding="utf-8"
+        )
+        logger.info("profile_written | directory=%s", profile.directory)
+    except OSError as e:
+        logger.warning(
+            "profile_write_failed | directory=%s | error=%s", profile.directory, e
+        )
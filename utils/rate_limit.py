@@ -0,0 +1,388 @@
+"""Process-wide rate limiting for provider calls.
+
+Every LlamaParse job submission and LLM call acquires a slot on the lane of its
+provider/model. A limit enforces requests/min and tokens/min with token buckets
+plus an optional in-flight cap. The ``provider`` limit is shared by all lanes
+of that provider, and a ``provider/model`` limit further caps a single lane, so
+two models of one provider together stay within the provider's quota. Waiting
+callers are served by priority class first and round-robin across claims
+within a class, so one large batch cannot starve an interactive run or another
+claim.
+
+The lanes of a provider share a thread lock and wake waiters with
+``call_soon_threadsafe``, so runs on different event loops (one per Streamlit
+session) share the same limits.
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from collections.abc import AsyncIterator, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from enum import IntEnum
+from functools import lru_cache
+
+from utils.logging import get_logger
+from utils.settings import RateLimit, get_settings
+
+logger = get_logger(__name__)
+
+
+class Priority(IntEnum):
+    """Scheduling class of a request; lower values are served first."""
+
+    INTERACTIVE = 0
+    BATCH = 1
+
+
+# Context variables identifying who is asking for a slot
+priority_var: ContextVar[Priority] = ContextVar(
+    "priority", default=Priority.INTERACTIVE
+)
+claim_id_var: ContextVar[str | None] = ContextVar("claim_id", default=None)
+
+
+@contextmanager
+def scheduling(
+    claim_id: str | None = None, priority: Priority | None = None
+) -> Iterator[None]:
+    """Tag the provider calls made inside this block with a claim and priority."""
+    tokens = []
+    if claim_id is not None:
+        tokens.append((claim_id_var, claim_id_var.set(claim_id)))
+    if priority is not None:
+        tokens.append((priority_var, priority_var.set(priority)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at ``rate_per_min``."""
+
+    def __init__(self, rate_per_min: float, capacity: float | None = None):
+        self.rate = rate_per_min / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_min
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float) -> float:
+        """Seconds until ``amount`` tokens are available (0 if they are now)."""
+        self._refill()
+        # Requests larger than the bucket wait for a full bucket instead of forever
+        amount = min(amount, self.capacity)
+        missing = amount - self.tokens
+        return 0.0 if missing <= 0 else missing / self.rate
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount: float) -> None:
+        """Correct a previous estimate once the real usage is known."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+@dataclass(eq=False)
+class _Ticket:
+    priority: Priority
+    claim_id: str
+    requests: int
+    tokens: int
+    loop: asyncio.AbstractEventLoop
+    event: asyncio.Event = field(default_factory=asyncio.Event)
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+    def wake(self) -> None:
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.event.set)
+
+
+@dataclass
+class WaitStats:
+    """Queue wait times observed on a lane."""
+
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def add(self, wait: float) -> None:
+        self.count += 1
+        self.total += wait
+        self.max = max(self.max, wait)
+
+
+class _Limiter:
+    """Token buckets and in-flight count of one configured ``RateLimit``."""
+
+    def __init__(self, limit: RateLimit):
+        self.limit = limit
+        self.requests = TokenBucket(limit.rpm) if limit.rpm else None
+        self.tokens = TokenBucket(limit.tpm) if limit.tpm else None
+        self.in_flight = 0
+
+    def delay(self, ticket: _Ticket) -> float | None:
+        """Seconds until ``ticket`` fits, or None if blocked on concurrency."""
+        if self.limit.concurrency and self.in_flight >= self.limit.concurrency:
+            return None
+        delays = [0.0]
+        if self.requests is not None:
+            delays.append(self.requests.delay(ticket.requests))
+        if self.tokens is not None and ticket.tokens:
+            delays.append(self.tokens.delay(ticket.tokens))
+        return max(delays)
+
+    def consume(self, ticket: _Ticket) -> None:
+        if self.requests is not None:
+            self.requests.consume(ticket.requests)
+        if self.tokens is not None and ticket.tokens:
+            self.tokens.consume(ticket.tokens)
+        self.in_flight += 1
+
+    def release(self, token_correction: int) -> None:
+        self.in_flight -= 1
+        if self.tokens is not None and token_correction:
+            self.tokens.adjust(token_correction)
+
+
+class _Provider:
+    """Lock, shared limit and lanes of one provider."""
+
+    def __init__(self, limit: RateLimit | None):
+        self.lock = threading.Lock()
+        self.limiter = _Limiter(limit) if limit else None
+        self.lanes: list[_Lane] = []
+
+    def wake_heads(self) -> None:
+        """Wake every lane's head after the shared limit freed capacity."""
+        for lane in self.lanes:
+            lane.wake_head()
+
+
+class _Lane:
+    def __init__(self, name: str, provider: _Provider, limit: RateLimit | None):
+        self.name = name
+        self.provider = provider
+        self.lock = provider.lock
+        # The provider's shared limit first, then the lane's own, if configured
+        self.limiters = [
+            limiter
+            for limiter in (provider.limiter, _Limiter(limit) if limit else None)
+            if limiter is not None
+        ]
+        # priority -> claim -> waiting tickets; claim order is the round-robin order
+        self.queues: dict[Priority, OrderedDict[str, deque[_Ticket]]] = {}
+        self.stats: dict[Priority, WaitStats] = {}
+
+    def enqueue(self, ticket: _Ticket) -> None:
+        claims = self.queues.setdefault(ticket.priority, OrderedDict())
+        claims.setdefault(ticket.claim_id, deque()).append(ticket)
+
+    def remove(self, ticket: _Ticket) -> None:
+        claims = self.queues.get(ticket.priority, OrderedDict())
+        waiting = claims.get(ticket.claim_id)
+        if waiting and ticket in waiting:
+            waiting.remove(ticket)
+            if not waiting:
+                del claims[ticket.claim_id]
+
+    def head(self) -> _Ticket | None:
+        for priority in sorted(self.queues):
+            claims = self.queues[priority]
+            if claims:
+                return next(iter(claims.values()))[0]
+        return None
+
+    def pop(self, ticket: _Ticket) -> None:
+        claims = self.queues[ticket.priority]
+        waiting = claims.pop(ticket.claim_id)
+        waiting.popleft()
+        if waiting:
+            # Served claims go to the back of the round-robin order
+            claims[ticket.claim_id] = waiting
+
+    def delay(self, ticket: _Ticket) -> float | None:
+        """Seconds until ``ticket`` may run, or None if blocked on concurrency."""
+        delays = [0.0]
+        for limiter in self.limiters:
+            delay = limiter.delay(ticket)
+            if delay is None:
+                return None
+            delays.append(delay)
+        return max(delays)
+
+    def grant(self, ticket: _Ticket) -> None:
+        self.pop(ticket)
+        for limiter in self.limiters:
+            limiter.consume(ticket)
+
+    def release(self, token_correction: int) -> None:
+        for limiter in self.limiters:
+            limiter.release(token_correction)
+
+    def wake_head(self) -> None:
+        head = self.head()
+        if head is not None:
+            head.wake()
+
+
+@dataclass
+class Slot:
+    """A granted lane slot; set ``tokens_used`` once the call's usage is known."""
+
+    waited: float
+    tokens: int
+    tokens_used: int | None = None
+
+
+class Scheduler:
+    """Shared scheduler holding one lane per provider/model."""
+
+    def __init__(self, limits: dict[str, RateLimit]):
+        self.limits = limits
+        self._providers: dict[str, _Provider] = {}
+        self._lanes: dict[str, _Lane] = {}
+        self._lock = threading.Lock()
+
+    def _lane(self, provider: str, model: str | None) -> _Lane:
+        name = f"{provider}/{model}" if model else provider
+        with self._lock:
+            lane = self._lanes.get(name)
+            if lane is None:
+                group = self._providers.get(provider)
+                if group is None:
+                    group = self._providers[provider] = _Provider(
+                        self.limits.get(provider)
+                    )
+                lane = _Lane(name, group, self.limits.get(name) if model else None)
+                with group.lock:
+                    group.lanes.append(lane)
+                self._lanes[name] = lane
+            return lane
+
+    async def acquire(
+        self,
+        provider: str,
+        model: str | None = None,
+        requests: int = 1,
+        tokens: int = 0,
+    ) -> float:
+        """Wait for a slot on the lane and return the time spent queued."""
+        lane = self._lane(provider, model)
+        ticket = _Ticket(
+            priority=priority_var.get(),
+            claim_id=claim_id_var.get() or "-",
+            requests=requests,
+            tokens=tokens,
+            loop=asyncio.get_running_loop(),
+        )
+        with lane.lock:
+            lane.enqueue(ticket)
+            # A new head may be a higher priority than whoever is sleeping on the buckets
+            lane.wake_head()
+
+        granted = False
+        try:
+            while True:
+                ticket.event.clear()
+                with lane.lock:
+                    delay = lane.delay(ticket) if lane.head() is ticket else None
+                    if delay == 0:
+                        lane.grant(ticket)
+                        granted = True
+                        lane.wake_head()
+                if granted:
+                    break
+                if delay is None:
+                    await ticket.event.wait()
+                else:
+                    try:
+                        await asyncio.wait_for(ticket.event.wait(), timeout=delay)
+                    except TimeoutError:
+                        pass
+        finally:
+            if not granted:
+                with lane.lock:
+                    lane.remove(ticket)
+                    lane.wake_head()
+
+        waited = time.monotonic() - ticket.enqueued_at
+        with lane.lock:
+            lane.stats.setdefault(ticket.priority, WaitStats()).add(waited)
+        if waited > 0.01:
+            logger.info(
+                "rate_limit_waited | lane=%s | priority=%s | claim_id=%s | wait_s=%.3f",
+                lane.name,
+                ticket.priority.name,
+                ticket.claim_id,
+                waited,
+            )
+        return waited
+
+    def release(
+        self, provider: str, model: str | None = None, token_correction: int = 0
+    ) -> None:
+        """Free an in-flight slot; ``token_correction`` is actual minus estimated tokens."""
+        lane = self._lane(provider, model)
+        with lane.lock:
+            lane.release(token_correction)
+            lane.provider.wake_heads()
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        provider: str,
+        model: str | None = None,
+        requests: int = 1,
+        tokens: int = 0,
+    ) -> AsyncIterator[Slot]:
+        """Hold a lane slot for the duration of a provider call.
+
+        Yields:
+            The granted ``Slot``; setting its ``tokens_used`` corrects the
+            tokens/min buckets by the difference from ``tokens`` on release
+        """
+        waited = await self.acquire(provider, model, requests=requests, tokens=tokens)
+        granted = Slot(waited=waited, tokens=tokens)
+        try:
+            yield granted
+        finally:
+            correction = (
+                granted.tokens_used - tokens if granted.tokens_used is not None else 0
+            )
+            self.release(provider, model, token_correction=correction)
+
+    def wait_stats(self) -> dict[str, dict[str, WaitStats]]:
+        """Queue wait statistics per lane and priority class."""
+        with self._lock:
+            lanes = list(self._lanes.values())
+        return {
+            lane.name: {priority.name: stats for priority, stats in lane.stats.items()}
+            for lane in lanes
+        }
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token) used for tokens/min budgeting."""
+    return len(text) // 4 + 1
+
+
+@lru_cache
+def get_scheduler() -> Scheduler:
+    """Get the process-wide scheduler configured from ``RATE_LIMITS``."""
+    return Scheduler(get_settings().RATE_LIMITS)
@@ -1,9 +1,18 @@
 from functools import lru_cache
+from typing import Literal
 
-from pydantic import Field, model_validator
+from pydantic import BaseModel, Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
+class RateLimit(BaseModel):
+    """Limits for one provider or provider/model lane. Unset means unlimited."""
+
+    rpm: float | None = None
+    tpm: float | None = None
+    concurrency: int | None = None
+
+
 class Config(BaseSettings):
     """Application configuration loaded from environment variables."""
 
@@ -23,41 +32,311 @@ class Config(BaseSettings):
     LLAMA_CLOUD_BASE_URL: str = "https://api.cloud.llamaindex.ai"
 
     # ============================================================================
-    # Validation
+    # Parse Job Polling
     # ============================================================================
+    PARSE_POLL_MIN_INTERVAL: float = Field(
+        default=0.5, gt=0, description="Shortest wait between job status checks"
+    )
+    PARSE_POLL_MAX_INTERVAL: float = Field(
+        default=10.0, gt=0, description="Longest wait between job status checks"
+    )
+    PARSE_WEBHOOK_URL: str | None = Field(
+        default=None,
+        description="Public URL LlamaCloud calls on job completion (enables the local receiver)",
+    )
+    PARSE_WEBHOOK_SECRET: str | None = Field(
+        default=None,
+        description="Token the receiver requires, sent back through PARSE_WEBHOOK_URL's query",
+    )
+    PARSE_WEBHOOK_HOST: str = "127.0.0.1"
+    PARSE_WEBHOOK_PORT: int = 8090
 
-    @model_validator(mode="after")
-    def validate_credentials(self) -> "Config":
-        """Validate required credentials are present."""
-
-        missing = []
-
-        # Validate LlamaCloud credentials
-        if not self.LLAMA_CLOUD_API_KEY:
-            missing.append("LLAMA_CLOUD_API_KEY")
+    # ============================================================================
+    # Parse Routing
+    # ============================================================================
+    PARSE_PAGE_ROUTING: bool = Field(
+        default=False,
+        description="Parse each page group with the cheapest adequate LlamaParse mode",
+    )
+    PARSE_ROUTING_MIN_CHARS: int = Field(
+        default=200,
+        ge=0,
+        description="Text-layer characters below which a page is parsed as scanned",
+    )
+    PARSE_ROUTING_MAX_IMAGE_RATIO: float = Field(
+        default=0.5,
+        gt=0,
+        le=1,
+        description="Share of the page covered by images from which it is parsed as scanned",
+    )
+    PARSE_ROUTING_MAX_GROUPS: int = Field(
+        default=4,
+        ge=1,
+        description="Parse jobs per document; smaller page groups take a neighbour's costlier mode",
+    )
 
-        # Validate Anthropic credentials
-        if not self.ANTHROPIC_API_KEY:
-            missing.append("ANTHROPIC_API_KEY")
+    # ============================================================================
+    # Validation
+    # ============================================================================
 
-        # Validate OpenAI credentials
-        if not self.OPENAI_API_KEY:
-            missing.append("OPENAI_API_KEY")
+    def require_credentials(self, *names: str) -> None:
+        """Validate that the credentials a provider client needs are present.
 
+        Checked when a client is first built rather than at startup, so runs
+        that never reach a provider (e.g. cache-only replays) need no keys.
+        """
+        missing = [name for name in names if not getattr(self, name)]
         if missing:
             raise ValueError(f"Missing required credentials: {', '.join(missing)}")
 
-        return self
-
     # ============================================================================
     # Workflow Server
     # ============================================================================
     WORKFLOW_SERVER_HOST: str = "0.0.0.0"
     WORKFLOW_SERVER_PORT: int = 8080
+    WORKFLOW_SERVER_MAX_CONCURRENT_RUNS: int = Field(
+        default=8, ge=1, description="Workflow runs executed at the same time"
+    )
+    WORKFLOW_SERVER_MAX_JOBS: int = Field(
+        default=1000, ge=1, description="Finished jobs kept in memory for retrieval"
+    )
+    WORKFLOW_SERVER_MAX_QUEUED_JOBS: int = Field(
+        default=100, ge=0, description="Jobs waiting for a run slot before 429s"
+    )
+    WORKFLOW_SERVER_MAX_UPLOAD_MB: float = Field(
+        default=50.0, gt=0, description="Largest accepted poliza or reporte upload"
+    )
+    WORKFLOW_SERVER_RUN_TIMEOUT: float = Field(
+        default=900.0, description="Timeout in seconds of a single workflow run"
+    )
+    WORKFLOW_SERVER_UPLOAD_DIR: str | None = Field(
+        default=None, description="Where uploads are stored (system temp dir if unset)"
+    )
+
+    # ============================================================================
+    # Logging
+    # ============================================================================
+    LOG_FORMAT: Literal["text", "json"] = Field(
+        default="text", description="'json' writes one JSON object per log line"
+    )
+    LOG_MAX_FIELD_CHARS: int = Field(
+        default=2000, gt=0, description="Longer log messages and fields are truncated"
+    )
+    LOG_QUEUE_SIZE: int = Field(
+        default=10000,
+        ge=0,
+        description="Log records waiting for the writer thread before new ones are dropped (0 = unbounded)",
+    )
 
+    # ============================================================================
+    # Debug Capture
+    # ============================================================================
     DEBUG: bool = Field(
         default=False, description="Enable debug mode to save workflow step inputs"
     )
+    DEBUG_CAPTURE_RATE: float = Field(
+        default=1.0,
+        ge=0,
+        le=1,
+        description="Share of runs whose step inputs and outputs are saved (failed runs always are)",
+    )
+    DEBUG_CAPTURE_SLOW_S: float | None = Field(
+        default=None,
+        gt=0,
+        description="Runs taking longer are saved regardless of the rate",
+    )
+    DEBUG_CAPTURE_DIR: str = "captures"
+    DEBUG_CAPTURE_MAX_RUNS: int = Field(
+        default=200, ge=1, description="Captures kept before the oldest are deleted"
+    )
+    DEBUG_CAPTURE_MAX_MB: float = Field(
+        default=500.0, gt=0, description="Total size of kept captures"
+    )
+
+    # ============================================================================
+    # Profiling
+    # ============================================================================
+    PROFILE_DIR: str = Field(
+        default="profiles", description="Where profiled runs write their output"
+    )
+    PROFILE_INTERVAL_MS: float = Field(
+        default=5.0, gt=0, description="Milliseconds between profiler samples"
+    )
+    PROFILE_MEMORY: bool = Field(
+        default=False,
+        description="Record each step's peak memory with tracemalloc (slows allocation-heavy code several times)",
+    )
+
+    # ============================================================================
+    # Tracing
+    # ============================================================================
+    TRACE_FILE: str | None = Field(
+        default=None,
+        description="JSONL file each run's trace is appended to as OTLP/JSON",
+    )
+    TRACE_OTLP_ENDPOINT: str | None = Field(
+        default=None,
+        description="OTLP/HTTP JSON traces endpoint, e.g. http://localhost:4318/v1/traces",
+    )
+
+    # ============================================================================
+    # Models
+    # ============================================================================
+    EXTRACTION_MODEL: str = Field(
+        default="claude-sonnet-4-5", description="Model extracting the poliza rules"
+    )
+    VALIDATION_MODEL: str = Field(
+        default="claude-sonnet-4-5", description="Model validating reporte items"
+    )
+
+    # ============================================================================
+    # Poliza Extraction
+    # ============================================================================
+    EXTRACTION_MODE: Literal["single", "map_reduce"] = Field(
+        default="single",
+        description="'map_reduce' extracts heading sections concurrently and merges them",
+    )
+    EXTRACTION_SECTION_MAX_CHARS: int = Field(
+        default=12000,
+        gt=0,
+        description="Characters per map-reduce extraction call; larger sections are split by subheading",
+    )
+    POLICY_REGISTRY_DIR: str | None = Field(
+        default=None,
+        description="Where registered poliza versions are stored, e.g. 'policies' (memory only if unset)",
+    )
+    POLICY_REGISTRY_HOT_SIZE: int = Field(
+        default=64,
+        ge=1,
+        description="Registered polizas, and so extracted rules, kept in memory",
+    )
+    SPECULATIVE_VALIDATION: bool = Field(
+        default=False,
+        description="Validate a new poliza version's reporte with the previous version's rules while it is extracted",
+    )
+
+    # ============================================================================
+    # LLM Resilience
+    # ============================================================================
+    LLM_DEADLINE_BASE: float = Field(
+        default=30.0, description="Fixed part of the per-call deadline in seconds"
+    )
+    LLM_DEADLINE_PER_1K_TOKENS: float = Field(
+        default=2.0, description="Deadline seconds added per 1k prompt tokens"
+    )
+    LLM_DEADLINE_MAX: float = Field(
+        default=300.0, description="Upper bound for any single LLM call in seconds"
+    )
+    LLM_MAX_RETRIES: int = Field(default=3, ge=0)
+    LLM_RETRY_BASE_DELAY: float = Field(
+        default=1.0, description="Base delay for exponential retry backoff"
+    )
+    LLM_HEDGE: bool = Field(
+        default=False, description="Fire a duplicate request after the p95 latency"
+    )
+    LLM_BREAKER_THRESHOLD: int = Field(
+        default=5, ge=1, description="Consecutive failures that open the circuit"
+    )
+    LLM_BREAKER_COOLDOWN: float = Field(
+        default=60.0, description="Seconds an open circuit fails fast"
+    )
+    LLM_FALLBACK_MODEL: str | None = Field(
+        default=None,
+        description="Model used while a circuit is open (e.g. gpt-4.1); unset fails fast",
+    )
+
+    # ============================================================================
+    # Rule Decisions
+    # ============================================================================
+    VALIDATION_RULES_FIRST: bool = Field(
+        default=True,
+        description="Reject rows an excluded concept or an exceeded cap decides without the model",
+    )
+
+    # ============================================================================
+    # Validation Batching
+    # ============================================================================
+    VALIDATION_BATCH_SIZE: int = Field(
+        default=1,
+        ge=1,
+        description="Max reportes per batched validation call (1 disables batching)",
+    )
+    VALIDATION_BATCH_WINDOW_MS: float = Field(
+        default=50.0, ge=0, description="How long a batch waits for more reportes"
+    )
+    VALIDATION_BATCH_MAX_CHARS: int = Field(
+        default=6000, description="Only facturas up to this size are batched"
+    )
+
+    # ============================================================================
+    # Decision Memo
+    # ============================================================================
+    DECISION_MEMO_SIZE: int = Field(
+        default=0,
+        ge=0,
+        description="Item decisions reused across reportes with the same rules (0 disables)",
+    )
+    DECISION_MEMO_TTL: float = Field(
+        default=0.0,
+        ge=0,
+        description="Seconds a memoized decision stays valid (0 keeps it until evicted)",
+    )
+    DECISION_MEMO_VERIFY_RATE: float = Field(
+        default=0.0,
+        ge=0,
+        le=1,
+        description="Share of memo hits sent to the model anyway to check the decision",
+    )
+
+    # ============================================================================
+    # Rate Limits
+    # ============================================================================
+    RATE_LIMITS: dict[str, RateLimit] = Field(
+        default_factory=lambda: {
+            "llamaparse": RateLimit(rpm=60, concurrency=4),
+            "anthropic": RateLimit(rpm=50, tpm=30000),
+            "openai": RateLimit(rpm=500, tpm=30000),
+        },
+        description="Limits per 'provider' or 'provider/model' lane, as JSON",
+    )
+
+    # ============================================================================
+    # Ingestion
+    # ============================================================================
+    INGEST_INBOX_DIR: str = "spool/inbox"
+    INGEST_OUTBOX_DIR: str = "spool/outbox"
+    INGEST_QUEUE_SIZE: int = Field(
+        default=16,
+        ge=1,
+        description="Claims waiting for a worker before the scan pauses",
+    )
+    INGEST_WORKERS: int = Field(default=4, ge=1, description="Concurrent workflow runs")
+    INGEST_POLL_INTERVAL: float = Field(
+        default=2.0, gt=0, description="Seconds between inbox scans"
+    )
+
+    # ============================================================================
+    # Result Cache
+    # ============================================================================
+    CACHE_MODE: Literal["off", "read_write", "only"] = Field(
+        default="off",
+        description="'read_write' reuses and stores results, 'only' never calls providers",
+    )
+    CACHE_DIR: str = ".cache"
+
+    # ============================================================================
+    # Execution
+    # ============================================================================
+    CPU_WORKERS: int | None = Field(
+        default=None,
+        ge=0,
+        description="Process pool size for CPU-bound parse transforms (0 runs inline, unset uses all cores)",
+    )
+    CPU_INLINE_MAX_PAGES: int = Field(
+        default=50,
+        ge=0,
+        description="Parse results up to this many pages are built on the loop instead of the process pool",
+    )
 
 
 @lru_cache
@@ -0,0 +1,321 @@
+"""Run-scoped tracing exported as OTLP/JSON.
+
+Each workflow run is a trace. Spans nest through a context variable, so the
+steps, LlamaParse jobs and LLM calls started inside a run (in whatever task)
+become descendants of its root span. The run's trace ID is also the
+``task_id`` of its log lines, which correlates interleaved concurrent runs.
+
+When the root span ends, the whole trace is appended to ``TRACE_FILE`` as one
+OTLP/JSON ``ExportTraceServiceRequest`` per line (the format of the
+OpenTelemetry Collector file exporter) and, if ``TRACE_OTLP_ENDPOINT`` is set,
+posted to that OTLP/HTTP collector. Outside a traced run ``span`` is a no-op.
+
+    uv run python -m utils.tracing traces.jsonl   # Critical path of each trace
+"""
+
+import asyncio
+import functools
+import json
+import secrets
+import sys
+import threading
+import time
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, ParamSpec, TypeVar
+
+import httpx
+
+from utils.logging import get_logger, task_id_var
+from utils.settings import get_settings
+
+logger = get_logger(__name__)
+
+SERVICE_NAME = "contract-compliance"
+
+# OTLP status codes
+_STATUS_OK = 1
+_STATUS_ERROR = 2
+
+
+@dataclass
+class Span:
+    """A timed operation of a trace, with its attributes."""
+
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: str | None
+    attributes: dict[str, Any] = field(default_factory=dict)
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: int | None = None
+    error: str | None = None
+    # Every span of the trace, shared with the root so it can export them
+    trace: list["Span"] = field(default_factory=list, repr=False)
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def end(self, error: BaseException | None = None) -> None:
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+
+    @property
+    def duration_s(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def to_otlp(self) -> dict[str, Any]:
+        otlp = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in self.attributes.items()
+                if value is not None
+            ],
+            "status": (
+                {"code": _STATUS_ERROR, "message": self.error}
+                if self.error
+                else {"code": _STATUS_OK}
+            ),
+        }
+        if self.parent_id:
+            otlp["parentSpanId"] = self.parent_id
+        return otlp
+
+
+def _otlp_value(value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_otlp_value(v) for v in value]}}
+    return {"stringValue": str(value)}
+
+
+current_span_var: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span | None]:
+    """Time the block as a child of the current span, if a trace is active."""
+    parent = current_span_var.get()
+    if parent is None:
+        yield None
+        return
+
+    child = Span(
+        name=name,
+        trace_id=parent.trace_id,
+        span_id=secrets.token_hex(8),
+        parent_id=parent.span_id,
+        attributes=attributes,
+        trace=parent.trace,
+    )
+    parent.trace.append(child)
+    token = current_span_var.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.end(error=e)
+        raise
+    finally:
+        child.end()
+        current_span_var.reset(token)
+
+
+def traced(func: Callable[P, Awaitable[R]]) -> Callable[P, Awaitable[R]]:
+    """Run a workflow step inside a span named after it."""
+
+    @functools.wraps(func)
+    async def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+        with span(f"step.{func.__name__}"):
+            return await func(*args, **kwargs)
+
+    return wrapper
+
+
+@dataclass
+class RunTrace:
+    """Root span of a run and the context tokens to restore once it is launched."""
+
+    root: Span
+    tokens: list[tuple[ContextVar, Token]]
+
+    def detach(self) -> None:
+        """Restore the caller's context; tasks already created keep the trace."""
+        for var, token in reversed(self.tokens):
+            var.reset(token)
+
+
+def start_run(name: str, **attributes: Any) -> RunTrace:
+    """Open the root span of a run and make it current in this context.
+
+    The run's ID is set as the logging ``task_id`` even when tracing is off.
+    """
+    trace_id = secrets.token_hex(16)
+    root = Span(
+        name=name,
+        trace_id=trace_id,
+        span_id=secrets.token_hex(8),
+        parent_id=None,
+        attributes=attributes,
+    )
+    root.trace.append(root)
+    tokens = [(task_id_var, task_id_var.set(trace_id[:16]))]
+    if _exporter().enabled:
+        tokens.append((current_span_var, current_span_var.set(root)))
+    return RunTrace(root, tokens)
+
+
+def finish_run(run: RunTrace, error: BaseException | None = None) -> None:
+    """End the root span and export the run's trace."""
+    run.root.end(error=error)
+    exporter = _exporter()
+    if exporter.enabled:
+        exporter.export(run.root.trace)
+
+
+def critical_path(spans: list[Span]) -> list[tuple[int, Span]]:
+    """Spans that determined the trace's duration, with their nesting depth.
+
+    Among the children of a span, the path starts at the one that finished
+    last and walks back through the latest sibling that finished before it
+    started: the step it was waiting for. Each span on the path is expanded
+    the same way.
+    """
+    children: dict[str | None, list[Span]] = {}
+    for s in spans:
+        children.setdefault(s.parent_id, []).append(s)
+
+    def walk(node: Span, depth: int) -> list[tuple[int, Span]]:
+        kids = children.get(node.span_id, [])
+        chain = []
+        current = max(kids, key=lambda s: s.end_ns or 0, default=None)
+        while current is not None:
+            chain.append(current)
+            before = [k for k in kids if (k.end_ns or 0) <= current.start_ns]
+            current = max(before, key=lambda s: s.end_ns or 0, default=None)
+        path = [(depth, node)]
+        for child in reversed(chain):
+            path.extend(walk(child, depth + 1))
+        return path
+
+    roots = children.get(None)
+    return walk(roots[0], 0) if roots else []
+
+
+class _Exporter:
+    """Appends traces to a JSONL file and/or posts them to an OTLP collector."""
+
+    def __init__(self, path: str | None, endpoint: str | None):
+        self.path = path
+        self.endpoint = endpoint
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path or self.endpoint)
+
+    def export(self, spans: list[Span]) -> None:
+        payload = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": {"stringValue": SERVICE_NAME},
+                            }
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "compliance"},
+                            "spans": [s.to_otlp() for s in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+        data = json.dumps(payload, ensure_ascii=False)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write(data)
+        else:
+            # Keep file and network I/O off the event loop
+            loop.run_in_executor(None, self._write, data)
+
+    def _write(self, data: str) -> None:
+        try:
+            if self.path:
+                with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                    f.write(data + "\n")
+            if self.endpoint:
+                httpx.post(
+                    self.endpoint,
+                    content=data.encode(),
+                    headers={"Content-Type": "application/json"},
+                    timeout=5,
+                )
+        except (OSError, httpx.HTTPError) as e:
+            logger.warning("trace_export_failed | error=%s", str(e))
+
+
+@lru_cache
+def _exporter() -> _Exporter:
+    config = get_settings()
+    return _Exporter(config.TRACE_FILE, config.TRACE_OTLP_ENDPOINT)
+
+
+def _load_spans(path: str) -> dict[str, list[Span]]:
+    traces: dict[str, list[Span]] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            for resource in json.loads(line)["resourceSpans"]:
+                for scope in resource["scopeSpans"]:
+                    for s in scope["spans"]:
+                        traces.setdefault(s["traceId"], []).append(
+                            Span(
+                                name=s["name"],
+                                trace_id=s["traceId"],
+                                span_id=s["spanId"],
+                                parent_id=s.get("parentSpanId"),
+                                start_ns=int(s["startTimeUnixNano"]),
+                                end_ns=int(s["endTimeUnixNano"]),
+                            )
+                        )
+    return traces
+
+
+def main() -> None:
+    path = sys.argv[1] if len(sys.argv) > 1 else get_settings().TRACE_FILE
+    if not path:
+        sys.exit("usage: python -m utils.tracing <traces.jsonl>")
+    for trace_id, spans in _load_spans(path).items():
+        path_spans = critical_path(spans)
+        total = path_spans[0][1].duration_s if path_spans else 0.0
+        print(f"trace {trace_id}  {total:.3f}s")
+        for depth, s in path_spans:
+            print(f"  {'  ' * depth}{s.name:<{40 - 2 * depth}} {s.duration_s:8.3f}s")
+
+
+if __name__ == "__main__":
+    main()
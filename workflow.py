@@ -1,12 +1,19 @@
+import argparse
 import asyncio
+import contextlib
 import json
 
-from llama_index.core.workflow import Context, StartEvent, StopEvent, Workflow, step
+from workflows import Context, Workflow, step
+from workflows.events import StartEvent, StopEvent
+from workflows.handler import WorkflowHandler
 
 from events import (
     ExtractedPolizaEventCompleted,
     ReporteParsedEventCompleted,
+    ReportePreparedEvent,
     ReporteValidatedEvent,
+    SpeculativeRulesEvent,
+    SpeculativeValidationEvent,
     StartParseEvent,
     StartPolizaExtractionEvent,
 )
@@ -16,25 +23,136 @@ from models import (
     ParseResult,
     ReporteValidation,
 )
-from steps.document_parse import parse_document
-from steps.extract_rules import extract_poliza
-from steps.validate_reporte import validate_reporte
+from steps.document_parse import PAGE_MODES, parse_document, parse_document_routed
+from steps.extract_rules import extract_poliza, extraction_settings
+from steps.extract_rules.registry import (
+    cover_metadata,
+    get_policy_registry,
+    lineage_for,
+)
+from steps.validate_reporte import (
+    PreparedReporte,
+    prepare_reporte,
+    reconcile_speculation,
+    validate_reporte,
+)
+from utils.capture import captured, capturing, finish_capture
+from utils.executor import shutdown_process_pool
+from utils.llm import is_llm_error
 from utils.logging import get_logger
+from utils.metrics import track_usage
+from utils.profiling import (
+    finish_profile,
+    format_summary,
+    profiled,
+    profiling,
+    profiling_run,
+)
+from utils.rate_limit import claim_id_var
+from utils.settings import get_settings
+from utils.tracing import finish_run, start_run, traced
 
 logger = get_logger(__name__)
 
 
+async def record_step_metrics(ctx: Context, step_name: str, **metrics) -> None:
+    """Store metrics for a step; they are returned with the final result."""
+    logger.info(
+        "step_metrics | step=%s | %s",
+        step_name,
+        " | ".join(f"{k}={v}" for k, v in metrics.items()),
+    )
+    async with ctx.store.edit_state() as state:
+        state["step_metrics"] = {**state.get("step_metrics", {}), step_name: metrics}
+
+
 class Demo(Workflow):
+    def run(self, *args, **kwargs) -> WorkflowHandler:
+        """Run the workflow as one trace; every step inherits its root span and capture."""
+        run = start_run("claim", claim_id=claim_id_var.get())
+        try:
+            with (
+                capturing(run.root.trace_id) as capture,
+                profiling_run(run.root.trace_id) as profile,
+            ):
+                handler = super().run(*args, **kwargs)
+        finally:
+            run.detach()
+
+        # Ends the root span once the run stops, however it stops
+        def finished(task: asyncio.Future) -> None:
+            error = None if task.cancelled() else task.exception()
+            finish_run(run, error=error)
+            finish_capture(capture, error=error)
+            finish_profile(profile)
+
+        watcher = asyncio.ensure_future(handler.stop_event_result())
+        watcher.add_done_callback(finished)
+        return handler
+
     @step
-    async def start(self, ctx: Context, ev: StartEvent) -> StartParseEvent | None:
-        """Dispatch parse step."""
-        files: list[File] = ev.files
+    @traced
+    @captured
+    @profiled
+    async def start(
+        self, ctx: Context, ev: StartEvent
+    ) -> StartParseEvent | ExtractedPolizaEventCompleted | SpeculativeRulesEvent | None:
+        """Dispatch parse step, or take the rules of a registered poliza."""
+        files: list[File] = ev.get("files", [])
+        registry = get_policy_registry()
+
+        policy_id: str | None = ev.get("policy_id")
+        if policy_id:
+            record = registry.get(policy_id)
+            if record is None:
+                raise ValueError(f"Unknown policy_id: {policy_id}")
+            await self._use_policy(ctx, record.policy_id, record.rules)
+
         for file in files:
+            if file.is_poliza:
+                record = await registry.find_file(file.path, extraction_settings())
+                if record is not None:
+                    # Registered poliza: no parsing and no extraction
+                    await self._use_policy(ctx, record.policy_id, record.rules)
+                    continue
+                # A new version of a known poliza: validate with its latest rules meanwhile
+                lineage: str | None = ev.get("policy_lineage")
+                if lineage:
+                    await self._speculate(ctx, lineage)
             ctx.send_event(StartParseEvent(file=file))
 
         return None
 
+    async def _use_policy(
+        self, ctx: Context, policy_id: str, extracted_rules: ExtractedRules
+    ) -> None:
+        await ctx.store.set("policy_id", policy_id)
+        await ctx.store.set("extracted_rules", extracted_rules)
+        ctx.send_event(ExtractedPolizaEventCompleted(extracted_rules=extracted_rules))
+
+    async def _speculate(self, ctx: Context, lineage: str) -> None:
+        """Send the rules of the lineage's latest registered version, once per run."""
+        if not get_settings().SPECULATIVE_VALIDATION:
+            return
+        if await ctx.store.get("speculative_policy_id", default=None):
+            return
+        record = get_policy_registry().latest(lineage)
+        if record is None:
+            return
+        logger.info(
+            "speculation_started | lineage=%s | policy_id=%s", lineage, record.policy_id
+        )
+        await ctx.store.set("speculative_policy_id", record.policy_id)
+        ctx.send_event(
+            SpeculativeRulesEvent(
+                extracted_rules=record.rules, policy_id=record.policy_id
+            )
+        )
+
     @step
+    @traced
+    @captured
+    @profiled
     async def parse_step(
         self, ctx: Context, ev: StartParseEvent
     ) -> StartPolizaExtractionEvent | ReporteParsedEventCompleted:
@@ -42,17 +160,18 @@ class Demo(Workflow):
         file: File = ev.file
         logger.info("parse_started | file_path=%s", file.path)
 
-        parse_result: ParseResult = await parse_document(
-            [file],
-            verbose=True,
-            skip_diagonal_text=True,  # Helps ignore watermarks
-            merge_tables_across_pages_in_markdown=True,  # Better for table continuity
-            parse_mode="parse_page_with_agent",  # Agentic parsing for complex layouts
-            check_interval=3,
-            outlined_table_extraction=True,
-            high_res_ocr=True,
-            system_prompt_append="The document must start with a level 1 heading.",
-        )
+        options = {
+            "verbose": True,
+            "skip_diagonal_text": True,  # Helps ignore watermarks
+            "merge_tables_across_pages_in_markdown": True,  # Better for table continuity
+            "system_prompt_append": "The document must start with a level 1 heading.",
+        }
+        if get_settings().PARSE_PAGE_ROUTING:
+            parse_result: ParseResult = await parse_document_routed(file, **options)
+        else:
+            parse_result = await parse_document(
+                [file], **options, **PAGE_MODES["complex"]
+            )
         logger.info(
             "parse_completed | page_count=%s | table_count=%s",
             parse_result.page_count,
@@ -60,14 +179,17 @@ class Demo(Workflow):
         )
 
         if file.is_poliza:
-            return StartPolizaExtractionEvent(parse_result=parse_result)
+            return StartPolizaExtractionEvent(parse_result=parse_result, file=file)
         else:
             return ReporteParsedEventCompleted(parse_result=parse_result)
 
     @step
+    @traced
+    @captured
+    @profiled
     async def extract_poliza_step(
         self, ctx: Context, ev: StartPolizaExtractionEvent
-    ) -> ExtractedPolizaEventCompleted:
+    ) -> ExtractedPolizaEventCompleted | SpeculativeRulesEvent:
         """Extract poliza from parse result."""
         parse_result: ParseResult = ev.parse_result
         logger.info(
@@ -76,46 +198,150 @@ class Demo(Workflow):
             parse_result.table_count,
         )
 
-        extracted_rules: ExtractedRules = await extract_poliza(parse_result)
+        registry = get_policy_registry()
+        settings = extraction_settings()
+        record = registry.find_parse(parse_result, settings)
+        if record is None:
+            lineage = lineage_for(cover_metadata(parse_result))
+            if lineage:
+                await self._speculate(ctx, lineage)
+        with track_usage() as usage:
+            extracted_rules: ExtractedRules = (
+                record.rules if record else await extract_poliza(parse_result)
+            )
+        record = await registry.register(
+            parse_result,
+            extracted_rules,
+            settings,
+            file_path=ev.file.path if ev.file else None,
+        )
+        await ctx.store.set("policy_id", record.policy_id)
         await ctx.store.set("extracted_rules", extracted_rules)
-        logger.info("extract_poliza_completed | extracted_rules=%s", extracted_rules)
+        await record_step_metrics(ctx, "extract_poliza", **usage.to_dict())
+        logger.info(
+            "extract_poliza_completed | policy_id=%s | reglas=%s | deducible=%s",
+            record.policy_id,
+            len(extracted_rules.reglas_clave),
+            extracted_rules.deducible,
+        )
+        logger.debug("extracted_rules | %s", extracted_rules)
 
         return ExtractedPolizaEventCompleted(extracted_rules=extracted_rules)
 
     @step
+    @traced
+    @captured
+    @profiled
+    async def prepare_reporte_step(
+        self, ctx: Context, ev: ReporteParsedEventCompleted
+    ) -> ReportePreparedEvent:
+        """Read the reporte's factura while the poliza is still being extracted."""
+        reporte: PreparedReporte = prepare_reporte(ev.parse_result)
+        logger.info(
+            "prepare_reporte_completed | lines=%s | amounts=%s | chars=%s",
+            len(reporte.lines),
+            len(reporte.amounts),
+            len(reporte.factura_text),
+        )
+        return ReportePreparedEvent(reporte=reporte)
+
+    @step
+    @traced
+    @captured
+    @profiled
+    async def speculate_step(
+        self, ctx: Context, ev: ReportePreparedEvent | SpeculativeRulesEvent
+    ) -> SpeculativeValidationEvent | None:
+        """Validate the reporte with the previous poliza version's rules."""
+        events = ctx.collect_events(ev, [ReportePreparedEvent, SpeculativeRulesEvent])
+        if events is None:
+            return None
+
+        reporte_ev = next(e for e in events if isinstance(e, ReportePreparedEvent))
+        rules_ev = next(e for e in events if isinstance(e, SpeculativeRulesEvent))
+
+        # The extracted rules arrived first: speculating would only add a call
+        if await ctx.store.get("extracted_rules", default=None) is not None:
+            logger.info("speculation_skipped | policy_id=%s", rules_ev.policy_id)
+            return SpeculativeValidationEvent()
+
+        try:
+            with track_usage() as usage:
+                validated_reporte = await validate_reporte(
+                    reporte_ev.reporte, rules_ev.extracted_rules
+                )
+        except Exception as e:
+            if not is_llm_error(e):
+                raise
+            # The extracted rules are still coming: validate with them instead
+            logger.warning(
+                "speculation_failed | policy_id=%s | error=%s", rules_ev.policy_id, e
+            )
+            return SpeculativeValidationEvent()
+        await record_step_metrics(ctx, "speculative_validation", **usage.to_dict())
+        return SpeculativeValidationEvent(
+            validated_reporte=validated_reporte,
+            extracted_rules=rules_ev.extracted_rules,
+        )
+
+    @step
+    @traced
+    @captured
+    @profiled
     async def validate_reporte_step(
         self,
         ctx: Context,
-        ev: ReporteParsedEventCompleted | ExtractedPolizaEventCompleted,
+        ev: ReportePreparedEvent
+        | ExtractedPolizaEventCompleted
+        | SpeculativeValidationEvent,
     ) -> ReporteValidatedEvent:
-        """Validate reporte from parse result."""
-        events = ctx.collect_events(
-            ev, [ReporteParsedEventCompleted, ExtractedPolizaEventCompleted]
-        )
+        """Validate the prepared reporte against the extracted rules."""
+        expected = [ReportePreparedEvent, ExtractedPolizaEventCompleted]
+        # Set before the extracted rules are sent, so it is known once they arrive
+        if await ctx.store.get("speculative_policy_id", default=None):
+            expected.append(SpeculativeValidationEvent)
+        events = ctx.collect_events(ev, expected)
         if events is None:
             return None
 
-        reporte_ev = next(
-            e for e in events if isinstance(e, ReporteParsedEventCompleted)
-        )
+        reporte_ev = next(e for e in events if isinstance(e, ReportePreparedEvent))
         rules_ev = next(
             e for e in events if isinstance(e, ExtractedPolizaEventCompleted)
         )
+        speculative_ev = next(
+            (e for e in events if isinstance(e, SpeculativeValidationEvent)), None
+        )
 
-        parse_result = reporte_ev.parse_result
         extracted_rules = rules_ev.extracted_rules
 
-        validated_reporte: ReporteValidation = await validate_reporte(
-            parse_result, extracted_rules
-        )
+        with track_usage() as usage:
+            if speculative_ev and speculative_ev.validated_reporte:
+                validated_reporte: ReporteValidation = await reconcile_speculation(
+                    reporte_ev.reporte,
+                    speculative_ev.validated_reporte,
+                    speculative_ev.extracted_rules,
+                    extracted_rules,
+                )
+            else:
+                validated_reporte = await validate_reporte(
+                    reporte_ev.reporte, extracted_rules
+                )
         await ctx.store.set("validated_reporte", validated_reporte)
+        await record_step_metrics(ctx, "validate_reporte", **usage.to_dict())
         logger.info(
-            "validate_reporte_completed | validated_reporte=%s", validated_reporte
+            "validate_reporte_completed | items=%s | total_aprobado=%s | inconsistencias=%s",
+            len(validated_reporte.items),
+            validated_reporte.total_aprobado,
+            len(validated_reporte.inconsistencias),
         )
+        logger.debug("validated_reporte | %s", validated_reporte)
 
         return ReporteValidatedEvent(validated_reporte=validated_reporte)
 
     @step
+    @traced
+    @captured
+    @profiled
     async def end_step(self, ctx: Context, ev: ReporteValidatedEvent) -> StopEvent:
         """End workflow."""
         validated_reporte = await ctx.store.get("validated_reporte")
@@ -128,13 +354,16 @@ class Demo(Workflow):
             "extracted_rules": extracted_rules.model_dump()
             if extracted_rules
             else None,
+            "policy_id": await ctx.store.get("policy_id", default=None),
+            "metrics": await ctx.store.get("step_metrics", default={}),
         }
-        logger.info("end_step | reporte_final=%s", reporte_final)
+        logger.info("end_step | policy_id=%s", reporte_final["policy_id"])
+        logger.debug("reporte_final | %s", reporte_final)
 
         return StopEvent(result=reporte_final)
 
 
-async def main():
+async def main(profile: bool = False):
     workflow = Demo()
     poliza_file = File(
         path="data/Poliza.pdf",
@@ -146,11 +375,23 @@ async def main():
         name="reporte.pdf",
         is_poliza=False,
     )
-    reporte_final = await workflow.run(files=[poliza_file, reporte_file])
+    try:
+        async with profiling() if profile else contextlib.nullcontext() as session:
+            reporte_final = await workflow.run(files=[poliza_file, reporte_file])
+    finally:
+        shutdown_process_pool()
+    if session is not None:
+        for run in session.runs:
+            print(format_summary(run.summary()))
+            print(f"Flamegraph stacks written to {run.directory}")
     with open("reporte_final.json", "w") as f:
         json.dump(reporte_final, f, indent=2, default=str)
     print("Workflow completed. Result saved to reporte_final.json")
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Run the Demo workflow on data/")
+    parser.add_argument(
+        "--profile", action="store_true", help="Profile each step (see utils.profiling)"
+    )
+    asyncio.run(main(profile=parser.parse_args().profile))